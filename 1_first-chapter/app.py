@@ -2,11 +2,34 @@ import streamlit as st
 import pandas as pd
 from io import BytesIO
 import os
+import sys
 from xlsxwriter import Workbook
 import re 
+import excel_reader
+import frame_optimizer
+import near_duplicates
+import sampler
+
+# Rerun profiler shared by the apps (set APP_PROFILE=1 to turn it on)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import rerun_profiler
+import job_queue
+import sweeper_jobs
+
+profile = rerun_profiler.start("Data Sweeper")
+
+# Whole files are read and exported in the background, the page shows their progress meanwhile
+@st.cache_resource
+def get_jobs():
+    return job_queue.JobQueue(os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3"))
+
+jobs = get_jobs()
 
 buffer = BytesIO()
 
+# Files bigger than this open on a random sample by default
+SAMPLE_MODE_SIZE = 50 * 1024 * 1024
+
 st.set_page_config(page_title="Data Sweeper & Visualization",layout="wide", page_icon="🧹")
 st.title("Data Sweeper & Visualization")
 st.write("This is a simple tool to help you clean and visualize your data. You can upload a CSV file and perform various operations on it. You can also visualize the data using different types of plots.")
@@ -16,37 +39,173 @@ file = st.file_uploader("Upload a CSV or Excel file", type=['csv', 'xlsx'], acce
 if file:
     file_extension = os.path.splitext(file.name)[-1].lower()
     
+    # The upload's bytes, taken once and handed to the read jobs as they are
+    # (the page itself only needs file.size)
+    file_bytes = file.getvalue()
+    
+    # Big files can be explored on a random sample first, the whole file is only cleaned on export
+    sample_mode = st.checkbox("Quick preview on a random sample", value=file.size > SAMPLE_MODE_SIZE,
+                              help=f"Preview, cleaning and charts use {sampler.SAMPLE_ROWS:,} random rows. "
+                                   "The whole file is read and cleaned when you convert it.")
+    
     if file_extension == '.csv':
-        df = pd.read_csv(file)
+        read_key = (file.file_id,)
+        def read_full():
+            return jobs.submit("read CSV", sweeper_jobs.read_csv, file_bytes, cache_key=repr(read_key))
+        def read_sample():
+            return sampler.sample_csv(file)
     elif file_extension == '.xlsx':
-        df = pd.read_excel(file)
+        # Sheet and column names come from the workbook index and header rows, no data is parsed yet
+        sheets = excel_reader.sheet_names(file)
+        selected_sheets = st.multiselect("Select sheets to read", sheets, default=sheets[:1])
+        if not selected_sheets:
+            st.info("Select at least one sheet to read.")
+            st.stop()
+        
+        sheet_columns = []
+        for sheet in selected_sheets:
+            sheet_columns += [c for c in excel_reader.sheet_columns(file, sheet) if c not in sheet_columns]
+        read_columns = st.multiselect("Select columns to read", sheet_columns, default=sheet_columns)
+        
+        read_key = (file.file_id, tuple(selected_sheets), tuple(read_columns))
+        def read_full():
+            # Parsing the sheet XML is pure Python, a worker process keeps the page responsive
+            return jobs.submit("read Excel", sweeper_jobs.read_excel, file_bytes, selected_sheets,
+                               read_columns, cache_key=repr(read_key), process=True)
+        def read_sample():
+            chunks = (chunk for sheet in selected_sheets
+                      for chunk in excel_reader.iter_excel_chunks(file, sheet, read_columns))
+            return sampler.sample_frames(chunks, bytes_total=file.size)
     else:
         st.write("Please upload a CSV or Excel file")
         st.stop()
     
+    # Show how a job ended if it didn't work out, with a button to run it again, and stop the page
+    def job_failed(job, what, state_key):
+        st.error(f"{what} {'was cancelled' if job['status'] == 'cancelled' else 'failed'}"
+                 f"{': ' + job['error'] if job['error'] else '.'}")
+        if st.button("Try again"):
+            del st.session_state[state_key]
+            st.rerun()
+        st.stop()
+    
+    # Only read the file again when the file or what to read from it changes, not on every rerun
+    # While it's being read the page shows the progress and stops there
+    def load_full():
+        if st.session_state.get("full_key") != read_key:
+            if st.session_state.get("full_job", (None,))[0] != read_key:
+                # A read of another file (or other sheets) isn't needed any more
+                if "full_job" in st.session_state:
+                    jobs.cancel(st.session_state.full_job[1])
+                st.session_state.full_job = (read_key, read_full())
+            job_id = st.session_state.full_job[1]
+            job = job_queue.show_progress(jobs, job_id, f"Reading {file.name}")
+            if job is None:
+                st.stop()
+            try:
+                st.session_state.full_df = jobs.result(job_id)
+            except job_queue.JobFailed:
+                job_failed(job, f"Reading {file.name}", "full_job")
+            profile.count("rows read", len(st.session_state.full_df))
+            st.session_state.full_key = read_key
+        return st.session_state.full_df
+    
+    if sample_mode:
+        if st.session_state.get("sample_key") != read_key:
+            with profile.stage("sample file"):
+                st.session_state.sample = read_sample()
+            st.session_state.sample_key = read_key
+        df, sample_stats = st.session_state.sample
+        covered = "the whole file" if sample_stats["complete"] else (
+            f"the first {sample_stats['bytes_read'] / sample_stats['bytes_total']:.0%} of the file"
+            if sample_stats["bytes_read"] else "the start of the file")
+        st.info(f"Showing {len(df):,} random rows out of {sample_stats['rows_seen']:,} rows in {covered} "
+                f"(sampled in {sample_stats['seconds']:.1f} s). The whole file is cleaned when you convert it.")
+    else:
+        df = load_full()
     
-    file_size_in_kb = len(file.getvalue()) / 1024
+    
+    file_size_in_kb = file.size / 1024
     st.write(f"**File Name**: {file.name}")
     st.write(f"**File size**: {file_size_in_kb:.2f} KB")
     
+    # Smaller number types and categories for repeated text, cleaning and export then work on the smaller frame
+    optimize_memory = st.checkbox("Optimize memory use", value=True)
+    if optimize_memory:
+        optimize_key = (read_key, sample_mode)
+        if st.session_state.get("optimized_key") != optimize_key:
+            with profile.stage("optimize memory"):
+                st.session_state.optimized = (frame_optimizer.memory_usage(df),) + frame_optimizer.optimize_frame(df)
+            st.session_state.optimized_key = optimize_key
+        memory_before, df, report = st.session_state.optimized
+        memory_after = frame_optimizer.memory_usage(df)
+        st.write(f"**Memory**: {memory_before / 1024 ** 2:.1f} MB → {memory_after / 1024 ** 2:.1f} MB "
+                 f"({1 - memory_after / max(memory_before, 1):.0%} smaller)")
+        if report:
+            with st.expander("Optimized columns"):
+                st.dataframe(pd.DataFrame(report))
+    
     
     
     st.subheader("View Data")
     st.write(df.head())
     
     st.subheader("Data Cleaning")
+    
+    # In sample mode the cleaning steps are remembered, so they can be run on the whole file on export
+    if st.session_state.get("steps_key") != read_key:
+        st.session_state.sample_steps = []
+        st.session_state.steps_key = read_key
+    sample_steps = st.session_state.sample_steps if sample_mode else []
+    if sample_steps:
+        with profile.stage("replay cleaning steps"):
+            for step in sample_steps:
+                df = getattr(df, step)()
+        st.write(f"**Steps to run on the whole file**: {', '.join(sample_steps)}")
+    
     col1, col2 = st.columns(2)
     
     with col1:
         if st.button(f"Remove duplicates from {file.name} "):
-            df = df.drop_duplicates()
+            with profile.stage("remove duplicates"):
+                df = df.drop_duplicates()
+            if sample_mode and "drop_duplicates" not in sample_steps:
+                sample_steps.append("drop_duplicates")
             st.success("Duplicates removed successfully")
         
     with col2:
         if st.button(f"Remove Null values from {file.name}"):
-            df = df.dropna()
+            with profile.stage("remove nulls"):
+                df = df.dropna()
+            if sample_mode and "dropna" not in sample_steps:
+                sample_steps.append("dropna")
             st.success("Null values removed successfully")
     
+    # Rows that only differ by case, spacing or a typo (MinHash + LSH, so it stays fast on big files)
+    near_settings = None
+    if st.checkbox(f"Remove near-duplicate rows from {file.name}"):
+        text_columns = [c for c in df.columns if c not in df.select_dtypes(include='number').columns]
+        near_columns = st.multiselect("Compare these columns", df.columns, default=text_columns)
+        threshold = st.slider("Similarity threshold", 0.5, 1.0, 0.8, 0.05,
+                              help="Lower finds more near-duplicates but also merges rows that are only alike")
+        
+        near_settings = (near_columns, threshold)
+        near_key = (read_key, sample_mode, tuple(near_columns), threshold, len(df))
+        if st.session_state.get("near_key") != near_key:
+            with st.spinner("Looking for near-duplicates..."), profile.stage("near-duplicates"):
+                st.session_state.near_result = near_duplicates.drop_near_duplicates(df, near_columns, threshold)
+            st.session_state.near_key = near_key
+        df, near_stats = st.session_state.near_result
+        
+        st.success(f"Removed {near_stats['removed']} near-duplicate rows")
+        if near_stats['removed'] or near_stats.get('candidate_pairs'):
+            st.write(f"{near_stats['bands']} bands of {near_stats['rows_per_band']} hashes, "
+                     f"{near_stats['candidate_pairs']:,} candidate pairs, "
+                     f"{near_stats['candidate_precision']:.0%} of them above the threshold, "
+                     f"{near_stats['rows_per_second']:,.0f} rows/s. "
+                     f"Expected misses: {near_stats['false_negative_area']:.3f}, "
+                     f"expected false candidates: {near_stats['false_positive_area']:.3f}")
+    
     
     
     st.subheader("Select columns to keep") 
@@ -80,23 +239,53 @@ if file:
     # File Conversion
     st.subheader("File Conversion")
     selected_type = st.radio("Select file type to convert", ['CSV', 'Excel'], key=file.name)
+    # The request is remembered, reading the whole file and writing the export take a few reruns
     if st.button(f"Convert your {file_extension} file to {selected_type}"):
-        buffer = BytesIO()
-        if selected_type == "CSV":
-            df.to_csv(buffer, index=False)
-            file_name = file.name.replace(file_extension, ".csv")
-            mine_type = "text/csv"
-        else:
-            with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-                df.to_excel(writer, index=False)
-            file_name = file.name.replace(file_extension, ".xlsx")
-            mine_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        st.session_state.convert_request = (read_key, selected_type, st.session_state.get("convert_count", 0))
+        st.session_state.convert_count = st.session_state.get("convert_count", 0) + 1
+    
+    request = st.session_state.get("convert_request")
+    if request and request[:2] == (read_key, selected_type):
+        if st.session_state.get("export_job", (None,))[0] != request:
+            if sample_mode:
+                # Run everything done on the sample on the whole file
+                df = load_full()
+                with st.spinner("Cleaning the whole file..."), profile.stage("clean whole file"):
+                    if optimize_memory:
+                        df = frame_optimizer.optimize_frame(df)[0]
+                    for step in sample_steps:
+                        df = getattr(df, step)()
+                    if near_settings:
+                        df = near_duplicates.drop_near_duplicates(df, *near_settings)[0]
+                    if selected_columns:
+                        df = df[selected_columns]
+            
+            if selected_type == "CSV":
+                job_id = jobs.submit("export CSV", sweeper_jobs.export_csv, df)
+            else:
+                job_id = jobs.submit("export Excel", sweeper_jobs.export_excel, df, process=True)
+            st.session_state.export_job = (request, job_id)
         
-        buffer.seek(0)
-    
-        st.download_button(
-            label="Download the cleaned file of {} as {}".format(file.name, selected_type),
-            data=buffer,
-            file_name=file_name,
-            mime=mine_type,
-        )
\ No newline at end of file
+        job_id = st.session_state.export_job[1]
+        job = job_queue.show_progress(jobs, job_id, f"Writing the {selected_type} file")
+        if job is not None:
+            try:
+                data = jobs.result(job_id)
+            except job_queue.JobFailed:
+                job_failed(job, f"Writing the {selected_type} file", "export_job")
+            
+            if selected_type == "CSV":
+                file_name = file.name.replace(file_extension, ".csv")
+                mine_type = "text/csv"
+            else:
+                file_name = file.name.replace(file_extension, ".xlsx")
+                mine_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        
+            st.download_button(
+                label="Download the cleaned file of {} as {}".format(file.name, selected_type),
+                data=data,
+                file_name=file_name,
+                mime=mine_type,
+            )
+
+profile.panel()
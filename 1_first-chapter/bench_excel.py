@@ -0,0 +1,70 @@
+import argparse
+import datetime
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+import xlsxwriter
+
+import excel_reader
+
+COLUMNS = ["id", "region", "status", "amount", "qty", "date", "name", "email", "note", "flag"]
+
+
+# Write a workbook with `sheets` sheets of `rows` order-like rows each
+def make_workbook(path, rows, sheets):
+    random.seed(1)
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True})
+    date_format = workbook.add_format({"num_format": "yyyy-mm-dd"})
+    for sheet_number in range(sheets):
+        sheet = workbook.add_worksheet(f"Sheet{sheet_number + 1}")
+        sheet.write_row(0, 0, COLUMNS)
+        for r in range(1, rows + 1):
+            sheet.write_number(r, 0, r)
+            sheet.write_string(r, 1, random.choice(["north", "south", "east", "west"]))
+            sheet.write_string(r, 2, random.choice(["open", "closed", "pending"]))
+            sheet.write_number(r, 3, round(random.random() * 1000, 2))
+            sheet.write_number(r, 4, random.randint(1, 50))
+            sheet.write_datetime(r, 5, datetime.datetime(2024, 1, 1) + datetime.timedelta(days=r % 365), date_format)
+            sheet.write_string(r, 6, f"Customer {random.randint(1, rows)}")
+            sheet.write_string(r, 7, f"user{r}@example.com")
+            if r % 3:
+                sheet.write_string(r, 8, "Call back next week")
+            sheet.write_boolean(r, 9, r % 2 == 0)
+    workbook.close()
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+# Compare pd.read_excel (what the app used to do) with the streaming reader
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure Excel reading time in the Data Sweeper")
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--sheets", type=int, default=2)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.xlsx")
+    seconds, _ = timed(lambda: make_workbook(path, args.rows, args.sheets))
+    print(f"Made {args.sheets} sheets x {args.rows} rows ({os.path.getsize(path) / 1e6:.1f} MB) in {seconds:.1f} s")
+    print(f"Reader: {'calamine' if excel_reader.python_calamine else 'streaming expat'}\n")
+
+    results = [
+        ("pd.read_excel, first sheet", lambda: pd.read_excel(path)),
+        ("list sheets", lambda: excel_reader.sheet_names(path)),
+        ("list columns", lambda: excel_reader.sheet_columns(path, "Sheet1")),
+        ("first chunk", lambda: next(excel_reader.iter_excel_chunks(path, "Sheet1"))),
+        ("one sheet, all columns", lambda: excel_reader.read_excel(path, ["Sheet1"])),
+        ("one sheet, 3 columns", lambda: excel_reader.read_excel(path, ["Sheet1"], ["region", "amount", "date"])),
+    ]
+    baseline = None
+    for name, function in results:
+        seconds, result = timed(function)
+        baseline = baseline or seconds
+        shape = f"{result.shape}" if isinstance(result, pd.DataFrame) else ""
+        print(f"{name:<28}{seconds:>9.3f} s{baseline / seconds:>9.1f}x  {shape}")
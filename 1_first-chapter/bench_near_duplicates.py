@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from near_duplicates import drop_near_duplicates
+
+FIRST = ["james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "david", "sarah",
+         "ahmed", "fatima", "hassan", "ayesha", "li", "wei", "maria", "jose", "anna", "olga"]
+LAST = ["smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "khan", "ali",
+        "wang", "zhang", "silva", "santos", "ivanov", "mueller", "martin", "rossi", "kim", "nguyen"]
+CITIES = ["karachi", "lahore", "new york", "london", "berlin", "toronto", "dubai", "sydney"]
+
+
+# A small random edit: case, spacing, a dropped, swapped or changed letter
+def typo(text):
+    change = random.choice(["case", "space", "drop", "swap", "change"])
+    if change == "case":
+        return text.upper() if random.random() < 0.5 else text.title()
+    if change == "space":
+        return "  ".join(text.split(" "))
+    i = random.randrange(len(text) - 1)
+    if change == "drop":
+        return text[:i] + text[i + 1:]
+    if change == "swap":
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + random.choice(string.ascii_lowercase) + text[i + 1:]
+
+
+# CRM-like rows where `duplicate_share` of them are edited copies of another row
+#
+# Returns the frame and the id of the original customer behind each row.
+def make_customers(rows, duplicate_share):
+    random.seed(1)
+    originals = int(rows * (1 - duplicate_share))
+    records = []
+    for i in range(originals):
+        first, last = random.choice(FIRST), random.choice(LAST)
+        records.append((f"{first} {last}", f"{first}.{last}{i}@example.com",
+                        f"{random.randint(1, 999)} {random.choice(LAST)} street {random.choice(CITIES)}"))
+    truth = list(range(originals))
+    for _ in range(rows - originals):
+        original = random.randrange(originals)
+        name, email, address = records[original]
+        records.append((typo(name), email, typo(address)))
+        truth.append(original)
+    return pd.DataFrame(records, columns=["name", "email", "address"]), np.array(truth)
+
+
+# Precision and recall of the removed rows against the known duplicates
+def score(kept_index, truth):
+    removed = np.setdiff1d(np.arange(len(truth)), kept_index)
+    true_duplicates = set(np.flatnonzero(np.arange(len(truth)) != truth))
+    correct = len(true_duplicates.intersection(removed))
+    precision = correct / len(removed) if len(removed) else 1.0
+    recall = correct / len(true_duplicates) if true_duplicates else 1.0
+    return precision, recall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure near-duplicate detection quality and speed")
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--duplicates", type=float, default=0.2)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.5, 0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    df, truth = make_customers(args.rows, args.duplicates)
+    print(f"{args.rows} rows, {args.duplicates:.0%} near-duplicates, {args.workers} workers\n")
+    print(f"{'threshold':>9}{'bands x rows':>14}{'removed':>9}{'precision':>10}{'recall':>8}"
+          f"{'candidates':>12}{'rows/s':>10}")
+    for threshold in args.thresholds:
+        start = time.perf_counter()
+        kept, stats = drop_near_duplicates(df, ["name", "email", "address"], threshold, workers=args.workers)
+        seconds = time.perf_counter() - start
+        precision, recall = score(kept.index.to_numpy(), truth)
+        print(f"{threshold:>9.2f}{stats['bands']:>8} x {stats['rows_per_band']:<3}{stats['removed']:>9}"
+              f"{precision:>10.3f}{recall:>8.3f}{stats['candidate_pairs']:>12}{args.rows / seconds:>10.0f}")
@@ -0,0 +1,315 @@
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+import zipfile
+from xml.parsers import expat
+
+import pandas as pd
+
+# calamine (Rust) is used when it's installed, it reads whole sheets much faster than Python can
+try:
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+# Rows per DataFrame chunk when streaming a sheet
+CHUNK_ROWS = 50000
+
+# Built-in Excel number formats that are dates or times
+DATE_FORMAT_IDS = set(range(14, 23)) | {45, 46, 47}
+
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+PACKAGE_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+# Open an uploaded file (or a path) as a zip archive from the start
+def open_archive(file):
+    if hasattr(file, "seek"):
+        file.seek(0)
+    return zipfile.ZipFile(file)
+
+
+# Sheet names and the path of each sheet's XML inside the archive, without parsing any cells
+def list_sheets(archive):
+    workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+    rels = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{PACKAGE_REL_NS}Relationship")}
+
+    sheets = {}
+    for sheet in workbook.iter(f"{MAIN_NS}sheet"):
+        target = targets[sheet.get(f"{REL_NS}id")]
+        # Targets are relative to xl/ unless they start with /
+        sheets[sheet.get("name")] = target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+    return sheets
+
+
+# Names of the sheets in an .xlsx file
+def sheet_names(file):
+    with open_archive(file) as archive:
+        return list(list_sheets(archive))
+
+
+# True if the workbook counts dates from 1904 (old Mac Excel files)
+def uses_1904_dates(archive):
+    properties = ET.fromstring(archive.read("xl/workbook.xml")).find(f"{MAIN_NS}workbookPr")
+    return properties is not None and properties.get("date1904") in ("1", "true")
+
+
+# Shared strings table (most text cells only store an index into it)
+def read_shared_strings(archive):
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+
+    strings = []
+    parts = []
+    state = {"in_text": False, "skip": 0}
+
+    def start(name, attrs):
+        if name == "si":
+            parts.clear()
+        elif name == "t" and not state["skip"]:
+            state["in_text"] = True
+        elif name == "rPh":
+            # Phonetic hints for East Asian text aren't part of the value
+            state["skip"] += 1
+
+    def end(name):
+        if name == "si":
+            strings.append("".join(parts))
+        elif name == "t":
+            state["in_text"] = False
+        elif name == "rPh":
+            state["skip"] -= 1
+
+    def text(data):
+        if state["in_text"]:
+            parts.append(data)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
+    parser.buffer_text = True
+    with archive.open("xl/sharedStrings.xml") as f:
+        parser.ParseFile(f)
+    return strings
+
+
+# Positions of the cell styles that show numbers as dates
+def read_date_styles(archive):
+    if "xl/styles.xml" not in archive.namelist():
+        return set()
+    styles = ET.fromstring(archive.read("xl/styles.xml"))
+
+    date_formats = set(DATE_FORMAT_IDS)
+    for number_format in styles.iter(f"{MAIN_NS}numFmt"):
+        # Drop quoted text and [colors] before looking for date parts like yyyy or hh
+        code = re.sub(r'"[^"]*"|\[[^\]]*\]', "", number_format.get("formatCode", "").lower())
+        if re.search(r"[dmyhs]", code):
+            date_formats.add(int(number_format.get("numFmtId")))
+
+    cell_formats = styles.find(f"{MAIN_NS}cellXfs")
+    if cell_formats is None:
+        return set()
+    return {position for position, xf in enumerate(cell_formats.iter(f"{MAIN_NS}xf"))
+            if int(xf.get("numFmtId", 0)) in date_formats}
+
+
+# Column letters of a cell reference ("BC12") as a 0-based index
+def column_index(reference, cache={}):
+    letters = reference.rstrip("0123456789")
+    index = cache.get(letters)
+    if index is None:
+        index = 0
+        for char in letters:
+            index = index * 26 + ord(char) - 64
+        index = cache[letters] = index - 1
+    return index
+
+
+# Rows of a sheet as lists of cell values, streamed straight from the sheet XML
+#
+# Only cells in `wanted` column positions (all if None) are converted. Dates
+# are stored as numbers with a date style, their column positions are added
+# to date_columns so whole columns can be converted at once.
+def iter_sheet_rows(archive, sheet_path, shared_strings, date_styles, wanted=None, date_columns=None):
+    rows = []
+    row = None
+    column = -1
+    cell_type = style = None
+    value = []
+    in_value = False
+
+    # expat calls these for every tag, so they only use local variables
+    def start(name, attrs):
+        nonlocal row, column, cell_type, style, value, in_value
+        if name == "c":
+            reference = attrs.get("r")
+            column = column_index(reference) if reference else column + 1
+            cell_type = attrs.get("t", "n")
+            style = attrs.get("s")
+            value = []
+        elif name == "v" or (name == "t" and cell_type == "inlineStr"):
+            in_value = True
+        elif name == "row":
+            row = []
+            column = -1
+
+    def end(name):
+        nonlocal in_value
+        if name == "c":
+            if wanted is not None and column not in wanted:
+                return
+            raw = "".join(value)
+            if not raw and cell_type != "inlineStr":
+                return
+            if cell_type == "s":
+                cell = shared_strings[int(raw)]
+            elif cell_type == "n":
+                cell = float(raw) if ("." in raw or "E" in raw or "e" in raw) else int(raw)
+                if date_columns is not None and style is not None and int(style) in date_styles:
+                    date_columns.add(column)
+            elif cell_type == "b":
+                cell = raw == "1"
+            elif cell_type == "e":
+                return
+            else:
+                cell = raw
+            if len(row) <= column:
+                row.extend([None] * (column + 1 - len(row)))
+            row[column] = cell
+        elif name == "v" or name == "t":
+            in_value = False
+        elif name == "row":
+            rows.append(row)
+
+    def text(data):
+        if in_value:
+            value.append(data)
+
+    parser = expat.ParserCreate()
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = text
+    parser.buffer_text = True
+
+    with archive.open(sheet_path) as f:
+        while True:
+            data = f.read(1 << 20)
+            parser.Parse(data, not data)
+            if rows:
+                yield from rows
+                rows.clear()
+            if not data:
+                break
+
+
+# Column names from a header row, named the way pd.read_excel names them
+def header_names(header):
+    names = []
+    seen = {}
+    for position, name in enumerate(header):
+        name = f"Unnamed: {position}" if name is None else str(name)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+# Give columns the dtypes pd.read_excel gives them
+#
+# Blank cells are None, which leaves columns of numbers or bools as object
+# columns that charts (select_dtypes) and downcasting skip. Bools with blanks
+# become 1.0 / 0.0 / NaN like they do in pd.read_excel.
+def infer_dtypes(frame):
+    frame = frame.infer_objects()
+    for name in frame.columns[frame.dtypes == object]:
+        values = frame[name].dropna()
+        if 0 < len(values) < len(frame) and all(map(pd.api.types.is_bool, values)):
+            frame[name] = frame[name].astype(float)
+    return frame
+
+
+# Turn a list of rows into a DataFrame, converting date serials column by column
+def make_frame(rows, columns, positions, date_columns, date_origin):
+    frame = pd.DataFrame([[row[p] if p < len(row) else None for p in positions] for row in rows], columns=columns)
+    for name, position in zip(columns, positions):
+        if position in date_columns:
+            serials = pd.to_numeric(frame[name], errors="coerce")
+            frame[name] = pd.to_datetime(serials, unit="D", origin=date_origin).dt.round("ms")
+    return infer_dtypes(frame)
+
+
+# Column names of a sheet (reads only the first row)
+def sheet_columns(file, sheet):
+    with open_archive(file) as archive:
+        sheets = list_sheets(archive)
+        rows = iter_sheet_rows(archive, sheets[sheet], read_shared_strings(archive), set())
+        return header_names(next(rows, []))
+
+
+# Stream one sheet as DataFrames of up to chunk_rows rows
+#
+# The first row is the header. If columns is given (and not empty) only those
+# columns are converted and returned (in the order they are in the sheet).
+def iter_excel_chunks(file, sheet, columns=None, chunk_rows=CHUNK_ROWS):
+    with open_archive(file) as archive:
+        sheets = list_sheets(archive)
+        date_origin = "1904-01-01" if uses_1904_dates(archive) else "1899-12-30"
+        shared_strings = read_shared_strings(archive)
+
+        date_styles = read_date_styles(archive)
+
+        rows = iter_sheet_rows(archive, sheets[sheet], shared_strings, date_styles)
+        names = header_names(next(rows, []))
+        rows.close()
+        positions = [p for p, name in enumerate(names) if not columns or name in columns]
+        names = [names[p] for p in positions]
+
+        # Read again converting only the cells we keep (the header is in the first few KB)
+        date_columns = set()
+        rows = iter_sheet_rows(archive, sheets[sheet], shared_strings, date_styles, set(positions), date_columns)
+        next(rows, None)
+
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield make_frame(chunk, names, positions, date_columns, date_origin)
+                chunk = []
+        if chunk or not names:
+            yield make_frame(chunk, names, positions, date_columns, date_origin)
+
+
+# Read the chosen sheets (and columns) of an .xlsx file into one DataFrame
+#
+# Sheets are stacked on top of each other. on_progress(sheet, rows read) is
+# called after every chunk.
+def read_excel(file, sheets, columns=None, chunk_rows=CHUNK_ROWS, on_progress=None):
+    frames = []
+    for sheet in sheets:
+        if python_calamine is not None:
+            if hasattr(file, "seek"):
+                file.seek(0)
+            usecols = (lambda name: name in columns) if columns else None
+            frames.append(pd.read_excel(file, sheet_name=sheet, engine="calamine", usecols=usecols))
+            if on_progress:
+                on_progress(sheet, len(frames[-1]))
+            continue
+
+        rows_read = 0
+        for chunk in iter_excel_chunks(file, sheet, columns, chunk_rows):
+            frames.append(chunk)
+            rows_read += len(chunk)
+            if on_progress:
+                on_progress(sheet, rows_read)
+
+    if not frames:
+        return pd.DataFrame()
+    # Chunks of one sheet can infer different types, concat works out a common one
+    # (a bool chunk next to a chunk with blanks comes out as object, so infer again)
+    return infer_dtypes(pd.concat(frames, ignore_index=True)) if len(frames) > 1 else frames[0]
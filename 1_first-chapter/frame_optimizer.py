@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+# Arrow strings are much smaller than Python string objects, used when pyarrow is installed
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+# Text columns with at most this share of distinct values become categoricals
+MAX_CATEGORY_RATIO = 0.5
+
+
+# Memory a frame takes, including the strings inside object columns
+def memory_usage(df):
+    return int(df.memory_usage(deep=True).sum())
+
+
+# Smallest integer type that holds every value of the column
+def downcast_integers(column):
+    kind = "unsigned" if len(column) and column.min() >= 0 else "integer"
+    return pd.to_numeric(column, downcast=kind)
+
+
+# float32 only if every value survives the round trip, otherwise keep float64
+def downcast_floats(column):
+    smaller = column.astype(np.float32)
+    same = (smaller.astype(column.dtype) == column) | (smaller.isna() & column.isna())
+    return smaller if same.all() else column
+
+
+# Categories for repeated text (region, status, genre), Arrow strings for the rest
+def shrink_text(column, max_category_ratio):
+    if column.dtype == object and pd.api.types.infer_dtype(column, skipna=True) != "string":
+        # Mixed text and numbers, leave it to the user to clean
+        return column
+    if column.nunique(dropna=True) <= max_category_ratio * max(column.count(), 1):
+        return column.astype("category")
+    if pyarrow is not None and column.dtype == object:
+        return column.astype("string[pyarrow]")
+    return column
+
+
+# Make a smaller copy of a frame with the same values
+#
+# Returns (optimized frame, report) where report is a list of
+# {"column", "before", "after", "bytes_before", "bytes_after"} for every
+# column whose type changed.
+def optimize_frame(df, max_category_ratio=MAX_CATEGORY_RATIO):
+    optimized = df.copy(deep=False)
+    report = []
+    for position, name in enumerate(df.columns):
+        column = df.iloc[:, position]
+        if pd.api.types.is_bool_dtype(column) or isinstance(column.dtype, pd.CategoricalDtype):
+            new_column = column
+        elif pd.api.types.is_integer_dtype(column):
+            new_column = downcast_integers(column)
+        elif pd.api.types.is_float_dtype(column):
+            new_column = downcast_floats(column)
+        elif column.dtype == object or pd.api.types.is_string_dtype(column):
+            new_column = shrink_text(column, max_category_ratio)
+        else:
+            # Dates, timedeltas and anything else are already compact
+            new_column = column
+
+        if new_column.dtype != column.dtype:
+            optimized.isetitem(position, new_column)
+            report.append({
+                "column": name,
+                "before": str(column.dtype),
+                "after": str(new_column.dtype),
+                "bytes_before": int(column.memory_usage(deep=True, index=False)),
+                "bytes_after": int(new_column.memory_usage(deep=True, index=False)),
+            })
+
+    return optimized, report
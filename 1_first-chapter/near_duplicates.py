@@ -0,0 +1,195 @@
+import os
+import re
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+
+# Number of MinHash functions per row (more = better estimates, slower)
+NUM_PERM = 128
+
+# Rows hashed per job sent to a worker process, and per numpy block inside a job
+CHUNK_ROWS = 20000
+BLOCK_ROWS = 1000
+
+# Below this many rows the work isn't worth starting worker processes for
+PARALLEL_MIN_ROWS = 50000
+
+# Hash functions are multiply-add-shift: h(x) = ((a * x + b) mod 2^64) >> 32, with
+# a, b fixed by a seed so every process agrees (no modulo, so numpy does it fast)
+SHIFT = np.uint64(32)
+EMPTY = np.uint32(np.iinfo(np.uint32).max)
+
+
+# Seeded parameters for num_perm hash functions (the same in every process)
+def hash_parameters(num_perm, seed=1):
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False) | np.uint64(1)
+    b = rng.integers(0, 1 << 64, num_perm, dtype=np.uint64, endpoint=False)
+    return a, b
+
+
+# Lowercase, drop accents and punctuation, collapse whitespace
+def normalize(text):
+    text = unicodedata.normalize("NFKD", str(text)).encode("ascii", "ignore").decode().lower()
+    return " ".join(re.split(r"[^a-z0-9]+", text)).strip()
+
+
+# MinHash signatures of a list of texts, one row of num_perm values per text
+#
+# Runs in worker processes, so everything it needs comes in as arguments.
+# Texts are hashed in blocks: the character 3-grams of every row in a block
+# are found, deduplicated and hashed with a few numpy operations, so the only
+# per-row Python work is normalizing the text.
+def signatures(texts, num_perm=NUM_PERM, seed=1):
+    a, b = hash_parameters(num_perm, seed)
+    result = np.full((len(texts), num_perm), EMPTY, dtype=np.uint32)
+    for start in range(0, len(texts), BLOCK_ROWS):
+        block = [normalize(text).encode() for text in texts[start:start + BLOCK_ROWS]]
+        # Short texts are padded so they still have one 3-gram
+        block = [text.ljust(3) if text else text for text in block]
+        _min_hash_block(result[start:start + len(block)], block, a, b)
+    return result
+
+
+def _min_hash_block(result, block, a, b):
+    lengths = np.array([len(text) for text in block])
+    data = np.frombuffer(b"".join(block), dtype=np.uint8).astype(np.uint64)
+    if len(data) < 3:
+        return
+
+    # The 3-gram at every position as one 24-bit number, minus those running into the next row
+    grams = data[:-2] << np.uint64(16) | data[1:-1] << np.uint64(8) | data[2:]
+    row_of = np.repeat(np.arange(len(block)), lengths)[:-2]
+    valid = np.arange(len(grams)) + 2 < np.cumsum(lengths)[row_of]
+
+    # Distinct (row, 3-gram) pairs, sorted by row
+    pairs = np.unique(row_of[valid].astype(np.uint64) << np.uint64(24) | grams[valid])
+    rows = (pairs >> np.uint64(24)).astype(np.int64)
+    values = pairs & np.uint64(0xFFFFFF)
+
+    permuted = ((a[:, None] * values[None, :] + b[:, None]) >> SHIFT).astype(np.uint32)
+    starts = np.flatnonzero(np.concatenate(([True], rows[1:] != rows[:-1])))
+    result[rows[starts]] = np.minimum.reduceat(permuted, starts, axis=1).T
+
+
+# Band count and rows per band that best separate pairs above and below the threshold
+#
+# Two rows with similarity s share at least one band with probability
+# 1 - (1 - s^rows)^bands. We pick the split with the smallest sum of false
+# positive area (below the threshold) and false negative area (above it).
+def choose_bands(threshold, num_perm=NUM_PERM):
+    best = None
+    s, step = np.linspace(0, 1, 201, retstep=True)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        p = 1 - (1 - s ** rows) ** bands
+        false_positive = p[s < threshold].sum() * step
+        false_negative = (1 - p[s >= threshold]).sum() * step
+        error = false_positive + false_negative
+        if best is None or error < best[0]:
+            best = (error, bands, rows, false_positive, false_negative)
+    return best[1:]
+
+
+# Union-find root with path halving
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+# Group rows whose texts are near-duplicates
+#
+# texts is one string per row (the chosen columns joined). Returns
+# (representative, stats) where representative[i] is the first row of row i's
+# cluster. Candidates come from LSH bands and are kept only if their
+# estimated similarity is at least the threshold.
+def cluster_texts(texts, threshold=0.8, num_perm=NUM_PERM, workers=None):
+    stats = {"rows": len(texts), "threshold": threshold, "num_perm": num_perm}
+    start = time.perf_counter()
+
+    # ---- Signatures (parallel across processes for big inputs) ----
+    if len(texts) >= PARALLEL_MIN_ROWS and (workers or os.cpu_count() or 1) > 1:
+        chunks = [texts[i:i + CHUNK_ROWS] for i in range(0, len(texts), CHUNK_ROWS)]
+        # spawn, because forking the app (Streamlit and job queue threads running) isn't safe
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn")) as pool:
+            parts = list(pool.map(signatures, chunks, [num_perm] * len(chunks)))
+        signature = np.vstack(parts) if parts else np.empty((0, num_perm), dtype=np.uint32)
+    else:
+        signature = signatures(texts, num_perm)
+    stats["signature_seconds"] = time.perf_counter() - start
+
+    # ---- LSH: rows sharing a band hash are candidates ----
+    bands, rows, false_positive, false_negative = choose_bands(threshold, num_perm)
+    stats.update({"bands": bands, "rows_per_band": rows,
+                  "false_positive_area": float(false_positive), "false_negative_area": float(false_negative)})
+
+    parent = np.arange(len(texts))
+    empty = signature[:, 0] == EMPTY
+    mixers = hash_parameters(rows, seed=2)[0] | np.uint64(1)
+    candidates = verified = 0
+    for band in range(bands):
+        # One 64-bit key per row for the band (wrapping multiply-add, collisions are checked below anyway)
+        keys = (signature[:, band * rows:(band + 1) * rows].astype(np.uint64) * mixers).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # Start of each bucket in the sorted order
+        boundaries = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        sizes = np.diff(np.append(boundaries, len(order)))
+        for first, size in zip(boundaries[sizes > 1], sizes[sizes > 1]):
+            members = order[first:first + size]
+            members = members[~empty[members]]
+            if len(members) < 2:
+                continue
+            # Compare every member with the bucket's first row, not every pair
+            head = members[0]
+            others = members[1:]
+            others = others[[_find(parent, i) != _find(parent, head) for i in others]]
+            candidates += len(others)
+            if not len(others):
+                continue
+            similarity = (signature[others] == signature[head]).mean(axis=1)
+            for i in others[similarity >= threshold]:
+                root_a, root_b = _find(parent, head), _find(parent, i)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+                    verified += 1
+
+    # Point every row straight at its root (roots are the smallest row of each cluster)
+    representative = parent
+    while True:
+        jumped = representative[representative]
+        if (jumped == representative).all():
+            break
+        representative = jumped
+    seconds = time.perf_counter() - start
+    stats.update({
+        "candidate_pairs": candidates,
+        "matched_pairs": verified,
+        # Share of LSH candidates that really were above the threshold
+        "candidate_precision": verified / candidates if candidates else 1.0,
+        "clusters": int(len(np.unique(representative))),
+        "seconds": seconds,
+        "rows_per_second": len(texts) / seconds if seconds else 0.0,
+    })
+    return representative, stats
+
+
+# Drop near-duplicate rows of a frame, keeping the first row of each cluster
+#
+# Returns (frame without near-duplicates, stats).
+def drop_near_duplicates(df, columns, threshold=0.8, num_perm=NUM_PERM, workers=None):
+    if not columns or not len(df):
+        return df, {"rows": len(df), "removed": 0}
+    parts = [df[column].astype(object).where(df[column].notna(), "").astype(str) for column in columns]
+    texts = parts[0].str.cat(parts[1:], sep=" ").tolist() if len(parts) > 1 else parts[0].tolist()
+    representative, stats = cluster_texts(texts, threshold, num_perm, workers)
+    keep = representative == np.arange(len(df))
+    stats["removed"] = int((~keep).sum())
+    return df[keep], stats
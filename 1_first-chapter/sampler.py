@@ -0,0 +1,130 @@
+import io
+import time
+
+import numpy as np
+import pandas as pd
+
+# Rows kept in a sample
+SAMPLE_ROWS = 10000
+
+# Stop reading after this many seconds, the sample then covers the part of the file read so far
+TIME_BUDGET = 3.0
+
+# Bytes read from the file at a time
+BLOCK_SIZE = 16 * 1024 * 1024
+
+
+# Uniform random sample of `size` lines in one pass (reservoir sampling)
+#
+# Every data line seen so far has the same chance of being in the sample.
+# The lines of a block are handled with numpy: line i (counting from 0) takes
+# reservoir slot j, a random number from 0 to i, if j < size.
+class Reservoir:
+    def __init__(self, size, seed=None):
+        self.size = size
+        self.items = []
+        self.seen = 0
+        self.rng = np.random.default_rng(seed)
+
+    # Offer many items at once, get_item(k) returns the k-th offered item
+    def offer(self, count, get_item):
+        # Fill the reservoir first
+        fill = min(count, self.size - len(self.items))
+        self.items.extend(get_item(k) for k in range(fill))
+        self.seen += fill
+
+        if count > fill:
+            seen = self.seen + np.arange(count - fill)
+            slots = self.rng.integers(0, seen + 1)
+            for k in np.flatnonzero(slots < self.size):
+                self.items[slots[k]] = get_item(fill + k)
+            self.seen += count - fill
+
+
+# Sample the data lines of a CSV without parsing the lines we don't keep
+#
+# Only newlines are looked for while reading, and only the sampled lines
+# are parsed. Returns (sample DataFrame, stats). Quoted fields with line
+# breaks in them can't be split on newlines, so then the sample is taken
+# from parsed chunks instead (slower, same result).
+def sample_csv(file, size=SAMPLE_ROWS, time_budget=TIME_BUDGET, seed=None):
+    start = time.perf_counter()
+    total = _file_size(file)
+    file.seek(0)
+    header = file.readline()
+
+    reservoir = Reservoir(size, seed)
+    leftover = b""
+    complete = True
+    first_block = True
+    while True:
+        block = file.read(BLOCK_SIZE)
+        if not block:
+            if leftover.strip():
+                reservoir.offer(1, lambda k: leftover)
+            break
+
+        data = leftover + block
+        ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        leftover = data[ends[-1] + 1:] if len(ends) else data
+        reservoir.offer(len(ends), lambda k: data[starts[k]:ends[k] + 1])
+
+        # The first block shows whether quoted fields have line breaks in them
+        if first_block and _has_quoted_newlines(reservoir.items):
+            break
+        first_block = False
+        if time.perf_counter() - start > time_budget:
+            complete = False
+            break
+
+    if _has_quoted_newlines(reservoir.items):
+        file.seek(0)
+        return sample_frames(pd.read_csv(file, chunksize=100000), size, time_budget, seed, total)
+
+    sample = pd.read_csv(io.BytesIO(header + b"".join(line if line.endswith(b"\n") else line + b"\n"
+                                                      for line in reservoir.items)))
+    return sample, {
+        "rows_seen": reservoir.seen,
+        "bytes_read": file.tell(),
+        "bytes_total": total,
+        "complete": complete,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# Sample the rows of a stream of DataFrame chunks (Excel sheets, CSVs with quoted newlines)
+def sample_frames(chunks, size=SAMPLE_ROWS, time_budget=TIME_BUDGET, seed=None, bytes_total=None):
+    start = time.perf_counter()
+    reservoir = Reservoir(size, seed)
+    complete = True
+    for chunk in chunks:
+        reservoir.offer(len(chunk), lambda k: chunk.iloc[k])
+        if time.perf_counter() - start > time_budget:
+            complete = False
+            break
+
+    # Rows come back as Series, so work out the column types again
+    sample = pd.DataFrame(reservoir.items).reset_index(drop=True).infer_objects()
+    return sample, {
+        "rows_seen": reservoir.seen,
+        "bytes_read": None,
+        "bytes_total": bytes_total,
+        "complete": complete,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# An odd number of quotes in a line means a quoted field goes on to the next line
+def _has_quoted_newlines(lines):
+    return any(line.count(b'"') % 2 for line in lines)
+
+
+def _file_size(file):
+    if hasattr(file, "size"):
+        return file.size
+    position = file.tell()
+    file.seek(0, io.SEEK_END)
+    size = file.tell()
+    file.seek(position)
+    return size
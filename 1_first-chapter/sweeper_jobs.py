@@ -0,0 +1,53 @@
+# Reading and exporting whole files as background jobs
+#
+# Every function takes the job first (see shared/job_queue.py), reports how
+# far it got and stops when the job is cancelled. They only get plain data
+# (bytes and DataFrames), so they also run in a worker process.
+
+import io
+
+import pandas as pd
+
+import excel_reader
+
+# Rows written per step of an export, progress and cancel checks happen between steps
+EXPORT_CHUNK_ROWS = 20000
+
+
+# Read a whole CSV file from its bytes
+def read_csv(job, data):
+    return pd.read_csv(job.reader(io.BytesIO(data), len(data)))
+
+
+# Read the chosen sheets and columns of a whole workbook from its bytes
+def read_excel(job, data, sheets, columns):
+    def on_progress(sheet, rows):
+        job.check()
+        job.progress(sheets.index(sheet) / len(sheets), f"read {rows:,} rows from {sheet}")
+    return excel_reader.read_excel(io.BytesIO(data), sheets, columns, on_progress=on_progress)
+
+
+# The frame as CSV bytes
+def export_csv(job, df):
+    buffer = io.BytesIO()
+    for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+        job.check()
+        df.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(buffer, index=False, header=start == 0)
+        job.progress(min(start + EXPORT_CHUNK_ROWS, len(df)) / max(len(df), 1),
+                     f"wrote {min(start + EXPORT_CHUNK_ROWS, len(df)):,} of {len(df):,} rows")
+    return buffer.getvalue()
+
+
+# The frame as .xlsx bytes (xlsxwriter is pure Python, so this is worth a worker process)
+def export_excel(job, df):
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine="xlsxwriter") as writer:
+        for start in range(0, max(len(df), 1), EXPORT_CHUNK_ROWS):
+            job.check()
+            # Row 0 is the header, data row i goes to row i + 1
+            df.iloc[start:start + EXPORT_CHUNK_ROWS].to_excel(writer, index=False, header=start == 0,
+                                                              startrow=0 if start == 0 else start + 1)
+            job.progress(min(start + EXPORT_CHUNK_ROWS, len(df)) / max(len(df), 1),
+                         f"wrote {min(start + EXPORT_CHUNK_ROWS, len(df)):,} of {len(df):,} rows")
+        job.progress(1.0, "compressing the workbook")
+    return buffer.getvalue()
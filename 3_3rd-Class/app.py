@@ -1,7 +1,14 @@
 import streamlit as st
+import os
 import re
-import random
-import string
+import sys
+from password_tools import check_password_strength, generate_password
+
+# Rerun profiler shared by the apps (set APP_PROFILE=1 to turn it on)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import rerun_profiler
+
+profile = rerun_profiler.start("Password Strength Meter")
 
 # Set page configuration
 st.set_page_config(
@@ -10,97 +17,6 @@ st.set_page_config(
     layout="centered"
 )
 
-# Common weak passwords to blacklist
-COMMON_PASSWORDS = [
-    "password", "123456", "qwerty", "admin", "welcome",
-    "password123", "abc123", "letmein", "monkey", "1234567890"
-]
-
-def check_password_strength(password):
-    """
-    Analyze password strength based on various criteria
-    Returns score and feedback
-    """
-    score = 0
-    feedback = []
-    
-    # Check if password is in common passwords list
-    if password.lower() in COMMON_PASSWORDS:
-        feedback.append("❌ This is a commonly used password and can be easily guessed.")
-        return 0, feedback
-    
-    # Length Check (1 point)
-    if len(password) >= 8:
-        score += 1
-    else:
-        feedback.append("❌ Password should be at least 8 characters long.")
-    
-    # Extra point for very long passwords
-    if len(password) >= 12:
-        score += 1
-    
-    # Upper & Lowercase Check (1 point)
-    if re.search(r"[A-Z]", password) and re.search(r"[a-z]", password):
-        score += 1
-    else:
-        feedback.append("❌ Include both uppercase and lowercase letters.")
-    
-    # Digit Check (1 point)
-    if re.search(r"\d", password):
-        score += 1
-    else:
-        feedback.append("❌ Add at least one number (0-9).")
-    
-    # Special Character Check (1 point)
-    if re.search(r"[!@#$%^&*]", password):
-        score += 1
-    else:
-        feedback.append("❌ Include at least one special character (!@#$%^&*).")
-    
-    # Check for sequential characters (penalty)
-    if re.search(r"(abc|bcd|cde|def|efg|fgh|ghi|hij|ijk|jkl|klm|lmn|mno|nop|opq|pqr|qrs|rst|stu|tuv|uvw|vwx|wxy|xyz)", 
-                 password.lower()):
-        score -= 1
-        feedback.append("❌ Avoid sequential letters (like 'abc').")
-    
-    # Check for sequential numbers (penalty)
-    if re.search(r"(012|123|234|345|456|567|678|789)", password):
-        score -= 1
-        feedback.append("❌ Avoid sequential numbers (like '123').")
-    
-    # Check for repeated characters (penalty)
-    if re.search(r"(.)\1{2,}", password):
-        score -= 1
-        feedback.append("❌ Avoid repeating characters (like 'aaa').")
-    
-    # Ensure score is at least 0
-    score = max(0, score)
-    
-    return score, feedback
-
-def generate_password(length=12, include_upper=True, include_lower=True, 
-                      include_digits=True, include_special=True):
-    """Generate a strong random password based on criteria"""
-    chars = ""
-    
-    if include_upper:
-        chars += string.ascii_uppercase
-    if include_lower:
-        chars += string.ascii_lowercase
-    if include_digits:
-        chars += string.digits
-    if include_special:
-        chars += "!@#$%^&*"
-    
-    # Ensure we have at least some characters to choose from
-    if not chars:
-        chars = string.ascii_letters + string.digits
-    
-    # Generate password
-    password = ''.join(random.choice(chars) for _ in range(length))
-    
-    return password
-
 # Main app
 st.title("🔒 Password Strength Meter")
 st.markdown("Check how strong your password is and get suggestions to improve it.")
@@ -110,7 +26,9 @@ password = st.text_input("Enter your password:", value="", type="password", key=
 
 # Password strength check
 if password:
-    score, feedback = check_password_strength(password)
+    with profile.stage("check strength"):
+        score, feedback = check_password_strength(password)
+    profile.count("passwords checked")
     
     # Display strength rating
     if score >= 5:
@@ -184,13 +102,16 @@ with col2:
     include_special = st.checkbox("Include Special Characters", value=True)
 
 if st.button("Generate Strong Password"):
-    generated_password = generate_password(
-        length, include_upper, include_lower, include_digits, include_special
-    )
+    with profile.stage("generate password"):
+        generated_password = generate_password(
+            length, include_upper, include_lower, include_digits, include_special
+        )
+    profile.count("passwords generated")
     st.code(generated_password)
     
     # Check the strength of the generated password
-    gen_score, gen_feedback = check_password_strength(generated_password)
+    with profile.stage("check strength"):
+        gen_score, gen_feedback = check_password_strength(generated_password)
     st.progress(gen_score / 5)
     
     if gen_score >= 5:
@@ -214,3 +135,4 @@ st.markdown("""
 st.markdown("---")
 st.markdown("Created with ❤️ using Streamlit")
 
+profile.panel()
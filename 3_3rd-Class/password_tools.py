@@ -0,0 +1,95 @@
+# Password checks and generator used by app.py (no Streamlit here, so they can be imported on their own)
+import re
+import random
+import string
+
+# Common weak passwords to blacklist
+COMMON_PASSWORDS = [
+    "password", "123456", "qwerty", "admin", "welcome",
+    "password123", "abc123", "letmein", "monkey", "1234567890"
+]
+
+def check_password_strength(password):
+    """
+    Analyze password strength based on various criteria
+    Returns score and feedback
+    """
+    score = 0
+    feedback = []
+    
+    # Check if password is in common passwords list
+    if password.lower() in COMMON_PASSWORDS:
+        feedback.append("❌ This is a commonly used password and can be easily guessed.")
+        return 0, feedback
+    
+    # Length Check (1 point)
+    if len(password) >= 8:
+        score += 1
+    else:
+        feedback.append("❌ Password should be at least 8 characters long.")
+    
+    # Extra point for very long passwords
+    if len(password) >= 12:
+        score += 1
+    
+    # Upper & Lowercase Check (1 point)
+    if re.search(r"[A-Z]", password) and re.search(r"[a-z]", password):
+        score += 1
+    else:
+        feedback.append("❌ Include both uppercase and lowercase letters.")
+    
+    # Digit Check (1 point)
+    if re.search(r"\d", password):
+        score += 1
+    else:
+        feedback.append("❌ Add at least one number (0-9).")
+    
+    # Special Character Check (1 point)
+    if re.search(r"[!@#$%^&*]", password):
+        score += 1
+    else:
+        feedback.append("❌ Include at least one special character (!@#$%^&*).")
+    
+    # Check for sequential characters (penalty)
+    if re.search(r"(abc|bcd|cde|def|efg|fgh|ghi|hij|ijk|jkl|klm|lmn|mno|nop|opq|pqr|qrs|rst|stu|tuv|uvw|vwx|wxy|xyz)", 
+                 password.lower()):
+        score -= 1
+        feedback.append("❌ Avoid sequential letters (like 'abc').")
+    
+    # Check for sequential numbers (penalty)
+    if re.search(r"(012|123|234|345|456|567|678|789)", password):
+        score -= 1
+        feedback.append("❌ Avoid sequential numbers (like '123').")
+    
+    # Check for repeated characters (penalty)
+    if re.search(r"(.)\1{2,}", password):
+        score -= 1
+        feedback.append("❌ Avoid repeating characters (like 'aaa').")
+    
+    # Ensure score is at least 0
+    score = max(0, score)
+    
+    return score, feedback
+
+def generate_password(length=12, include_upper=True, include_lower=True, 
+                      include_digits=True, include_special=True):
+    """Generate a strong random password based on criteria"""
+    chars = ""
+    
+    if include_upper:
+        chars += string.ascii_uppercase
+    if include_lower:
+        chars += string.ascii_lowercase
+    if include_digits:
+        chars += string.digits
+    if include_special:
+        chars += "!@#$%^&*"
+    
+    # Ensure we have at least some characters to choose from
+    if not chars:
+        chars = string.ascii_letters + string.digits
+    
+    # Generate password
+    password = ''.join(random.choice(chars) for _ in range(length))
+    
+    return password
@@ -3,84 +3,153 @@
 
 # Import required libraries
 import streamlit as st
-import json
+import io
 import os
+import sys
+import tempfile
+
+from library_store import LibraryStore, VersionConflict
+from catalog_io import READERS, export_catalog, guess_format, import_catalog
+from isbn_catalog import CATALOG_FILE, IsbnCatalog, normalize_isbn
+
+# Rerun profiler shared by the apps (set APP_PROFILE=1 to turn it on)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import rerun_profiler
+import job_queue
 
 # File to save the library data
 FILE_NAME = "library.txt"
 
-# Function to load library from file
-def load_library():
-    """Loads the library from a file and returns the books list"""
-    # Check if file exists
-    if os.path.exists(FILE_NAME):
-        try:
-            # Open file for reading
-            with open(FILE_NAME, "r") as file:
-                # Load books from JSON
-                return json.load(file)
-        except:
-            # If there's an error, return empty list
-            return []
+# Function to get the background job queue
+@st.cache_resource
+def get_jobs():
+    """Runs saves in the background, so adding or removing a book doesn't wait for the file"""
+    return job_queue.JobQueue(os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs.sqlite3"))
+
+# Function to get the shared library store
+@st.cache_resource
+def get_store():
+    """Returns one library store shared by every session in this server process"""
+    return LibraryStore(FILE_NAME, jobs=get_jobs())
+
+# Function to show whether the latest changes are saved
+def show_save_status(store):
+    """Small note in the sidebar about the last background save"""
+    if store.save_job is None:
+        return
+    job = get_jobs().status(store.save_job)
+    if job is None:
+        # Old jobs are forgotten when the app starts again, nothing to report
+        return
+    if job["status"] in ("queued", "running"):
+        st.sidebar.caption("💾 Saving...")
+    elif job["status"] == "done":
+        st.sidebar.caption("💾 All changes saved")
     else:
-        # If file doesn't exist, return empty list
-        return []
-
-# Function to save library to file
-def save_library(books):
-    """Saves the books list to a file"""
-    # Open file for writing
-    with open(FILE_NAME, "w") as file:
-        # Convert books list to JSON and save
-        
-        json.dump(books, file)
+        # The next change tries again
+        st.sidebar.error(f"The library couldn't be saved: {job['error'] or job['status']}")
+
+# Function to get the offline ISBN catalog
+@st.cache_resource
+def get_isbn_catalog():
+    """Maps the ISBN catalog once per server process, None if it hasn't been built"""
+    if not os.path.exists(CATALOG_FILE):
+        return None
+    return IsbnCatalog(CATALOG_FILE)
+
+# Function to tell this session about changes made by other sessions
+def check_for_changes(store):
+    """Shows what changed since this session last looked at the library"""
+    # First run of this session: nothing to report yet
+    if 'seen_version' not in st.session_state:
+        st.session_state.seen_version = store.version
+        return
+
+    version, changes = store.changes_since(st.session_state.seen_version)
+    st.session_state.seen_version = version
+
+    # Too many changes happened, just let the user know the library was refreshed
+    if changes is None:
+        st.toast("The library was updated by other users.")
+        return
+
+    # Only tell the user about books that actually changed
+    for _, action, book_id in changes:
+        if book_id in st.session_state.get('own_changes', set()):
+            continue
+        book = store.get_book(book_id)
+        if book:
+            st.toast(f"'{book['title']}' was {action}.")
+        else:
+            st.toast(f"A book was {action}.")
+    st.session_state.own_changes = set()
 
 # Main function
 def main():
+    # Time the parts of this rerun (does nothing unless profiling is on)
+    profile = rerun_profiler.start("Library Manager")
+    
     # Set page title
     st.set_page_config(page_title="Personal Library Manager", page_icon="📚")
     
     # Display header
     st.title("📚 Personal Library Manager")
     
-    # Initialize session state for books if not exists
-    if 'books' not in st.session_state:
-        st.session_state.books = load_library()
+    # Get the library shared by all sessions
+    with profile.stage("load library"):
+        store = get_store()
+    with profile.stage("check for changes"):
+        check_for_changes(store)
     
     # Create sidebar menu
     st.sidebar.title("Menu")
     page = st.sidebar.radio(
         "Choose an option:",
-        ["View Books", "Add Book", "Remove Book", "Search Books", "Statistics"]
+        ["View Books", "Add Book", "Remove Book", "Search Books", "Statistics", "Import / Export"]
     )
     
     # Show different pages based on selection
     if page == "View Books":
-        view_books()
+        view_books(store)
     elif page == "Add Book":
-        add_book()
+        add_book(store)
     elif page == "Remove Book":
-        remove_book()
+        remove_book(store)
     elif page == "Search Books":
-        search_books()
+        search_books(store)
     elif page == "Statistics":
-        show_statistics()
+        show_statistics(store)
+    elif page == "Import / Export":
+        import_export(store)
     
-    # Save books whenever the app runs
-    save_library(st.session_state.books)
+    show_save_status(store)
+    profile.panel()
+
+# Function to remember which changes this session made itself
+def remember_own_change(book_id):
+    """So we don't show a notification for our own edits"""
+    if 'own_changes' not in st.session_state:
+        st.session_state.own_changes = set()
+    st.session_state.own_changes.add(book_id)
 
 # Function to display all books
-def view_books():
+def view_books(store):
     """Shows all books in the library"""
     st.header("Your Library")
+    profile = rerun_profiler.current()
+    
+    # Snapshot of the shared store, edits by other sessions don't change it while we draw
+    with profile.stage("get books"):
+        books = store.snapshot()
+    profile.count("books shown", len(books))
     
     # Check if library is empty
-    if not st.session_state.books:
+    if not books:
         st.info("Your library is empty. Add some books to get started!")
         return
     
     # Display each book in a nice format
-    for i, book in enumerate(st.session_state.books):
+    for i, book in enumerate(books.values()):
         # Create a card-like display for each book
         with st.container():
             col1, col2 = st.columns([3, 1])
@@ -101,18 +170,41 @@ def view_books():
             st.divider()
 
 # Function to add a new book
-def add_book():
+def add_book(store):
     """Form to add a new book"""
     st.header("Add a New Book")
+    profile = rerun_profiler.current()
+    
+    # Fill in the form from the offline ISBN catalog (outside the form so it works before submitting)
+    catalog = get_isbn_catalog()
+    isbn = st.text_input("ISBN", key="add_isbn")
+    if catalog is None:
+        st.caption(f"Build {CATALOG_FILE} with `python isbn_catalog.py build DUMP` to fill in books from their ISBN.")
+    elif st.button("Fill in from ISBN"):
+        with profile.stage("ISBN lookup"):
+            details = catalog.lookup(isbn)
+        if details:
+            st.session_state.add_title = details["title"]
+            st.session_state.add_author = details["author"]
+            if details["year"] and 1000 <= details["year"] <= 2100:
+                st.session_state.add_year = details["year"]
+            st.session_state.add_genre = details["genre"]
+            st.success("Details filled in from the catalog.")
+        elif normalize_isbn(isbn) is None:
+            st.error("That is not a valid ISBN.")
+        else:
+            st.warning("This ISBN is not in the catalog.")
     
     # Create a form for adding books
+    st.session_state.setdefault("add_year", 2023)
     with st.form("add_book_form"):
         # Get book details
-        title = st.text_input("Book Title")
-        author = st.text_input("Author")
-        year = st.number_input("Publication Year", min_value=1000, max_value=2100, value=2023)
-        genre = st.text_input("Genre")
+        title = st.text_input("Book Title", key="add_title")
+        author = st.text_input("Author", key="add_author")
+        year = st.number_input("Publication Year", min_value=1000, max_value=2100, key="add_year")
+        genre = st.text_input("Genre", key="add_genre")
         read_status = st.checkbox("I have read this book")
+        add_anyway = st.checkbox("Add it even if it looks like a book I already have")
         
         # Submit button
         submitted = st.form_submit_button("Add Book")
@@ -129,43 +221,64 @@ def add_book():
                     "genre": genre,
                     "read": read_status
                 }
+                if isbn:
+                    new_book["isbn"] = normalize_isbn(isbn) or isbn
+                
+                # Warn about books that are probably the same one (typos allowed)
+                with profile.stage("find similar books"):
+                    duplicates = store.find_similar(title, author)
+                if duplicates and not add_anyway:
+                    st.warning("This looks like a book you already have:\n\n" + "\n".join(
+                        f"- {book['title']} by {book['author']} ({book['year']})" for book in duplicates
+                    ) + "\n\nTick the box above and press Add Book again to add it anyway.")
+                    return
                 
-                # Add to books list
-                st.session_state.books.append(new_book)
+                # Add to the shared library
+                with profile.stage("add book"):
+                    book_id = store.add_book(new_book)
+                remember_own_change(book_id)
                 st.success(f"'{title}' by {author} added successfully!")
             else:
                 st.error("Please enter both title and author.")
 
 # Function to remove a book
-def remove_book():
+def remove_book(store):
     """Form to remove a book"""
     st.header("Remove a Book")
+    profile = rerun_profiler.current()
+    
+    # Get the books from the shared store
+    with profile.stage("get books"):
+        books = store.get_books()
     
     # Check if library is empty
-    if not st.session_state.books:
+    if not books:
         st.info("Your library is empty. There are no books to remove.")
         return
     
-    # Get list of book titles
-    book_titles = [book["title"] for book in st.session_state.books]
-    
     # Dropdown to select book to remove
-    selected_title = st.selectbox("Select a book to remove:", book_titles)
+    selected_book = st.selectbox(
+        "Select a book to remove:",
+        books,
+        format_func=lambda book: f"{book['title']} by {book['author']}"
+    )
     
     # Remove button
     if st.button("Remove Book"):
-        # Find and remove the selected book
-        for i, book in enumerate(st.session_state.books):
-            if book["title"] == selected_title:
-                # Remove the book
-                del st.session_state.books[i]
-                st.success(f"'{selected_title}' removed successfully!")
-                break
+        try:
+            # Only remove it if nobody changed it since we loaded the page
+            with profile.stage("remove book"):
+                store.remove_book(selected_book["id"], selected_book["version"])
+            remember_own_change(selected_book["id"])
+            st.success(f"'{selected_book['title']}' removed successfully!")
+        except VersionConflict as error:
+            st.error(str(error))
 
 # Function to search for books
-def search_books():
+def search_books(store):
     """Search for books by title or author"""
     st.header("Search Books")
+    profile = rerun_profiler.current()
     
     # Choose search type
     search_type = st.radio("Search by:", ["Title", "Author"])
@@ -179,13 +292,15 @@ def search_books():
         results = []
         
         # Search through books
-        for book in st.session_state.books:
-            # Search by title
-            if search_type == "Title" and search_term.lower() in book["title"].lower():
-                results.append(book)
-            # Search by author
-            elif search_type == "Author" and search_term.lower() in book["author"].lower():
-                results.append(book)
+        with profile.stage("search"):
+            for book in store.snapshot().values():
+                # Search by title
+                if search_type == "Title" and search_term.lower() in book["title"].lower():
+                    results.append(book)
+                # Search by author
+                elif search_type == "Author" and search_term.lower() in book["author"].lower():
+                    results.append(book)
+        profile.count("books found", len(results))
         
         # Display results
         if results:
@@ -205,14 +320,27 @@ def search_books():
                 st.divider()
         else:
             st.info(f"No books found matching {search_type.lower()} '{search_term}'.")
+            
+            # Maybe the search term has a typo
+            with profile.stage("fuzzy search"):
+                suggestions = store.fuzzy_search(search_type.lower(), search_term)
+            if suggestions:
+                st.write("**Did you mean:**")
+                for book in suggestions:
+                    st.write(f"- {book['title']} by {book['author']} ({book['year']})")
 
 # Function to show statistics
-def show_statistics():
+def show_statistics(store):
     """Shows statistics about the library"""
     st.header("Library Statistics")
+    profile = rerun_profiler.current()
+    
+    # Snapshot of the shared store
+    with profile.stage("get books"):
+        books = store.snapshot()
     
     # Get total number of books
-    total_books = len(st.session_state.books)
+    total_books = len(books)
     
     # Display total books
     st.subheader(f"Total Books: {total_books}")
@@ -223,7 +351,8 @@ def show_statistics():
         return
     
     # Count read books
-    read_books = sum(1 for book in st.session_state.books if book["read"])
+    with profile.stage("count read books"):
+        read_books = sum(1 for book in books.values() if book["read"])
     unread_books = total_books - read_books
     
     # Calculate percentage
@@ -247,6 +376,58 @@ def show_statistics():
     st.subheader("Read vs Unread")
     st.bar_chart({"Read": read_books, "Unread": unread_books})
 
+# Function to import or export a whole catalog
+def import_export(store):
+    """Bulk import a catalog file or download the library"""
+    st.header("Import / Export")
+    profile = rerun_profiler.current()
+    
+    # Import section
+    st.subheader("Import a Catalog")
+    uploaded_file = st.file_uploader("Upload a CSV, JSONL or MARC-like (.mrk) file", type=["csv", "jsonl", "mrk", "txt"])
+    
+    if uploaded_file and st.button("Import Books"):
+        progress_text = st.empty()
+        
+        # Show progress after every batch
+        def show_progress(stats):
+            progress_text.write(f"{stats['rows']} rows read, {stats['added']} added, "
+                                f"{stats['duplicates']} duplicates skipped ({stats['rows_per_second']:.0f} rows/sec)")
+        
+        try:
+            # Read the upload as text without copying it into one big string
+            file = io.TextIOWrapper(uploaded_file, encoding="utf-8", newline="")
+            with profile.stage("import catalog"):
+                stats = import_catalog(store, file, guess_format(uploaded_file.name), on_progress=show_progress)
+            profile.count("books imported", stats["added"])
+            show_progress(stats)
+            st.success(f"Imported {stats['added']} books in {stats['seconds']:.1f} seconds "
+                       f"({stats['invalid']} invalid rows skipped).")
+            if stats["error"]:
+                st.warning(f"The rest of the file couldn't be read. {stats['error']}")
+        except ValueError as error:
+            st.error(str(error))
+    
+    # Export section
+    st.subheader("Export the Library")
+    export_format = st.radio("Export format:", sorted(READERS), horizontal=True)
+    
+    if st.button("Prepare Export"):
+        # Books are written one by one to a temp file instead of building the whole export in memory
+        file = tempfile.NamedTemporaryFile("w", encoding="utf-8", newline="", delete=False)
+        extension = {"csv": ".csv", "jsonl": ".jsonl", "marc": ".mrk"}[export_format]
+        try:
+            with file, profile.stage("export catalog"):
+                count = export_catalog(store.snapshot().values(), file, export_format)
+            with open(file.name, "rb") as export_file:
+                st.download_button(
+                    label=f"Download {count} books",
+                    data=export_file,
+                    file_name=os.path.splitext(FILE_NAME)[0] + extension,
+                )
+        finally:
+            os.remove(file.name)
+
 # Run the app
 if __name__ == "__main__":
     main()
@@ -0,0 +1,122 @@
+# Fuzzy Index Benchmark
+# Builds a big made-up library and times typo searches, duplicate checks and saving/loading the index
+
+# Import required libraries
+import argparse
+import json
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+import tracemalloc
+
+from fuzzy_index import FuzzyIndex
+
+
+# Function to make up a word
+def make_word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+
+
+# Function to make a library of made-up books
+def make_books(count, seed=1):
+    """Titles of 1-5 words from a big vocabulary, authors from first and last name lists"""
+    rng = random.Random(seed)
+    vocabulary = [make_word(rng) for _ in range(max(1000, count // 5))]
+    first_names = [make_word(rng).title() for _ in range(5000)]
+    last_names = [make_word(rng).title() for _ in range(max(1000, count // 20))]
+    return [{
+        "id": book_id,
+        "title": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5))).title(),
+        "author": f"{rng.choice(first_names)} {rng.choice(last_names)}",
+    } for book_id in range(1, count + 1)]
+
+
+# Function to put one typo into a word
+def add_typo(word, rng):
+    """Changes, deletes, inserts or swaps one letter"""
+    i = rng.randrange(len(word) - 1)
+    kind = rng.choice(["change", "delete", "insert", "swap"])
+    if kind == "change":
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i + 1:]
+    if kind == "delete":
+        return word[:i] + word[i + 1:]
+    if kind == "insert":
+        return word[:i] + rng.choice(string.ascii_lowercase) + word[i:]
+    return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+
+
+# Function to time something in milliseconds
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the fuzzy title/author index")
+    parser.add_argument("--books", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--memory", action="store_true", help="Also measure index memory (builds it a second time)")
+    args = parser.parse_args()
+
+    books = make_books(args.books)
+    books_by_id = {book["id"]: book for book in books}
+
+    build_ms, index = timed(FuzzyIndex.from_books, books)
+    print(f"Built index for {args.books:,} books in {build_ms / 1000:.1f} s ({len(index.keys):,} keys)")
+    if args.memory:
+        tracemalloc.start()
+        FuzzyIndex.from_books(books)
+        print(f"Index memory: {tracemalloc.get_traced_memory()[0] / 1024 ** 2:.0f} MB")
+        tracemalloc.stop()
+
+    # Searches for an author's last name with one typo
+    rng = random.Random(2)
+    samples = rng.sample(books, min(args.queries, len(books)))
+    times, found = [], 0
+    for book in samples:
+        last_name = book["author"].split()[-1].lower()
+        query = add_typo(last_name, rng) if len(last_name) > 3 else last_name
+        milliseconds, results = timed(index.search, "author", query)
+        times.append(milliseconds)
+        found += any(book_id == book["id"] for book_id, _ in index.search("author", query, limit=None))
+    print(f"Author search with a typo: median {statistics.median(times) * 1000:.0f} us, "
+          f"p99 {sorted(times)[int(len(times) * 0.99)] * 1000:.0f} us, book found {found / len(samples):.1%}")
+
+    # Duplicate check for a book we already have, with a typo in the title
+    times, found = [], 0
+    for book in samples:
+        title_words = book["title"].split()
+        title_words[0] = add_typo(title_words[0], rng) if len(title_words[0]) > 6 else title_words[0]
+        milliseconds, duplicates = timed(index.likely_duplicates, " ".join(title_words), book["author"], books_by_id.get)
+        times.append(milliseconds)
+        found += book["id"] in duplicates
+    print(f"Duplicate check: median {statistics.median(times) * 1000:.0f} us, "
+          f"p99 {sorted(times)[int(len(times) * 0.99)] * 1000:.0f} us, duplicate found {found / len(samples):.1%}")
+
+    # Adding and removing a book (what add_book and remove_book pay)
+    milliseconds, _ = timed(lambda: [index.add(-i, "Brand New Title Here", "Some Newauthor") for i in range(1, 1001)])
+    print(f"Add: {milliseconds:.0f} us per book")
+    milliseconds, _ = timed(lambda: [index.remove(-i, "Brand New Title Here", "Some Newauthor") for i in range(1, 1001)])
+    print(f"Remove: {milliseconds:.0f} us per book")
+
+    # Saving with the library and loading at startup, compared with rebuilding
+    folder = tempfile.mkdtemp()
+    library_file = os.path.join(folder, "library.txt")
+    with open(library_file, "w") as file:
+        json.dump(books, file)
+    index_file = library_file + ".index"
+    milliseconds, _ = timed(index.save, index_file, library_file)
+    print(f"Save index: {milliseconds / 1000:.1f} s ({os.path.getsize(index_file) / 1024 ** 2:.0f} MB)")
+    milliseconds, loaded = timed(FuzzyIndex.load, index_file, library_file)
+    print(f"Load index: {milliseconds / 1000:.1f} s (rebuild from books: {build_ms / 1000:.1f} s)")
+    assert loaded.search("author", samples[0]["author"]) == index.search("author", samples[0]["author"])
+
+
+# Run the program
+if __name__ == "__main__":
+    main()
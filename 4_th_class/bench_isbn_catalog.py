@@ -0,0 +1,89 @@
+# ISBN Catalog Benchmark
+# Makes a big catalog dump, converts it and times opening the catalog, lookups and enriching a library
+
+# Import required libraries
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from isbn_catalog import IsbnCatalog, build_catalog, enrich_books, isbn13_check_digit
+
+
+# Function to make a valid ISBN-13 from a number
+def make_isbn(number):
+    first_twelve = f"978{number:09d}"
+    return first_twelve + str(isbn13_check_digit(first_twelve))
+
+
+# Function to write a JSONL dump of made-up books
+def make_dump(path, count, seed=1):
+    rng = random.Random(seed)
+    genres = ["Fiction", "History", "Science", "Poetry", "Travel", "Children"]
+    with open(path, "w", encoding="utf-8") as file:
+        for number in range(count):
+            file.write(json.dumps({
+                "isbn": make_isbn(number * 7 + rng.randrange(7)),
+                "title": f"Book Number {number}",
+                "author": f"Author {rng.randrange(count // 10 + 1)}",
+                "year": rng.randint(1900, 2024),
+                "genre": rng.choice(genres),
+            }) + "\n")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the offline ISBN catalog")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    parser.add_argument("--library", type=int, default=1000, help="Books in the library to enrich")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    dump_path = os.path.join(folder, "dump.jsonl")
+    catalog_path = os.path.join(folder, "isbn_catalog.bin")
+
+    start = time.perf_counter()
+    make_dump(dump_path, args.records)
+    print(f"Made a dump of {args.records:,} records ({os.path.getsize(dump_path) / 1024 ** 2:.0f} MB) "
+          f"in {time.perf_counter() - start:.1f} s")
+
+    with open(dump_path, "r", encoding="utf-8") as file:
+        stats = build_catalog(file, "jsonl", catalog_path)
+    print(f"Converted in {stats['seconds']:.1f} s ({stats['records'] / stats['seconds']:,.0f} records/s, "
+          f"{os.path.getsize(catalog_path) / 1024 ** 2:.0f} MB)")
+
+    start = time.perf_counter()
+    catalog = IsbnCatalog(catalog_path)
+    print(f"Open: {(time.perf_counter() - start) * 1e6:.0f} us")
+
+    # Lookups of ISBNs that are in the catalog and ISBNs that aren't
+    rng = random.Random(2)
+    hits = [str(catalog.keys[rng.randrange(len(catalog))]) for _ in range(args.lookups)]
+    misses = [make_isbn(rng.randrange(10 ** 9)) for _ in range(args.lookups)]
+    for name, isbns in [("hit", hits), ("miss", misses)]:
+        times = []
+        found = 0
+        for isbn in isbns:
+            start = time.perf_counter()
+            found += catalog.lookup(isbn) is not None
+            times.append(time.perf_counter() - start)
+        print(f"Lookup ({name}): median {statistics.median(times) * 1e6:.1f} us, "
+              f"p99 {sorted(times)[int(len(times) * 0.99)] * 1e6:.1f} us, found {found:,}/{len(isbns):,}")
+
+    # Enriching a library where half the books have an ISBN and the rest are matched by title and author
+    records = [catalog.lookup(str(catalog.keys[rng.randrange(len(catalog))])) for _ in range(args.library)]
+    books = [{"title": record["title"], "author": record["author"], "year": 0, "genre": "",
+              **({"isbn": record["isbn"]} if i % 2 else {})} for i, record in enumerate(records)]
+    start = time.perf_counter()
+    stats = enrich_books(books, catalog)
+    print(f"Enrich {args.library:,} books: {time.perf_counter() - start:.1f} s "
+          f"({stats['by_isbn']:,} by ISBN, {stats['by_title']:,} by title and author, {stats['fields']:,} fields filled)")
+
+
+# Run the program
+if __name__ == "__main__":
+    main()
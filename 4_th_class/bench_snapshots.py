@@ -0,0 +1,151 @@
+# Library Snapshot Benchmark
+# Compares copying a dict of books for every reader with taking PersistentMap snapshots,
+# and measures how long edits wait while the library store saves in the background
+
+# Import required libraries
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_fuzzy_index import make_books
+from library_store import LibraryStore
+from persistent_map import PersistentMap
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import job_queue
+
+
+# Function to time something in milliseconds
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+# Function to run a snapshot-heavy workload
+def workload(books, edits, snapshot_every, kept, use_map):
+    """
+    Edits random books and takes a snapshot after every snapshot_every edits,
+    keeping the last `kept` snapshots alive (like sessions still drawing a page).
+    Returns the snapshots kept at the end, so their memory can be measured.
+    """
+    rng = random.Random(3)
+    if use_map:
+        library = PersistentMap.from_items((book["id"], book) for book in books)
+    else:
+        library = {book["id"]: book for book in books}
+    snapshots = []
+    for i in range(edits):
+        book_id = rng.randint(1, len(books))
+        book = dict(library[book_id], read=not library[book_id].get("read"))
+        if use_map:
+            library = library.set(book_id, book)
+        else:
+            library[book_id] = book
+        if i % snapshot_every == 0:
+            # A dict has to be copied, or the next edit would change what the reader sees
+            snapshots.append(library if use_map else dict(library))
+            del snapshots[:-kept]
+    return snapshots
+
+
+# Function to measure how long edits take when every edit is saved
+def edit_times(books, edits, background):
+    """
+    Returns (edit times in ms, number of saves). With background=True the store
+    saves snapshots in a job like the app does, otherwise every edit writes the file itself.
+    """
+    with tempfile.TemporaryDirectory() as folder:
+        jobs = job_queue.JobQueue(os.path.join(folder, "jobs.sqlite3")) if background else None
+        store = LibraryStore(os.path.join(folder, "library.txt"), jobs)
+        store.add_books(books, save=False)
+        store.save()
+
+        times = []
+        rng = random.Random(4)
+        for i in range(edits):
+            book = store.get_book(rng.randint(1, len(books)))
+            times.append(timed(store.update_book, book["id"], {"read": not book.get("read")}, book["version"])[0])
+            # Time between clicks, the save job runs meanwhile
+            time.sleep(0.002)
+        if jobs:
+            jobs.wait(store.save_job)
+            saves = sum(1 for job in jobs.recent(edits) if job["kind"] == "save library")
+            jobs.close()
+        else:
+            saves = edits
+    return times, saves
+
+
+# Function to print a list of times
+def show_times(name, times):
+    times = sorted(times)
+    print(f"{name:<44} median {statistics.median(times):8.3f} ms   "
+          f"p99 {times[int(len(times) * 0.99)]:8.3f} ms   max {times[-1]:8.3f} ms")
+
+
+# Main function
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark library snapshots and background saves")
+    parser.add_argument("--books", type=int, default=100_000)
+    parser.add_argument("--edits", type=int, default=20_000)
+    parser.add_argument("--snapshot-every", type=int, default=10, help="Edits between snapshots")
+    parser.add_argument("--kept", type=int, default=20, help="Snapshots kept alive at once")
+    parser.add_argument("--save-edits", type=int, default=500, help="Edits timed with saving")
+    args = parser.parse_args()
+
+    books = make_books(args.books)
+    print(f"{args.books:,} books, {args.edits:,} edits, a snapshot every {args.snapshot_every} edits, "
+          f"{args.kept} kept\n")
+
+    # One snapshot on its own
+    library = {book["id"]: book for book in books}
+    persistent = PersistentMap.from_items(library.items())
+    copy_ms = min(timed(dict, library)[0] for _ in range(5))
+    print(f"{'Snapshot (dict copy)':<34} {copy_ms:8.3f} ms")
+    print(f"{'Snapshot (PersistentMap)':<34} {min(timed(lambda: persistent)[0] for _ in range(5)):8.3f} ms")
+
+    # Single operations
+    rng = random.Random(5)
+    ids = [rng.randint(1, args.books) for _ in range(10000)]
+    for name, function in [("Lookup (dict)", lambda: [library[i] for i in ids]),
+                           ("Lookup (PersistentMap)", lambda: [persistent[i] for i in ids])]:
+        print(f"{name:<34} {min(timed(function)[0] for _ in range(3)) * 1000 / len(ids):8.3f} us")
+
+    def map_sets():
+        result = persistent
+        for i in ids:
+            result = result.set(i, books[0])
+    print(f"{'Edit (PersistentMap)':<34} {min(timed(map_sets)[0] for _ in range(3)) * 1000 / len(ids):8.3f} us")
+    print(f"{'Iterate all (dict)':<34} {min(timed(lambda: sum(1 for _ in library.values()))[0] for _ in range(3)):8.1f} ms")
+    print(f"{'Iterate all (PersistentMap)':<34} "
+          f"{min(timed(lambda: sum(1 for _ in persistent.values()))[0] for _ in range(3)):8.1f} ms")
+    print(f"{'Build from items (PersistentMap)':<34} "
+          f"{timed(PersistentMap.from_items, library.items())[0]:8.1f} ms\n")
+
+    # The whole workload, with the memory the kept snapshots hold on top of the books
+    for use_map, name in [(False, "dict copies"), (True, "PersistentMap")]:
+        elapsed, _ = timed(workload, books, args.edits, args.snapshot_every, args.kept, use_map)
+        tracemalloc.start()
+        snapshots = workload(books, args.edits, args.snapshot_every, args.kept, use_map)
+        memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del snapshots
+        print(f"Workload ({name}):{'':<{16 - len(name)}} {elapsed / 1000:8.2f} s   "
+              f"kept {memory[0] / 1024 ** 2:7.1f} MB   peak {memory[1] / 1024 ** 2:7.1f} MB")
+
+    # Edits that each save the whole library, in the edit or from a snapshot in the background
+    print()
+    for background, name in [(False, "saved in the edit"), (True, "saved in the background")]:
+        times, saves = edit_times(books, args.save_edits if background else max(args.save_edits // 20, 5),
+                                  background)
+        show_times(f"Edit, {name} ({saves} saves)", times)
+
+
+if __name__ == "__main__":
+    main()
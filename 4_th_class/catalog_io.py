@@ -0,0 +1,313 @@
+# Bulk Catalog Import / Export
+# Loads big book catalogs (CSV, JSONL or MARC-like text) into the library
+# and writes the library back out, one row at a time so memory stays small
+
+# Import required libraries
+import argparse
+import csv
+import json
+import os
+import re
+import time
+
+from library_store import LibraryStore, book_key
+
+# How many rows we validate and add to the store at once
+BATCH_SIZE = 10000
+
+# Fields every exported book has, in this order (isbn is left empty when a book has none)
+FIELDS = ["title", "author", "year", "genre", "read", "isbn"]
+
+# MARC-like tags we understand (a tiny subset of real MARC)
+MARC_TAGS = {
+    "020": "isbn",
+    "100": "author",
+    "245": "title",
+    "260": "year",
+    "650": "genre",
+    "590": "read",
+}
+
+# Words that mean "yes, I have read it"
+YES_WORDS = {"yes", "y", "true", "1", "read"}
+
+
+# Function to work out the check digit of an ISBN-13
+def isbn13_check_digit(first_twelve):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first_twelve))
+    return (10 - total % 10) % 10
+
+
+# Function to clean up an ISBN
+def normalize_isbn(text):
+    """
+    Returns the ISBN as 13 digits ("0-261-10221-4" -> "9780261102217"),
+    or None if it isn't a valid ISBN-10 or ISBN-13.
+    """
+    isbn = re.sub(r"[\s-]", "", str(text)).upper()
+
+    # Old 10 digit ISBNs get the 978 prefix and a new check digit
+    if re.fullmatch(r"\d{9}[\dX]", isbn):
+        total = sum((10 - i) * (10 if digit == "X" else int(digit)) for i, digit in enumerate(isbn))
+        if total % 11:
+            return None
+        isbn = "978" + isbn[:9]
+        return isbn + str(isbn13_check_digit(isbn))
+
+    if re.fullmatch(r"\d{13}", isbn) and int(isbn[12]) == isbn13_check_digit(isbn[:12]):
+        return isbn
+    return None
+
+
+# Function to guess the file format from its name
+def guess_format(file_name):
+    """Returns 'csv', 'jsonl' or 'marc' based on the file extension"""
+    extension = os.path.splitext(file_name)[-1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension in (".mrk", ".marc", ".txt"):
+        return "marc"
+    raise ValueError(f"Don't know how to read '{extension}' files. Use --format.")
+
+
+# Function to read CSV rows one by one
+def read_csv(file):
+    """Yields one dict per CSV row"""
+    for row in csv.DictReader(file):
+        yield row
+
+
+# Function to read JSONL rows one by one
+def read_jsonl(file):
+    """Yields one dict per non-empty line (None for lines that aren't valid JSON)"""
+    for line in file:
+        line = line.strip()
+        if line:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield None
+
+
+# Function to read MARC-like records one by one
+def read_marc(file):
+    """
+    Yields one dict per record. Records look like this and end with a blank line:
+        =LDR  00000nam
+        =020  $a9780261102217
+        =100  $aTolkien, J. R. R.
+        =245  $aThe Hobbit
+        =260  $c1937
+        =650  $aFantasy
+        =590  $aread
+    """
+    record = {}
+    for line in file:
+        line = line.rstrip("\n")
+
+        # A blank line ends the record
+        if not line.strip():
+            if record:
+                yield record
+                record = {}
+            continue
+
+        # Lines look like "=245  $aThe Hobbit"
+        tag = line[1:4]
+        field = MARC_TAGS.get(tag)
+        if field is None:
+            continue
+
+        # Take the text after the first subfield code like "$a" or "$c"
+        value = line[4:].strip()
+        if value.startswith("$"):
+            value = value[2:]
+        record[field] = value.strip()
+
+    # Last record may not have a blank line after it
+    if record:
+        yield record
+
+
+# Readers for each format
+READERS = {"csv": read_csv, "jsonl": read_jsonl, "marc": read_marc}
+
+
+# Function to clean up one row
+def normalize_row(row):
+    """Returns a clean book dict, or None if the row is not a valid book"""
+    # Bad JSONL lines come in as None, lines like [1, 2] as other types
+    if not isinstance(row, dict):
+        return None
+
+    title = " ".join(str(row.get("title") or "").split())
+    author = " ".join(str(row.get("author") or "").split())
+
+    # Title and author are required, just like in the add book form
+    if not title or not author:
+        return None
+
+    # Year must be a number ("1937", "1937.0" and "c1937" are all fine)
+    year_text = str(row.get("year") or "").strip().lstrip("c").split(".")[0]
+    try:
+        year = int(year_text)
+    except ValueError:
+        return None
+
+    # Read status can be a real bool or text like "yes"
+    read = row.get("read", False)
+    if not isinstance(read, bool):
+        read = str(read).strip().lower() in YES_WORDS
+
+    book = {
+        "title": title,
+        "author": author,
+        "year": year,
+        "genre": " ".join(str(row.get("genre") or "").split()),
+        "read": read,
+    }
+
+    # ISBN is optional, MARC often adds notes after it ("0261102214 (pbk.)")
+    isbn = " ".join(str(row.get("isbn") or "").split())
+    if isbn:
+        book["isbn"] = normalize_isbn(isbn.split(" (")[0]) or isbn
+    return book
+
+
+# Function to import a catalog file into the store
+def import_catalog(store, file, file_format, batch_size=BATCH_SIZE, on_progress=None):
+    """
+    Reads the file in batches, skips invalid rows and books already in the library,
+    adds the rest to the store and saves once at the end.
+    on_progress(stats) is called after every batch.
+    Returns a stats dict. If the file can't be read to the end (not text, broken
+    CSV quoting...) the books before that point are still saved and stats["error"]
+    says where the import stopped.
+    """
+    stats = {"rows": 0, "added": 0, "duplicates": 0, "invalid": 0, "seconds": 0.0, "rows_per_second": 0.0,
+             "error": None}
+    start_time = time.perf_counter()
+
+    # Keys of books added during this import, so the file can't add the same book twice
+    seen_keys = set()
+
+    # Function to add one batch to the store
+    def flush(batch):
+        # Drop rows that are invalid, already in the library, or repeated in the file
+        new_books = []
+        for row in batch:
+            book = normalize_row(row)
+            if book is None:
+                stats["invalid"] += 1
+                continue
+            key = book_key(book["title"], book["author"])
+            if key in seen_keys or store.find_duplicate(book["title"], book["author"]) is not None:
+                stats["duplicates"] += 1
+                continue
+            seen_keys.add(key)
+            new_books.append(book)
+
+        # One big write per batch, the file is saved only at the end
+        store.add_books(new_books, save=False)
+        stats["added"] += len(new_books)
+
+        # Report progress
+        stats["seconds"] = time.perf_counter() - start_time
+        stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+        if on_progress:
+            on_progress(dict(stats))
+
+    batch = []
+    try:
+        for row in READERS[file_format](file):
+            stats["rows"] += 1
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+    except (ValueError, csv.Error) as error:
+        stats["error"] = f"Stopped after row {stats['rows']}: {error}"
+    flush(batch)
+
+    # Save everything in one go (also when the file stopped early, so nothing is left unsaved)
+    store.save()
+    stats["seconds"] = time.perf_counter() - start_time
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+
+# Function to export the library to a file
+def export_catalog(books, file, file_format):
+    """Writes books one by one in the chosen format and returns how many were written"""
+    count = 0
+
+    if file_format == "csv":
+        writer = csv.DictWriter(file, fieldnames=FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for book in books:
+            writer.writerow(book)
+            count += 1
+
+    elif file_format == "jsonl":
+        for book in books:
+            file.write(json.dumps({field: book[field] for field in FIELDS if field in book}) + "\n")
+            count += 1
+
+    elif file_format == "marc":
+        for book in books:
+            file.write("=LDR  00000nam\n")
+            if book.get("isbn"):
+                file.write(f"=020  $a{book['isbn']}\n")
+            file.write(f"=100  $a{book['author']}\n")
+            file.write(f"=245  $a{book['title']}\n")
+            file.write(f"=260  $c{book['year']}\n")
+            file.write(f"=650  $a{book['genre']}\n")
+            file.write(f"=590  $a{'read' if book['read'] else 'unread'}\n")
+            file.write("\n")
+            count += 1
+
+    else:
+        raise ValueError(f"Unknown format '{file_format}'")
+
+    return count
+
+
+# Function to print import progress on one line
+def print_progress(stats):
+    print(f"\r{stats['rows']} rows read, {stats['added']} added, "
+          f"{stats['duplicates']} duplicates, {stats['invalid']} invalid "
+          f"({stats['rows_per_second']:.0f} rows/sec)", end="", flush=True)
+
+
+# Main function for the command line
+def main():
+    """Command line: python catalog_io.py import|export FILE [--format csv|jsonl|marc]"""
+    parser = argparse.ArgumentParser(description="Bulk import or export the book catalog")
+    parser.add_argument("action", choices=["import", "export"])
+    parser.add_argument("path", help="Catalog file to read or write")
+    parser.add_argument("--format", choices=sorted(READERS), help="File format (guessed from the extension if not given)")
+    parser.add_argument("--library", default="library.txt", help="Library file (default: library.txt)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.format or guess_format(args.path)
+    store = LibraryStore(args.library)
+
+    if args.action == "import":
+        with open(args.path, "r", encoding="utf-8", newline="") as file:
+            stats = import_catalog(store, file, file_format, args.batch_size, on_progress=print_progress)
+        print_progress(stats)
+        if stats["error"]:
+            print(f"\n{stats['error']}")
+        print(f"\nImport finished in {stats['seconds']:.1f} seconds.")
+    else:
+        with open(args.path, "w", encoding="utf-8", newline="") as file:
+            count = export_catalog(store.snapshot().values(), file, file_format)
+        print(f"Exported {count} books to {args.path}")
+
+
+# Run the program
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# Fuzzy Book Index
+# Finds books by title or author even when the words are misspelled ("Tolkein")
+# and spots books that are probably already in the library
+
+# Import required libraries
+import heapq
+import json
+import os
+import re
+import unicodedata
+
+# Longest edit distance we accept between a search word and a library word
+MAX_DISTANCE = 2
+
+# How many results a search returns
+MAX_RESULTS = 10
+
+# Parts of a book that are indexed
+FIELDS = ("title", "author")
+
+# Words at the start of a title that don't matter when looking for duplicates ("The Hobbit" = "Hobbit")
+ARTICLES = {"the", "a", "an"}
+
+
+# Function to split text into normalized words
+def words(text):
+    """Lowercase words without accents or punctuation ("Tolkién, J.R.R." -> tolkien, j, r, r)"""
+    text = unicodedata.normalize("NFKD", str(text).casefold())
+    text = "".join(character for character in text if not unicodedata.combining(character))
+    return re.findall(r"\w+", text)
+
+
+# Function to get a title in the form used to compare titles
+def title_words(title):
+    """Normalized title without a leading article, as one string"""
+    title = words(title)
+    if len(title) > 1 and title[0] in ARTICLES:
+        title = title[1:]
+    return " ".join(title)
+
+
+# Function to decide how many typos a word may have
+def allowed_distance(word):
+    """Short words must match exactly, otherwise "cat" would find every three letter word"""
+    if len(word) <= 3:
+        return 0
+    if len(word) <= 6:
+        return 1
+    return MAX_DISTANCE
+
+
+# Function to get every way of deleting one letter from a word
+def deletions(word):
+    """The keys a word is filed under ("book" -> ook, bok, boo)"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+# Function to measure how different two words are
+def edit_distance(a, b, limit):
+    """
+    Number of inserted, deleted, changed or swapped letters between a and b
+    (optimal string alignment). Stops early and returns limit + 1 once the
+    distance is known to be bigger than limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Only cells at most `limit` away from the diagonal can stay within the limit
+    too_far = limit + 1
+    previous_row = None
+    row = [j if j <= limit else too_far for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        before, previous_row, row = previous_row, row, [too_far] * (len(b) + 1)
+        if i <= limit:
+            row[0] = i
+        for j in range(max(1, i - limit), min(len(b), i + limit) + 1):
+            cost = a[i - 1] != b[j - 1]
+            row[j] = min(previous_row[j] + 1, row[j - 1] + 1, previous_row[j - 1] + cost)
+            # Two letters swapped ("ei" / "ie") count as one edit
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return too_far
+    return min(row[-1], too_far)
+
+
+# The fuzzy index
+class FuzzyIndex:
+    """
+    Word index over book titles and authors that allows typos (SymSpell style).
+
+    Every library word is filed under each one-letter deletion of it. A search
+    word looks itself and its own deletions up both as words and as keys, so
+    two words meet when they are one insert, delete, change or swap apart, and
+    also for many two-edit typos. Found words are checked with edit_distance.
+    """
+
+    def __init__(self):
+        # Book ids for every word, per field: postings["author"]["tolkien"] = {3, 17}
+        self.postings = {field: {} for field in FIELDS}
+
+        # Library words filed under each deletion: keys["tolkin"] = "tolkien", or a list
+        # when several words share the key (most keys have one word, so no list is made for them)
+        self.keys = {}
+
+    # Function to build an index for many books
+    @classmethod
+    def from_books(cls, books):
+        """Builds an index from book dicts that have an "id" """
+        index = cls()
+        for book in books:
+            index.add(book["id"], book["title"], book["author"])
+        return index
+
+    # Function to add a book
+    def add(self, book_id, title, author):
+        for field, text in zip(FIELDS, (title, author)):
+            postings = self.postings[field]
+            for word in set(words(text)):
+                if word not in postings:
+                    postings[word] = set()
+                    if not self._known(word, field):
+                        self._add_word(word)
+                postings[word].add(book_id)
+
+    # Function to remove a book (pass the title and author it was added with)
+    def remove(self, book_id, title, author):
+        for field, text in zip(FIELDS, (title, author)):
+            postings = self.postings[field]
+            for word in set(words(text)):
+                book_ids = postings.get(word)
+                if book_ids is None:
+                    continue
+                book_ids.discard(book_id)
+                if not book_ids:
+                    del postings[word]
+                    if not self._known(word, field):
+                        self._remove_word(word)
+
+    # Function to find books whose field is close to the search text
+    def search(self, field, text, limit=MAX_RESULTS, within=None):
+        """
+        Returns [(book_id, distance)] for books where every search word has a
+        close word in the field, fewest typos first. Only books in `within`
+        are considered if it's given. limit=None returns every match.
+        """
+        postings = self.postings[field]
+
+        # Close library words for each search word, as {word: distance}
+        matches = []
+        for word in dict.fromkeys(words(text)):
+            close = self.close_words(word, field)
+            if not close:
+                return []
+            matches.append(close)
+        if not matches:
+            return []
+
+        # Start from the search word with the fewest books and check the others per book
+        matches.sort(key=lambda close: sum(len(postings[word]) for word in close))
+        distances = {}
+        for word, distance in matches[0].items():
+            for book_id in postings[word]:
+                if within is not None and book_id not in within:
+                    continue
+                if distance < distances.get(book_id, MAX_DISTANCE + 1):
+                    distances[book_id] = distance
+        for close in matches[1:]:
+            for book_id in list(distances):
+                best = min((distance for word, distance in close.items() if book_id in postings[word]), default=None)
+                if best is None:
+                    del distances[book_id]
+                else:
+                    distances[book_id] += best
+
+        # Fewest typos first, then oldest book first
+        if limit is None:
+            return sorted(distances.items(), key=lambda item: (item[1], item[0]))
+        return heapq.nsmallest(limit, distances.items(), key=lambda item: (item[1], item[0]))
+
+    # Function to find library words close to one search word
+    def close_words(self, word, field):
+        """Returns {library word: distance} for words used in this field"""
+        limit = allowed_distance(word)
+        postings = self.postings[field]
+        if limit == 0:
+            return {word: 0} if word in postings else {}
+
+        # The word itself, and words one letter longer or shorter, need no distance check
+        close = {word: 0} if word in postings else {}
+        word_deletions = deletions(word)
+        for candidate in (*word_deletions, *self._filed(word)):
+            if candidate in postings:
+                close.setdefault(candidate, 1)
+
+        # Words that share a deletion with it are one or two edits away
+        for key in word_deletions:
+            for candidate in self._filed(key):
+                if candidate in postings and candidate not in close:
+                    distance = edit_distance(word, candidate, limit)
+                    if distance <= limit:
+                        close[candidate] = distance
+        return close
+
+    # Function to find books that are probably the same as a new one
+    def likely_duplicates(self, title, author, get_book, limit=5):
+        """
+        Returns ids of books by a matching author whose whole title is at most
+        a couple of typos away. get_book(book_id) returns the book dict.
+        """
+        by_author = {book_id for book_id, _ in self.search("author", author, limit=None)}
+        if not by_author:
+            return []
+
+        title_text = title_words(title)
+        limit_distance = max(1, min(MAX_DISTANCE, len(title_text) // 5))
+        duplicates = []
+        for book_id, _ in self.search("title", title_text, limit=None, within=by_author):
+            book = get_book(book_id)
+            if book is None:
+                continue
+            book_title = title_words(book["title"])
+            if book_title == title_text or edit_distance(title_text, book_title, limit_distance) <= limit_distance:
+                duplicates.append(book_id)
+                if len(duplicates) >= limit:
+                    break
+        return duplicates
+
+    # Function to save the index next to the library
+    def save(self, path, library_file):
+        """
+        Writes the word lists to a JSON file together with the library file's
+        size and modified time, so load() can tell if the library changed since.
+        """
+        self.save_data(self.to_data(), path, library_file)
+
+    # Function to copy the word lists, so they can be saved while the index keeps changing
+    def to_data(self):
+        return {field: {word: list(book_ids) for word, book_ids in postings.items()}
+                for field, postings in self.postings.items()}
+
+    # Function to save word lists from to_data() (see save)
+    @staticmethod
+    def save_data(postings, path, library_file):
+        library_stat = os.stat(library_file)
+        data = {
+            "library": [library_stat.st_size, library_stat.st_mtime_ns],
+            "postings": postings,
+        }
+        temp_name = path + ".tmp"
+        with open(temp_name, "w") as file:
+            file.write(json.dumps(data))
+        os.replace(temp_name, path)
+
+    # Function to load a saved index
+    @classmethod
+    def load(cls, path, library_file):
+        """Returns the saved index, or None if there is none or it doesn't match the library file"""
+        try:
+            library_stat = os.stat(library_file)
+            with open(path, "r") as file:
+                data = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if data.get("library") != [library_stat.st_size, library_stat.st_mtime_ns]:
+            return None
+
+        index = cls()
+        for field, postings in data["postings"].items():
+            index.postings[field] = {word: set(book_ids) for word, book_ids in postings.items()}
+        for word in set().union(*index.postings.values()):
+            index._add_word(word)
+        return index
+
+    # Helper to get the words filed under a key
+    def _filed(self, key):
+        filed = self.keys.get(key, ())
+        return (filed,) if isinstance(filed, str) else filed
+
+    # Helper to check if another field still uses a word
+    def _known(self, word, except_field):
+        return any(word in postings for field, postings in self.postings.items() if field != except_field)
+
+    # Helper to file a new word under its deletions
+    def _add_word(self, word):
+        # Short words are only ever matched exactly, so they don't need keys
+        if len(word) <= 3:
+            return
+        keys = self.keys
+        for key in deletions(word):
+            filed = keys.get(key)
+            if filed is None:
+                keys[key] = word
+            elif isinstance(filed, str):
+                keys[key] = [filed, word]
+            else:
+                filed.append(word)
+
+    # Helper to take a word that's no longer used out of its deletions
+    def _remove_word(self, word):
+        if len(word) <= 3:
+            return
+        for key in deletions(word):
+            filed = self.keys.get(key)
+            if filed == word:
+                del self.keys[key]
+            elif isinstance(filed, list) and word in filed:
+                filed.remove(word)
+                if len(filed) == 1:
+                    self.keys[key] = filed[0]
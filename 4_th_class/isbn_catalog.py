@@ -0,0 +1,310 @@
+# Offline ISBN Catalog
+# Fills in book details from an ISBN using a local copy of a big catalog dump.
+# The dump is converted once into one file with every ISBN sorted, so a lookup is a
+# binary search over a memory-mapped array and nothing is loaded into memory up front
+
+# Import required libraries
+import argparse
+import array
+import bisect
+import heapq
+import json
+import mmap
+import os
+import re
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+from catalog_io import READERS, guess_format, isbn13_check_digit, normalize_isbn
+from library_store import book_key
+
+# File the converted catalog is kept in
+CATALOG_FILE = "isbn_catalog.bin"
+
+# File layout: header, sorted ISBNs (8 bytes each), record offsets (8 bytes each), records (one JSON line each)
+MAGIC = b"ISBNCAT1"
+HEADER = struct.Struct("<8sQ8s")
+
+# How many (ISBN, offset) pairs we sort in memory at once while converting
+RUN_SIZE = 1_000_000
+
+# Details that can be filled in from the catalog
+DETAILS = ["title", "author", "year", "genre"]
+
+
+# Function to turn one row of a dump into a catalog record
+def catalog_record(row):
+    """Returns (isbns, record) or None if the row has no valid ISBN or no title"""
+    isbns = []
+    for part in re.split(r"[;,|]", str(row.get("isbn") or "")):
+        isbn = normalize_isbn(part)
+        if isbn and isbn not in isbns:
+            isbns.append(isbn)
+    title = " ".join(str(row.get("title") or "").split())
+    if not isbns or not title:
+        return None
+
+    # The year is optional here, dumps often don't have one ("1937", "1937.0" and "c1937" are all fine)
+    try:
+        year = int(str(row.get("year") or "").strip().lstrip("c").split(".")[0])
+    except ValueError:
+        year = None
+
+    return isbns, {
+        "isbn": isbns[0],
+        "title": title,
+        "author": " ".join(str(row.get("author") or "").split()),
+        "year": year,
+        "genre": " ".join(str(row.get("genre") or "").split()),
+    }
+
+
+# Function to write one sorted run of (ISBN, offset) pairs to a temp file
+def write_run(folder, pairs):
+    pairs.sort()
+    values = array.array("Q")
+    for isbn, offset in pairs:
+        values.append(isbn)
+        values.append(offset)
+    path = os.path.join(folder, f"run{len(os.listdir(folder))}")
+    with open(path, "wb") as file:
+        values.tofile(file)
+    return path
+
+
+# Function to read a run back one pair at a time
+def read_run(path, chunk_pairs=65536):
+    with open(path, "rb") as file:
+        while True:
+            values = array.array("Q")
+            values.frombytes(file.read(16 * chunk_pairs))
+            if not values:
+                return
+            for i in range(0, len(values), 2):
+                yield values[i], values[i + 1]
+
+
+# Function to convert a catalog dump into the lookup file
+def build_catalog(dump_file, file_format, output_path=CATALOG_FILE, run_size=RUN_SIZE, on_progress=None):
+    """
+    Reads the dump once, writing every record to a data file and sorting the
+    (ISBN, offset) pairs in runs of run_size, then merges the runs into the
+    sorted ISBN array. Memory stays the same however big the dump is.
+    on_progress(stats) is called after every run. Returns a stats dict.
+    """
+    stats = {"rows": 0, "records": 0, "isbns": 0, "invalid": 0, "duplicates": 0, "seconds": 0.0}
+    start_time = time.perf_counter()
+    folder = os.path.dirname(os.path.abspath(output_path))
+
+    with tempfile.TemporaryDirectory(dir=folder) as temp_folder:
+        runs_folder = os.path.join(temp_folder, "runs")
+        os.mkdir(runs_folder)
+        data_path = os.path.join(temp_folder, "data")
+
+        # ---- Pass 1: records to the data file, sorted runs of (ISBN, offset) ----
+        pairs = []
+        offset = 0
+        with open(data_path, "wb") as data_file:
+            for row in READERS[file_format](dump_file):
+                stats["rows"] += 1
+                parsed = catalog_record(row)
+                if parsed is None:
+                    stats["invalid"] += 1
+                    continue
+                isbns, record = parsed
+                line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+                data_file.write(line)
+                pairs.extend((int(isbn), offset) for isbn in isbns)
+                offset += len(line)
+                stats["records"] += 1
+
+                if len(pairs) >= run_size:
+                    write_run(runs_folder, pairs)
+                    pairs = []
+                    stats["seconds"] = time.perf_counter() - start_time
+                    if on_progress:
+                        on_progress(dict(stats))
+        if pairs:
+            write_run(runs_folder, pairs)
+        pairs = None
+
+        # ---- Pass 2: merge the runs, keeping the first record for an ISBN ----
+        keys_path = os.path.join(temp_folder, "keys")
+        offsets_path = os.path.join(temp_folder, "offsets")
+        runs = [read_run(os.path.join(runs_folder, name)) for name in os.listdir(runs_folder)]
+        last_isbn = None
+        keys = array.array("Q")
+        offsets = array.array("Q")
+        with open(keys_path, "wb") as keys_file, open(offsets_path, "wb") as offsets_file:
+            for isbn, record_offset in heapq.merge(*runs):
+                if isbn == last_isbn:
+                    stats["duplicates"] += 1
+                    continue
+                last_isbn = isbn
+                keys.append(isbn)
+                offsets.append(record_offset)
+                if len(keys) >= 65536:
+                    keys.tofile(keys_file)
+                    offsets.tofile(offsets_file)
+                    stats["isbns"] += len(keys)
+                    keys = array.array("Q")
+                    offsets = array.array("Q")
+            keys.tofile(keys_file)
+            offsets.tofile(offsets_file)
+            stats["isbns"] += len(keys)
+
+        # ---- One file: header, ISBNs, offsets, records (swapped in at the end) ----
+        temp_name = output_path + ".tmp"
+        with open(temp_name, "wb") as output:
+            output.write(HEADER.pack(MAGIC, stats["isbns"], sys.byteorder.encode()))
+            for path in (keys_path, offsets_path, data_path):
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, output, 1024 * 1024)
+        os.replace(temp_name, output_path)
+
+    stats["seconds"] = time.perf_counter() - start_time
+    return stats
+
+
+# The converted catalog
+class IsbnCatalog:
+    """
+    Memory-mapped catalog file. Opening it only reads the header, the operating
+    system pages in the parts a binary search touches.
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        self.path = path
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count, byte_order = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"'{path}' is not an ISBN catalog file.")
+        if byte_order.rstrip(b"\0").decode() != sys.byteorder:
+            self.close()
+            raise ValueError(f"'{path}' was built on a different kind of computer. Please build it again here.")
+
+        # The ISBN and offset arrays straight from the mapped file, no copies
+        self.count = count
+        self.view = memoryview(self.map)
+        self.keys = self.view[HEADER.size:HEADER.size + 8 * count].cast("Q")
+        self.offsets = self.view[HEADER.size + 8 * count:HEADER.size + 16 * count].cast("Q")
+        self.data_start = HEADER.size + 16 * count
+
+    def __len__(self):
+        return self.count
+
+    # Function to find a book by ISBN
+    def lookup(self, isbn):
+        """Returns the catalog record (title, author, year, genre, isbn) or None"""
+        isbn = normalize_isbn(isbn)
+        if isbn is None:
+            return None
+        key = int(isbn)
+        i = bisect.bisect_left(self.keys, key)
+        if i == self.count or self.keys[i] != key:
+            return None
+        record = self._record_at(self.data_start + self.offsets[i])
+        record["isbn"] = isbn
+        return record
+
+    # Function to go through every record once, in file order (uses the map's position, so one pass at a time)
+    def records(self):
+        self.map.seek(self.data_start)
+        for line in iter(self.map.readline, b""):
+            yield json.loads(line)
+
+    # Function to close the file (the arrays can't be used afterwards)
+    def close(self):
+        for view in (getattr(self, "keys", None), getattr(self, "offsets", None), getattr(self, "view", None)):
+            if view is not None:
+                view.release()
+        self.map.close()
+        self.file.close()
+
+    # Helper to read the JSON line that starts at a position
+    def _record_at(self, position):
+        return json.loads(self.map[position:self.map.find(b"\n", position)])
+
+
+# Function to fill in missing details of books from the catalog
+def enrich_books(books, catalog):
+    """
+    Fills in empty details (never changes ones the user typed) in one go:
+    books with an ISBN are looked up directly, the rest are matched by title
+    and author during a single pass over the catalog. Changes the book dicts
+    and returns a stats dict.
+    """
+    stats = {"books": len(books), "by_isbn": 0, "by_title": 0, "fields": 0}
+
+    # Function to copy details the book doesn't have yet
+    def fill(book, record):
+        filled = 0
+        for field in DETAILS + ["isbn"]:
+            if not book.get(field) and record.get(field):
+                book[field] = record[field]
+                filled += 1
+        stats["fields"] += filled
+        return filled
+
+    # Books we know the ISBN of
+    wanted = {}
+    for book in books:
+        record = catalog.lookup(book["isbn"]) if book.get("isbn") else None
+        if record:
+            stats["by_isbn"] += bool(fill(book, record))
+        elif not book.get("isbn"):
+            wanted.setdefault(book_key(book["title"], book["author"]), []).append(book)
+
+    # Everything else in one pass over the catalog, stopping once every book is found
+    if wanted:
+        for record in catalog.records():
+            matches = wanted.pop(book_key(record["title"], record["author"]), None)
+            if matches:
+                for book in matches:
+                    stats["by_title"] += bool(fill(book, record))
+                if not wanted:
+                    break
+    return stats
+
+
+# Main function for the command line
+def main():
+    """Command line: python isbn_catalog.py build DUMP | lookup ISBN..."""
+    parser = argparse.ArgumentParser(description="Build or search the offline ISBN catalog")
+    parser.add_argument("--catalog", default=CATALOG_FILE, help=f"Catalog file (default: {CATALOG_FILE})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Convert a catalog dump (needs an isbn column)")
+    build_parser.add_argument("path", help="CSV, JSONL or MARC-like dump")
+    build_parser.add_argument("--format", choices=sorted(READERS), help="File format (guessed from the extension if not given)")
+    build_parser.add_argument("--run-size", type=int, default=RUN_SIZE)
+
+    lookup_parser = commands.add_parser("lookup", help="Look up ISBNs")
+    lookup_parser.add_argument("isbns", nargs="+")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        def show_progress(stats):
+            print(f"\r{stats['rows']} rows read, {stats['records']} records", end="", flush=True)
+
+        with open(args.path, "r", encoding="utf-8", newline="") as file:
+            stats = build_catalog(file, args.format or guess_format(args.path), args.catalog, args.run_size, show_progress)
+        print(f"\r{stats['rows']} rows read, {stats['records']} records, {stats['isbns']} ISBNs "
+              f"({stats['invalid']} rows without an ISBN or title, {stats['duplicates']} repeated ISBNs) "
+              f"in {stats['seconds']:.1f} seconds")
+    else:
+        catalog = IsbnCatalog(args.catalog)
+        for isbn in args.isbns:
+            record = catalog.lookup(isbn)
+            print(json.dumps(record, ensure_ascii=False) if record else f"{isbn}: not found")
+
+
+# Run the program
+if __name__ == "__main__":
+    main()
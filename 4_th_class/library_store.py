@@ -0,0 +1,333 @@
+# Shared Library Store
+# One copy of the library that every Streamlit session reads and writes
+
+# Import required libraries
+import json
+import os
+import threading
+from collections import deque
+
+from fuzzy_index import FuzzyIndex
+from persistent_map import PersistentMap
+
+# How many recent changes we remember for sessions that want to catch up
+MAX_CHANGES = 1000
+
+
+# Function to make the key used to spot duplicate books
+def book_key(title, author):
+    """Same title and author (ignoring case and extra spaces) means same book"""
+    title = " ".join(str(title).split()).casefold()
+    author = " ".join(str(author).split()).casefold()
+    return (title, author)
+
+
+# Error raised when someone edits a book that changed since they last saw it
+class VersionConflict(Exception):
+    """Raised when a book was changed by someone else before our edit"""
+    pass
+
+
+# Simple reader-writer lock
+class ReadWriteLock:
+    """Lets many readers in at once, but only one writer at a time"""
+
+    def __init__(self):
+        # Condition used to wait for readers/writers to finish
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        with self._condition:
+            # Wait while a writer is busy or waiting (so writers don't starve)
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_read(self):
+        with self._condition:
+            self._readers -= 1
+            # Wake up a writer if we were the last reader
+            if self._readers == 0:
+                self._condition.notify_all()
+
+    def acquire_write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            # Wait until nobody else is reading or writing
+            while self._writer or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writer = True
+
+    def release_write(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    # Small helpers so we can use "with lock.read():"
+    def read(self):
+        return _LockContext(self.acquire_read, self.release_read)
+
+    def write(self):
+        return _LockContext(self.acquire_write, self.release_write)
+
+
+# Context manager used by ReadWriteLock.read() and ReadWriteLock.write()
+class _LockContext:
+    def __init__(self, acquire, release):
+        self._acquire = acquire
+        self._release = release
+
+    def __enter__(self):
+        self._acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._release()
+
+
+# The shared library store
+class LibraryStore:
+    """Keeps the books in memory once per process and saves them to a file"""
+
+    def __init__(self, file_name, jobs=None):
+        self.file_name = file_name
+        self.lock = ReadWriteLock()
+
+        # Job queue for saving in the background (see shared/job_queue.py), None saves right away
+        self.jobs = jobs
+        self.save_job = None
+        self._save_pending = False
+
+        # Only one save writes the files at a time, and never an older snapshot over a newer one
+        self._save_lock = threading.Lock()
+        self._saved_version = -1
+
+        # Books are kept by id so edits don't depend on list positions. The map is never
+        # changed in place, every change swaps in a new one, so readers can hold on to it
+        self.books = PersistentMap()
+        self.next_id = 1
+
+        # Index from book_key(title, author) to book id, used to find duplicates
+        self.index = {}
+
+        # Typo-tolerant index over titles and authors, saved next to the library file
+        self.index_file = file_name + ".index"
+        self.fuzzy_index = FuzzyIndex()
+
+        # Version of the whole library, goes up by one on every change
+        self.version = 0
+
+        # Recent changes as (version, action, book_id) for session refresh
+        self.changes = deque(maxlen=MAX_CHANGES)
+
+        self.load()
+
+    # Function to load the library from the file
+    def load(self):
+        """Loads books from the file (same JSON list format as before)"""
+        books = []
+        if os.path.exists(self.file_name):
+            try:
+                with open(self.file_name, "r") as file:
+                    books = json.load(file)
+            except:
+                # If there's an error, start with an empty library
+                books = []
+
+        with self.lock.write():
+            self.index = {}
+            ids_added = False
+            # Go past every id in the file first, so new ids can't clash with a later book's
+            self.next_id = max([self.next_id] + [book["id"] + 1 for book in books if "id" in book])
+            for book in books:
+                # Books written by older versions don't have an id yet
+                if "id" not in book:
+                    book["id"] = self.next_id
+                    self.next_id += 1
+                    ids_added = True
+                book.setdefault("version", 1)
+                self.index[book_key(book["title"], book["author"])] = book["id"]
+            self.books = PersistentMap.from_items((book["id"], book) for book in books)
+
+            # Use the saved fuzzy index if it belongs to this library file, otherwise build it
+            self.fuzzy_index = FuzzyIndex.load(self.index_file, self.file_name)
+            if self.fuzzy_index is None:
+                self.fuzzy_index = FuzzyIndex.from_books(self.books.values())
+                # Ids given out just now aren't in the file yet, so only save the index if every book had one
+                if books and not ids_added:
+                    self.fuzzy_index.save(self.index_file, self.file_name)
+
+    # Function to save the library to the file
+    def save(self):
+        """Saves the library (safe to call from outside while other sessions are editing)"""
+        with self.lock.read():
+            snapshot = self._snapshot_for_save()
+        self._write(*snapshot)
+
+    # Helper to take what a save writes (call only while holding a lock)
+    def _snapshot_for_save(self):
+        """The books are a free snapshot, the fuzzy index's word lists are copied"""
+        return self.version, self.books, self.fuzzy_index.to_data()
+
+    # Helper that does the actual saving (no lock needed, edits can go on meanwhile)
+    def _write(self, version, books, index_data):
+        """Writes all books to a temp file and swaps it in, so a crash can't leave half a file"""
+        with self._save_lock:
+            # A save that started later already wrote a newer library
+            if version < self._saved_version:
+                return
+            temp_name = self.file_name + ".tmp"
+            with open(temp_name, "w") as file:
+                json.dump(list(books.values()), file)
+            os.replace(temp_name, self.file_name)
+            FuzzyIndex.save_data(index_data, self.index_file, self.file_name)
+            self._saved_version = version
+
+    # Helper to save after a change (call only while holding the write lock)
+    def _save_soon(self):
+        """Saves right away, or in a background job so the edit doesn't wait for the whole file to be written"""
+        if self.jobs is None:
+            self._write(*self._snapshot_for_save())
+            return
+        # Changes made before a waiting save starts are written by that save
+        if not self._save_pending:
+            self._save_pending = True
+            self.save_job = self.jobs.submit("save library", self._background_save)
+
+    # Helper run by the save job
+    def _background_save(self, job):
+        with self.lock.read():
+            self._save_pending = False
+            snapshot = self._snapshot_for_save()
+        self._write(*snapshot)
+
+    # Function to get the whole library as it is right now
+    def snapshot(self):
+        """
+        Returns the books as a PersistentMap from id to book. It costs nothing
+        and never changes, later edits make a new map, so it can be read
+        (or saved, or exported) without any lock while others edit.
+        """
+        return self.books
+
+    # Function to get all books
+    def get_books(self):
+        """Returns a list of all books (the dicts are shared, don't change them)"""
+        return list(self.books.values())
+
+    # Function to get one book by id
+    def get_book(self, book_id):
+        return self.books.get(book_id)
+
+    # Function to find a book with the same title and author
+    def find_duplicate(self, title, author):
+        """Returns the id of a book with the same title and author, or None"""
+        with self.lock.read():
+            return self.index.get(book_key(title, author))
+
+    # Function to find books that are probably the same as a new one
+    def find_similar(self, title, author):
+        """Returns books by a matching author with nearly the same title (typos allowed)"""
+        with self.lock.read():
+            return [self.books[book_id] for book_id in
+                    self.fuzzy_index.likely_duplicates(title, author, self.books.get)]
+
+    # Function to search with typos allowed
+    def fuzzy_search(self, field, text):
+        """Returns the books whose title or author (field) is closest to the text, best first"""
+        with self.lock.read():
+            return [self.books[book_id] for book_id, _ in self.fuzzy_index.search(field, text)]
+
+    # Function to add a book
+    def add_book(self, book):
+        """Adds a new book and returns its id"""
+        with self.lock.write():
+            book_id = self._insert(book)
+            self._save_soon()
+            return book_id
+
+    # Function to add many books in one go
+    def add_books(self, books, save=True):
+        """
+        Adds a batch of books while holding the lock once and returns their ids.
+        Pass save=False when adding lots of batches and call save() at the end.
+        """
+        with self.lock.write():
+            book_ids = [self._insert(book) for book in books]
+            if save:
+                self._save_soon()
+            return book_ids
+
+    # Function to update a book
+    def update_book(self, book_id, changes, expected_version):
+        """Changes some fields of a book if nobody changed it since expected_version"""
+        with self.lock.write():
+            old_book = self._check_version(book_id, expected_version)
+
+            # Make a new dict so readers holding the old one aren't affected
+            book = dict(old_book)
+            book.update(changes)
+            book["id"] = book_id
+            book["version"] = expected_version + 1
+            self.index.pop(book_key(old_book["title"], old_book["author"]), None)
+            self.books = self.books.set(book_id, book)
+            self.index[book_key(book["title"], book["author"])] = book_id
+            self.fuzzy_index.remove(book_id, old_book["title"], old_book["author"])
+            self.fuzzy_index.add(book_id, book["title"], book["author"])
+            self._record_change("updated", book_id)
+            self._save_soon()
+
+    # Function to remove a book
+    def remove_book(self, book_id, expected_version):
+        """Removes a book if nobody changed it since expected_version"""
+        with self.lock.write():
+            book = self._check_version(book_id, expected_version)
+            self.books = self.books.delete(book_id)
+            if self.index.get(book_key(book["title"], book["author"])) == book_id:
+                del self.index[book_key(book["title"], book["author"])]
+            self.fuzzy_index.remove(book_id, book["title"], book["author"])
+            self._record_change("removed", book_id)
+            self._save_soon()
+
+    # Function to get changes a session hasn't seen yet
+    def changes_since(self, version):
+        """
+        Returns (current_version, changes) where changes is a list of
+        (version, action, book_id) newer than the given version.
+        changes is None if the version is too old and the session should reload everything.
+        """
+        with self.lock.read():
+            if version == self.version:
+                return self.version, []
+            if self.changes and version < self.changes[0][0] - 1:
+                return self.version, None
+            return self.version, [change for change in self.changes if change[0] > version]
+
+    # Helper to add one book (call only while holding the write lock)
+    def _insert(self, book):
+        book = dict(book)
+        book["id"] = self.next_id
+        book["version"] = 1
+        self.next_id += 1
+        self.books = self.books.set(book["id"], book)
+        self.index[book_key(book["title"], book["author"])] = book["id"]
+        self.fuzzy_index.add(book["id"], book["title"], book["author"])
+        self._record_change("added", book["id"])
+        return book["id"]
+
+    # Helper to check that a book still has the version the caller saw
+    def _check_version(self, book_id, expected_version):
+        book = self.books.get(book_id)
+        if book is None:
+            raise VersionConflict("This book was removed by someone else.")
+        if book["version"] != expected_version:
+            raise VersionConflict("This book was changed by someone else. Please reload and try again.")
+        return book
+
+    # Helper to remember a change (call only while holding the write lock)
+    def _record_change(self, action, book_id):
+        self.version += 1
+        self.changes.append((self.version, action, book_id))
@@ -4,13 +4,39 @@
 # Import the json module to save and load data
 import json
 import os
+import sys
+import time
+import shlex
+import argparse
+
+from fuzzy_index import FuzzyIndex
+from isbn_catalog import CATALOG_FILE, IsbnCatalog, enrich_books, normalize_isbn
 
 # List to store all books
 books = []
 
+# Books by id, and the id the next new book gets
+books_by_id = {}
+next_id = 1
+
+# Typo-tolerant index over titles and authors, saved next to the library file
+fuzzy_index = FuzzyIndex()
+
+# Offline ISBN catalog (opened the first time it's needed)
+catalog_file = CATALOG_FILE
+catalog = None
+
 # File to save the library data
 file_name = "library.txt"
 
+# Autosave settings: save after this many changes or this many seconds
+autosave_every = 1
+autosave_seconds = 60
+
+# Number of changes since the last save, and when we last saved
+unsaved_changes = 0
+last_save_time = time.time()
+
 # Function to display the main menu
 def show_menu():
     """Shows the main menu options to the user"""
@@ -31,37 +57,107 @@ def add_book():
     """Asks user for book details and adds it to the library"""
     print("\n----- Add a Book -----")
     
-    # Get book details from user
-    title = input("Enter the book title: ")
-    author = input("Enter the author: ")
+    # Fill in the details from the ISBN catalog if we can
+    isbn = input("Enter the ISBN (or press Enter to type the details): ").strip()
+    details = lookup_isbn(isbn) if isbn else None
+    if details:
+        print(f"Found: {details['title']} by {details['author']} ({details['year']}) - {details['genre']}")
+        if input("Use these details? (yes/no): ").lower() not in ["yes", "y"]:
+            details = None
+    details = details or {}
+    
+    # Get book details from user (only the ones the catalog didn't have)
+    title = details.get("title") or input("Enter the book title: ")
+    author = details.get("author") or input("Enter the author: ")
     
     # Make sure year is a valid number
-    year = 0
+    year = details.get("year") or 0
     while year == 0:
         try:
             year = int(input("Enter the publication year: "))
         except:
             print("Please enter a valid year (number only)")
     
-    genre = input("Enter the genre: ")
+    genre = details.get("genre") or input("Enter the genre: ")
+    
+    # Warn if we probably have this book already (typos allowed)
+    if warn_about_duplicates(title, author):
+        answer = input("Add it anyway? (yes/no): ")
+        if answer.lower() not in ["yes", "y"]:
+            print("Book not added.")
+            return
     
     # Check if book is read
     read_answer = input("Have you read this book? (yes/no): ")
     # Convert yes/no to True/False
     is_read = read_answer.lower() in ["yes", "y"]
     
+    # Add the book to our list
+    add_book_record(title, author, year, genre, is_read, isbn)
+    print("Book added successfully!")
+    autosave()
+
+# Function to print books that are probably the same as a new one
+def warn_about_duplicates(title, author):
+    """Prints likely duplicates of this book and returns True if there were any"""
+    duplicates = fuzzy_index.likely_duplicates(title, author, books_by_id.get)
+    if duplicates:
+        print("This looks like a book you already have:")
+        for book_id in duplicates:
+            book = books_by_id[book_id]
+            print(f"  {book['title']} by {book['author']} ({book['year']})")
+    return bool(duplicates)
+
+# Function to open the offline ISBN catalog
+def open_catalog():
+    """Returns the catalog, or None if it hasn't been built yet"""
+    global catalog
+    
+    # Opening the catalog only maps the file, so it's quick even for a huge catalog
+    if catalog is None:
+        if not os.path.exists(catalog_file):
+            print(f"No ISBN catalog found ({catalog_file}). Build one with: python isbn_catalog.py build DUMP")
+            return None
+        catalog = IsbnCatalog(catalog_file)
+    return catalog
+
+# Function to look up an ISBN in the offline catalog
+def lookup_isbn(isbn):
+    """Returns the catalog details for the ISBN, or None (and says why)"""
+    if normalize_isbn(isbn) is None:
+        print(f"'{isbn}' is not a valid ISBN.")
+        return None
+    if open_catalog() is None:
+        return None
+    
+    details = catalog.lookup(isbn)
+    if details is None:
+        print(f"ISBN {isbn} is not in the catalog.")
+    return details
+
+# Function to add a book without asking questions
+def add_book_record(title, author, year, genre, is_read, isbn=None):
+    """Adds a book with the given details to the library"""
+    global next_id
+    
     # Create a dictionary to store book info
     book = {
+        "id": next_id,
         "title": title,
         "author": author,
         "year": year,
         "genre": genre,
         "read": is_read
     }
+    if isbn:
+        book["isbn"] = normalize_isbn(isbn) or isbn
+    next_id += 1
     
-    # Add the book to our list
+    # Add the book to our list and the indexes
     books.append(book)
-    print("Book added successfully!")
+    books_by_id[book["id"]] = book
+    fuzzy_index.add(book["id"], title, author)
+    record_change()
 
 # Function to remove a book
 def remove_book():
@@ -71,22 +167,29 @@ def remove_book():
     # Get the title to remove
     title = input("Enter the title of the book to remove: ")
     
-    # Keep track if we found the book
-    found = False
-    
+    # Remove it and tell the user what happened
+    if remove_book_by_title(title):
+        print("Book removed successfully!")
+        autosave()
+    else:
+        print("Book not found. Nothing removed.")
+
+# Function to remove a book without asking questions
+def remove_book_by_title(title):
+    """Removes the first book with this title, returns True if one was removed"""
     # Loop through books to find the one to remove
     for i in range(len(books)):
         # Check if this is the book we want to remove
         if books[i]["title"].lower() == title.lower():
             # Remove the book
-            del books[i]
-            print("Book removed successfully!")
-            found = True
-            break
+            book = books.pop(i)
+            del books_by_id[book["id"]]
+            fuzzy_index.remove(book["id"], book["title"], book["author"])
+            record_change()
+            return True
     
-    # If we didn't find the book
-    if not found:
-        print("Book not found. Nothing removed.")
+    # We didn't find the book
+    return False
 
 # Function to search for books
 def search_book():
@@ -99,40 +202,40 @@ def search_book():
     # Get search type
     search_choice = input("Enter your choice (1-2): ")
     
-    # List to store matching books
-    found_books = []
-    
     # Search by title
     if search_choice == "1":
-        title = input("Enter the title: ")
-        
-        # Look through all books
-        for book in books:
-            # Check if title matches (ignore case)
-            if title.lower() in book["title"].lower():
-                found_books.append(book)
-        
         search_type = "title"
-        search_term = title
+        search_term = input("Enter the title: ")
     
     # Search by author
     elif search_choice == "2":
-        author = input("Enter the author: ")
-        
-        # Look through all books
-        for book in books:
-            # Check if author matches (ignore case)
-            if author.lower() in book["author"].lower():
-                found_books.append(book)
-        
         search_type = "author"
-        search_term = author
+        search_term = input("Enter the author: ")
     
     # Invalid choice
     else:
         print("Invalid choice.")
         return
     
+    show_search_results(search_type, search_term, find_books(search_type, search_term))
+
+# Function to find books without asking questions
+def find_books(search_type, search_term):
+    """Returns books whose title or author (search_type) contains the search term"""
+    # List to store matching books
+    found_books = []
+    
+    # Look through all books
+    for book in books:
+        # Check if the title or author matches (ignore case)
+        if search_term.lower() in book[search_type].lower():
+            found_books.append(book)
+    
+    return found_books
+
+# Function to print search results
+def show_search_results(search_type, search_term, found_books):
+    """Prints the books found by a search"""
     # Display results
     if found_books:
         print(f"\nMatching Books for {search_type} '{search_term}':")
@@ -142,6 +245,14 @@ def search_book():
             print(f"{i+1}. {book['title']} by {book['author']} ({book['year']}) - {book['genre']} - {read_status}")
     else:
         print(f"No books found matching {search_type} '{search_term}'.")
+        
+        # Maybe the search term has a typo
+        suggestions = fuzzy_index.search(search_type, search_term)
+        if suggestions:
+            print("Did you mean:")
+            for book_id, _ in suggestions:
+                book = books_by_id[book_id]
+                print(f"  {book['title']} by {book['author']} ({book['year']})")
 
 # Function to display all books
 def display_books():
@@ -189,10 +300,54 @@ def display_stats():
 # Function to save library to file
 def save_library():
     """Saves the library to a file"""
-    # Open file for writing
-    with open(file_name, "w") as file:
+    global unsaved_changes, last_save_time
+    
+    # Write to a temp file first and then swap it in,
+    # so a crash while saving can't leave a half-written library
+    temp_name = file_name + ".tmp"
+    with open(temp_name, "w") as file:
         # Convert books list to JSON and save
         json.dump(books, file)
+    os.replace(temp_name, file_name)
+    fuzzy_index.save(index_file_name(), file_name)
+    
+    # Nothing is unsaved anymore
+    unsaved_changes = 0
+    last_save_time = time.time()
+
+# Function to remember that the library changed
+def record_change():
+    """Counts changes that are not saved yet"""
+    global unsaved_changes
+    unsaved_changes += 1
+
+# Function to check if it's time for an autosave
+def autosave_due():
+    """True if enough changes or enough time have piled up since the last save"""
+    if unsaved_changes == 0:
+        return False
+    return unsaved_changes >= autosave_every or time.time() - last_save_time >= autosave_seconds
+
+# Function to save now and then so a crash doesn't lose everything
+def autosave():
+    """Saves the library if an autosave is due"""
+    if autosave_due():
+        save_library()
+
+# Function to get the name of the file the fuzzy index is saved in
+def index_file_name():
+    return file_name + ".index"
+
+# Function to fill in missing details from the ISBN catalog
+def enrich_library():
+    """Fills in empty details of every book in one pass over the catalog"""
+    if open_catalog() is None:
+        return
+    stats = enrich_books(books, catalog)
+    print(f"Filled in {stats['fields']} details: {stats['by_isbn']} books by ISBN, "
+          f"{stats['by_title']} books by title and author (out of {stats['books']})")
+    if stats["fields"]:
+        record_change()
 
 # Function to load library from file
 def load_library():
@@ -213,6 +368,32 @@ def load_library():
             print("Could not load library file. Starting with empty library.")
     else:
         print("No library file found. Starting with empty library.")
+    
+    load_indexes()
+
+# Function to set up the indexes for the loaded books
+def load_indexes():
+    """Gives books without an id one and loads (or builds) the fuzzy index"""
+    global books_by_id, next_id, fuzzy_index
+    
+    # Books written by older versions don't have an id yet (same numbering as the web app)
+    # Go past every id in the file first, so new ids can't clash with a later book's
+    next_id = max([1] + [book["id"] + 1 for book in books if "id" in book])
+    ids_added = False
+    for book in books:
+        if "id" not in book:
+            book["id"] = next_id
+            next_id += 1
+            ids_added = True
+    books_by_id = {book["id"]: book for book in books}
+    
+    # Use the saved index if it belongs to this library file, otherwise build it
+    fuzzy_index = FuzzyIndex.load(index_file_name(), file_name)
+    if fuzzy_index is None:
+        fuzzy_index = FuzzyIndex.from_books(books)
+        # Ids given out just now aren't in the file yet, so only save the index if every book had one
+        if books and not ids_added:
+            fuzzy_index.save(index_file_name(), file_name)
 
 # Main function
 def main():
@@ -244,7 +425,168 @@ def main():
         else:
             print("Invalid choice. Please try again.")
 
+# Function to build the command line parser
+def make_parser(global_options=True):
+    """
+    Creates the parser used for commands and for lines in a batch file.
+    Batch lines get global_options=False, so a line like "--profile list" is an error
+    instead of a flag that is silently ignored.
+    """
+    parser = argparse.ArgumentParser(description="Personal Library Manager (run without arguments for the menu)")
+    if global_options:
+        parser.add_argument("--file", default=file_name, help="Library file (default: library.txt)")
+        parser.add_argument("--autosave-every", type=int, default=1000, help="Save after this many changes (default: 1000)")
+        parser.add_argument("--autosave-seconds", type=float, default=60, help="Save after this many seconds (default: 60)")
+        parser.add_argument("--profile", action="store_true", help="Show how much time each kind of operation took")
+        parser.add_argument("--catalog", default=catalog_file, help="ISBN catalog made by isbn_catalog.py (default: isbn_catalog.bin)")
+    
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    # add --title ... --author ... --year ... [--genre ...] [--read], or add --isbn ... to fill the rest in
+    add_parser = commands.add_parser("add", help="Add a book")
+    add_parser.add_argument("--isbn", help="Fill in the details from the ISBN catalog (given details win)")
+    add_parser.add_argument("--title")
+    add_parser.add_argument("--author")
+    add_parser.add_argument("--year", type=int)
+    add_parser.add_argument("--genre")
+    add_parser.add_argument("--read", action="store_true")
+    
+    # remove --title ...
+    remove_parser = commands.add_parser("remove", help="Remove a book by title")
+    remove_parser.add_argument("--title", required=True)
+    
+    # search --title ... or search --author ...
+    search_parser = commands.add_parser("search", help="Search by title or author")
+    search_group = search_parser.add_mutually_exclusive_group(required=True)
+    search_group.add_argument("--title")
+    search_group.add_argument("--author")
+    
+    # list, stats
+    commands.add_parser("list", help="Display all books")
+    commands.add_parser("stats", help="Display statistics")
+    
+    # enrich
+    commands.add_parser("enrich", help="Fill in missing details (and ISBNs) of all books from the ISBN catalog")
+    
+    # batch FILE
+    batch_parser = commands.add_parser("batch", help="Run commands from a file, one per line")
+    batch_parser.add_argument("path", help="File with one command per line, e.g. add --title \"Dune\" --author \"Frank Herbert\" --year 1965")
+    
+    return parser
+
+# Function to run one command
+def run_command(args):
+    """Runs one parsed command (add, remove, search, list or stats)"""
+    if args.command == "add":
+        details = (lookup_isbn(args.isbn) if args.isbn else None) or {}
+        title = args.title or details.get("title")
+        author = args.author or details.get("author")
+        year = args.year or details.get("year")
+        genre = args.genre if args.genre is not None else details.get("genre", "")
+        if not (title and author and year):
+            print("Book not added: give --title, --author and --year, or an --isbn that is in the catalog.")
+            return
+        
+        # Scripts can't answer questions, so likely duplicates are only reported
+        warn_about_duplicates(title, author)
+        add_book_record(title, author, year, genre, args.read, args.isbn)
+    elif args.command == "remove":
+        if not remove_book_by_title(args.title):
+            print(f"Book '{args.title}' not found. Nothing removed.")
+    elif args.command == "search":
+        search_type = "title" if args.title is not None else "author"
+        search_term = args.title if args.title is not None else args.author
+        show_search_results(search_type, search_term, find_books(search_type, search_term))
+    elif args.command == "list":
+        display_books()
+    elif args.command == "stats":
+        display_stats()
+    elif args.command == "enrich":
+        enrich_library()
+
+# Function to read commands from a batch file
+def read_batch_file(path, parser):
+    """Yields (line number, parsed command) for every command in the file"""
+    with open(path, "r") as file:
+        for line_number, line in enumerate(file, start=1):
+            line = line.strip()
+            
+            # Skip empty lines and comments
+            if not line or line.startswith("#"):
+                continue
+            
+            try:
+                args = parser.parse_args(shlex.split(line))
+            except SystemExit:
+                # argparse already printed what was wrong
+                print(f"Skipping line {line_number} of {path}")
+                continue
+            
+            if args.command == "batch":
+                print(f"Skipping line {line_number} of {path}: batch files can't run other batch files")
+                continue
+            
+            yield line_number, args
+
+# Function to print the profile
+def show_profile(timings):
+    """Prints total and average time for each kind of operation"""
+    print("\n----- Profile -----")
+    print(f"{'operation':<12}{'count':>10}{'total ms':>12}{'avg us':>12}")
+    for operation, (count, seconds) in timings.items():
+        print(f"{operation:<12}{count:>10}{seconds * 1000:>12.2f}{seconds / count * 1_000_000:>12.1f}")
+
+# Function to run the program from the command line
+def run_cli(argv):
+    """Loads the library once, runs the command(s), saves once at the end"""
+    global file_name, autosave_every, autosave_seconds, catalog_file
+    
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    
+    file_name = args.file
+    catalog_file = args.catalog
+    autosave_every = args.autosave_every
+    autosave_seconds = args.autosave_seconds
+    
+    # Time spent on each kind of operation: name -> [count, seconds]
+    timings = {}
+    
+    # Function to run something and remember how long it took
+    def timed(operation, function, *function_args):
+        start = time.perf_counter()
+        function(*function_args)
+        if args.profile:
+            timing = timings.setdefault(operation, [0, 0.0])
+            timing[0] += 1
+            timing[1] += time.perf_counter() - start
+    
+    timed("load", load_library)
+    
+    # A single command, or every command in the batch file
+    if args.command == "batch":
+        commands = (command for _, command in read_batch_file(args.path, make_parser(global_options=False)))
+    else:
+        commands = [args]
+    
+    for command in commands:
+        timed(command.command, run_command, command)
+        
+        # Checkpoint now and then so a crash doesn't lose everything
+        if autosave_due():
+            timed("checkpoint", save_library)
+    
+    # Save once at the end (only if something changed)
+    if unsaved_changes:
+        timed("save", save_library)
+    
+    if args.profile:
+        show_profile(timings)
+
 # Run the program
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1:
+        run_cli(sys.argv[1:])
+    else:
+        main()
 
@@ -0,0 +1,225 @@
+# Persistent Map
+# An id -> value map that is never changed in place: set() and delete() return
+# a new map that shares everything but the changed path with the old one, so
+# holding on to a map is a free snapshot of the library
+
+# Bits of the key used per level of the tree (32 children per node)
+BITS = 5
+WIDTH = 1 << BITS
+MASK = WIDTH - 1
+
+
+# One node of the tree
+class _Node:
+    """
+    Only the children that exist are kept: bit i of the bitmap says child i
+    is there, and it sits at slots[number of bits set below i]. On the
+    bottom level the slots are the values themselves.
+    """
+    __slots__ = ("bitmap", "slots", "owner")
+
+    def __init__(self, bitmap, slots, owner=None):
+        self.bitmap = bitmap
+        self.slots = slots
+        # Set while a bulk edit owns the node and may change it in place (see PersistentMap.update)
+        self.owner = owner
+
+    # Helper to get a node we are allowed to change
+    def editable(self, owner):
+        if owner is not None and self.owner is owner:
+            return self
+        return _Node(self.bitmap, list(self.slots), owner)
+
+
+EMPTY_NODE = _Node(0, [])
+
+
+# The persistent map
+class PersistentMap:
+    """
+    Map from non-negative integer keys (book ids) to values, kept as a 32-way
+    bitmap trie indexed by the key's bits, highest first. A lookup or change
+    touches one node per level (4 levels hold a million ids), a change copies
+    only those nodes, and iteration goes in key order.
+    """
+    __slots__ = ("_root", "_shift", "_count")
+
+    def __init__(self, root=EMPTY_NODE, shift=0, count=0):
+        self._root = root
+        # How far the key is shifted right on the top level (0 on the bottom level)
+        self._shift = shift
+        self._count = count
+
+    # Function to build a map from (key, value) pairs
+    @classmethod
+    def from_items(cls, items):
+        return cls().update(items)
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return self.keys()
+
+    # Function to look up a key
+    def get(self, key, default=None):
+        shift = self._shift
+        if key < 0 or key >> shift >> BITS:
+            return default
+        node = self._root
+        while True:
+            bit = 1 << ((key >> shift) & MASK)
+            if not node.bitmap & bit:
+                return default
+            item = node.slots[(node.bitmap & (bit - 1)).bit_count()]
+            if shift == 0:
+                return item
+            node = item
+            shift -= BITS
+
+    # Function to get a map with the key set to the value
+    def set(self, key, value):
+        return self._set(key, value, None)
+
+    # Function to get a map without the key
+    def delete(self, key):
+        """Raises KeyError if the key isn't there"""
+        if key < 0 or key >> self._shift >> BITS:
+            raise KeyError(key)
+        root = _delete(self._root, self._shift, key)
+        shift = self._shift
+        # Drop top levels that only lead to the first child
+        while shift and root.bitmap == 1:
+            root = root.slots[0]
+            shift -= BITS
+        return PersistentMap(root, shift, self._count - 1)
+
+    # Function to set many keys at once
+    def update(self, items):
+        """
+        Returns a map with all the (key, value) pairs set. Nodes made during
+        this call are changed in place instead of copied for every pair, so
+        this is much quicker than calling set() in a loop.
+        """
+        owner = object()
+        result = self
+        for key, value in items:
+            result = result._set(key, value, owner)
+        # Nobody owns the nodes any more, later changes copy them again
+        _release(result._root, result._shift, owner)
+        return result
+
+    # Functions to go through the map in key order
+    def keys(self):
+        return (key for key, _ in self.items())
+
+    def values(self):
+        return _values(self._root, self._shift)
+
+    def items(self):
+        return _items(self._root, self._shift, 0)
+
+    def __repr__(self):
+        return f"PersistentMap({dict(self.items())!r})"
+
+    # Helper for set() and update()
+    def _set(self, key, value, owner):
+        if key < 0:
+            raise ValueError("keys must be non-negative integers")
+        root, shift = self._root, self._shift
+        # Add levels on top until the key fits, the old tree becomes the first child
+        while key >> shift >> BITS:
+            if root.bitmap:
+                root = _Node(1, [root], owner)
+            shift += BITS
+        root, added = _set(root, shift, key, value, owner)
+        return PersistentMap(root, shift, self._count + added)
+
+
+_MISSING = object()
+
+
+# Helper to set a key below a node, returns (new node, whether the key is new)
+def _set(node, shift, key, value, owner):
+    bit = 1 << ((key >> shift) & MASK)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    if not node.bitmap & bit:
+        node = node.editable(owner)
+        node.bitmap |= bit
+        node.slots.insert(index, value if shift == 0 else _set(EMPTY_NODE, shift - BITS, key, value, owner)[0])
+        return node, True
+    if shift == 0:
+        if node.slots[index] is value:
+            return node, False
+        node = node.editable(owner)
+        node.slots[index] = value
+        return node, False
+    child, added = _set(node.slots[index], shift - BITS, key, value, owner)
+    if child is not node.slots[index]:
+        node = node.editable(owner)
+        node.slots[index] = child
+    return node, added
+
+
+# Helper to delete a key below a node, returns the new node
+def _delete(node, shift, key):
+    bit = 1 << ((key >> shift) & MASK)
+    if not node.bitmap & bit:
+        raise KeyError(key)
+    index = (node.bitmap & (bit - 1)).bit_count()
+    node = node.editable(None)
+    if shift == 0:
+        child = EMPTY_NODE
+    else:
+        child = _delete(node.slots[index], shift - BITS, key)
+    if child.bitmap:
+        node.slots[index] = child
+    else:
+        # Empty children are taken out, so a node only has children with something in them
+        node.bitmap &= ~bit
+        del node.slots[index]
+    return node
+
+
+# Helper to give up ownership of the nodes a bulk edit made
+def _release(node, shift, owner):
+    if node.owner is not owner:
+        return
+    node.owner = None
+    if shift:
+        for child in node.slots:
+            _release(child, shift - BITS, owner)
+
+
+# Helpers to walk the tree in key order
+def _values(node, shift):
+    if shift == 0:
+        yield from node.slots
+    elif shift == BITS:
+        for child in node.slots:
+            yield from child.slots
+    else:
+        for child in node.slots:
+            yield from _values(child, shift - BITS)
+
+
+def _items(node, shift, prefix):
+    slots = iter(node.slots)
+    bitmap = node.bitmap
+    while bitmap:
+        low = bitmap & -bitmap
+        key = (prefix << BITS) | (low.bit_length() - 1)
+        if shift == 0:
+            yield key, next(slots)
+        else:
+            yield from _items(next(slots), shift - BITS, key)
+        bitmap ^= low
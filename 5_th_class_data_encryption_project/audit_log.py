@@ -0,0 +1,483 @@
+import argparse
+import atexit
+import bisect
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, there only one process may write the log
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# A segment file is closed and a new one started once it's bigger than this
+MAX_SEGMENT_BYTES = 16 * 1024 * 1024
+
+# The writer wakes up at least this often even if nobody records anything
+FLUSH_INTERVAL = 1.0
+
+# Longest flush() waits for the writer by default
+FLUSH_TIMEOUT = 10.0
+
+# "prev" of the very first record
+GENESIS = "0" * 64
+
+# Segment files are audit-<number>.log, with audit-<number>.idx next to them once they're full
+SEGMENT_NAME = re.compile(r"^audit-(\d{6})\.log$")
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "writer.lock"
+
+
+# JSON text a record's hash is taken over (always the same bytes for the same record)
+def canonical(body):
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+
+# Hash of a record, which includes the previous record's hash in "prev"
+def record_hash(body):
+    return hashlib.sha256(canonical(body).encode()).hexdigest()
+
+
+# Empty index for one segment
+def new_segment_index():
+    return {"start": None, "end": None, "first_seq": None, "last_seq": None, "last_hash": None, "size": 0,
+            "users": {}}
+
+
+# Add a written record (the line at offset, length bytes long) to a segment index
+def index_record(index, record, offset, length):
+    if index["start"] is None:
+        index["start"] = record["time"]
+        index["first_seq"] = record["seq"]
+    index["end"] = record["time"]
+    index["last_seq"] = record["seq"]
+    index["last_hash"] = record["hash"]
+    index["size"] = offset + length
+    times, offsets = index["users"].setdefault(record["user"], [[], []])
+    times.append(record["time"])
+    offsets.append(offset)
+
+
+# Append-only, tamper-evident audit log with a background writer
+#
+# record() only puts the event on a queue (a few microseconds). A writer
+# thread takes everything queued, chains each record to the one before it
+# (sha256 over the record including the previous hash, so changing or
+# removing a record breaks every hash after it), writes the whole batch and
+# fsyncs once. Events that pile up during an fsync go out together in the
+# next batch. A crash can lose at most the batch that was being written.
+#
+# The log is split into segment files of about MAX_SEGMENT_BYTES. Each full
+# segment gets an index file (user -> record times and byte offsets) and a
+# line in the manifest with its time range, so a query by user and time only
+# reads the matching records of the segments that overlap the range.
+#
+# log_dir/audit-000001.log  one JSON record per line
+# log_dir/audit-000001.idx  {"start", "end", "first_seq", "last_seq", "last_hash", "size", "users": {user: [times, offsets]}}
+# log_dir/manifest.json     {segment name: [start, end, first_seq, last_seq, last_hash]} for full segments
+# log_dir/writer.lock       flock'ed while a batch is written
+#
+# Several processes (e.g. Streamlit workers) can write the same log: each
+# batch is written under the lock file, after reading whatever the others
+# appended since, so they all extend one chain.
+#
+# With read_only=True (the verify/query command line) nothing is written or
+# repaired, and a half-written last line is left alone and skipped.
+class AuditLog:
+    def __init__(self, log_dir, max_segment_bytes=MAX_SEGMENT_BYTES, flush_interval=FLUSH_INTERVAL,
+                 read_only=False):
+        self.log_dir = log_dir
+        self.max_segment_bytes = max_segment_bytes
+        self.flush_interval = flush_interval
+        self.read_only = read_only
+
+        # Events waiting for the writer, and flush() markers (threading.Event) between them
+        self._queue = collections.deque()
+        self._wakeup = threading.Event()
+        self._closed = False
+
+        self._lock_file = None
+        if not read_only:
+            os.makedirs(log_dir, exist_ok=True)
+            self._lock_file = open(os.path.join(log_dir, LOCK_FILE), "a")
+
+        # Index of the segment being written, guarded by the lock (queries read it too)
+        self._lock = threading.Lock()
+        self._file = None
+        with self._files_locked():
+            self._open_segments()
+
+        self.batches = 0
+        self.records = 0
+        if not read_only:
+            self._writer = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
+
+    # ---- Recording ----
+
+    # Queue an event (returns right away, the writer saves it shortly after)
+    def record(self, event, user, client=None, **details):
+        if self._closed:
+            raise RuntimeError("Audit log is closed.")
+        if self.read_only:
+            raise RuntimeError("Audit log was opened read-only.")
+        self._queue.append((time.time(), event, user or "", client, details))
+        self._wakeup.set()
+
+    # Wait until everything recorded so far is on disk, returns False if that took longer than timeout
+    def flush(self, timeout=FLUSH_TIMEOUT):
+        if self._closed or self.read_only:
+            return True
+        done = threading.Event()
+        self._queue.append(done)
+        self._wakeup.set()
+        return done.wait(timeout)
+
+    # Write what's left and stop the writer
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.read_only:
+            return
+        self._wakeup.set()
+        self._writer.join()
+        self._file.close()
+        self._lock_file.close()
+
+    # ---- Querying ----
+
+    # Records for a user (or everyone if user is None) with start <= time <= end, oldest first
+    def query(self, user=None, start=None, end=None, limit=None):
+        start = float("-inf") if start is None else start
+        end = float("inf") if end is None else end
+        with self._lock:
+            segments = [(name, self._segment_indexes.get(name)) for name in self._manifest
+                        if self._manifest[name][0] <= end and self._manifest[name][1] >= start]
+            if self._active_index["start"] is not None and self._active_index["end"] >= start \
+                    and self._active_index["start"] <= end:
+                # Copy the user's lists from the active segment, the writer keeps appending to them
+                times, offsets = self._active_index["users"].get(user, [[], []])
+                active = {"size": self._active_index["size"], "users": {user: [list(times), list(offsets)]}}
+                segments.append((self._active_name, active))
+
+        results = []
+        for name, index in segments:
+            if index is None:
+                index = self._load_segment_index(name)
+            with open(os.path.join(self.log_dir, name), "rb") as file:
+                if user is None:
+                    # Everyone: read the segment in order and keep the records in the range
+                    for line in file.read(index["size"]).splitlines():
+                        record = json.loads(line)
+                        if start <= record["time"] <= end:
+                            results.append(record)
+                else:
+                    times, offsets = index["users"].get(user, [[], []])
+                    first = bisect.bisect_left(times, start)
+                    last = bisect.bisect_right(times, end)
+                    for offset in offsets[first:last]:
+                        file.seek(offset)
+                        results.append(json.loads(file.readline()))
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    # Check every hash in the chain, returns {"ok", "records", "head", "error"}
+    def verify(self):
+        self.flush()
+        with self._lock:
+            active_name, active_size = self._active_name, self._active_index["size"]
+        previous = GENESIS
+        expected_seq = 1
+        checked = 0
+        for name in self._segment_names():
+            with open(os.path.join(self.log_dir, name), "rb") as file:
+                # The writer may be adding to the active segment, only check what was written before we started
+                lines = file.read(active_size).splitlines() if name == active_name else file
+                for line_number, line in enumerate(lines, start=1):
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        record = {}
+                    stored_hash = record.pop("hash", None)
+                    if record.get("prev") != previous or record.get("seq") != expected_seq \
+                            or record_hash(record) != stored_hash:
+                        return {"ok": False, "records": checked, "head": previous,
+                                "error": f"{name} line {line_number} (seq {record.get('seq')}) doesn't match the chain"}
+                    previous = stored_hash
+                    expected_seq += 1
+                    checked += 1
+        return {"ok": True, "records": checked, "head": previous, "error": None}
+
+    # ---- Writer thread ----
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            closing = self._closed
+            try:
+                self._write_batch()
+            except Exception:
+                # The batch went back on the queue, the next round tries again
+                logger.exception("Writing the audit log in %s failed", self.log_dir)
+                if closing:
+                    dropped = [item for item in self._queue if not isinstance(item, threading.Event)]
+                    logger.error("Audit log closed with %d events not written", len(dropped))
+                    for item in self._queue:
+                        if isinstance(item, threading.Event):
+                            item.set()
+                    return
+                continue
+            if closing and not self._queue:
+                return
+
+    # Write everything queued with one fsync, then wake up flush() callers
+    #
+    # If writing fails, the chain is picked up again from the files and the
+    # events that aren't on disk go back on the queue (with the flush markers).
+    def _write_batch(self):
+        items = []
+        while self._queue:
+            items.append(self._queue.popleft())
+        if not items:
+            return
+
+        markers = [item for item in items if isinstance(item, threading.Event)]
+        events = [item for item in items if not isinstance(item, threading.Event)]
+        with self._files_locked():
+            first_seq = None
+            self._synced = 0
+            try:
+                self._sync()
+                first_seq = self._seq + 1
+                self._write_events(events)
+            except Exception:
+                on_disk = self._synced
+                try:
+                    self._reopen()
+                    # A failed fsync may still have written the records, the files know
+                    if first_seq is not None:
+                        on_disk = self._seq + 1 - first_seq
+                finally:
+                    self._queue.extendleft(reversed(events[max(on_disk, 0):] + markers))
+                raise
+
+        for marker in markers:
+            marker.set()
+
+    # Chain, write and fsync events (self._synced counts the ones on disk)
+    def _write_events(self, events):
+        written = []
+        for event_time, event, user, client, details in events:
+            # Times only go forward, so every file and user list is sorted by time
+            self._last_time = max(event_time, self._last_time)
+            self._seq += 1
+            body = {"seq": self._seq, "time": self._last_time, "event": event, "user": user,
+                    "client": client, "details": details, "prev": self._last_hash}
+            self._last_hash = record_hash(body)
+            body["hash"] = self._last_hash
+            # Values JSON can't hold are saved as text rather than stopping the writer
+            written.append((body, (json.dumps(body, ensure_ascii=False, default=str) + "\n").encode()))
+
+        position = 0
+        while position < len(written):
+            # As many records as fit in the segment (at least one), then the next segment gets the rest
+            # (the index knows the size, the file position may be stale after other processes wrote)
+            offset = self._active_index["size"]
+            size = len(written[position][1])
+            end = position + 1
+            while end < len(written) and offset + size + len(written[end][1]) <= self.max_segment_bytes:
+                size += len(written[end][1])
+                end += 1
+
+            self._file.write(b"".join(line for _, line in written[position:end]))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            with self._lock:
+                for body, line in written[position:end]:
+                    index_record(self._active_index, body, offset, len(line))
+                    offset += len(line)
+            self._synced += end - position
+            self.batches += 1
+            self.records += end - position
+            position = end
+            if offset >= self.max_segment_bytes:
+                self._rotate()
+
+    # Catch up with what writers in other processes added since our last batch
+    def _sync(self):
+        number = int(SEGMENT_NAME.match(self._active_name).group(1)) + 1
+        if os.path.exists(os.path.join(self.log_dir, f"audit-{number:06d}.log")):
+            # Another process filled the segment and started the next one
+            self._reopen()
+        elif os.path.getsize(os.path.join(self.log_dir, self._active_name)) != self._active_index["size"]:
+            with self._lock:
+                self._scan_segment(self._active_name, repair=True, index=self._active_index)
+            if self._active_index["last_seq"] is not None:
+                self._seq = self._active_index["last_seq"]
+                self._last_hash = self._active_index["last_hash"]
+                self._last_time = self._active_index["end"]
+
+    # Start over from the files (after a failed write, or when another process rotated)
+    def _reopen(self):
+        with self._lock:
+            with contextlib.suppress(OSError):
+                self._file.close()
+            self._open_segments()
+
+    # Hold the lock file while this process changes the log files
+    @contextlib.contextmanager
+    def _files_locked(self):
+        if self._lock_file is None or fcntl is None:
+            yield
+            return
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    # Close the full segment, save its index and start the next one
+    def _rotate(self):
+        self._file.close()
+        index = self._active_index
+        self._save_segment_index(self._active_name, index)
+        with self._lock:
+            self._manifest[self._active_name] = [index["start"], index["end"], index["first_seq"],
+                                                 index["last_seq"], index["last_hash"]]
+            self._segment_indexes[self._active_name] = index
+            self._save_manifest()
+            number = int(SEGMENT_NAME.match(self._active_name).group(1)) + 1
+            self._active_name = f"audit-{number:06d}.log"
+            self._active_index = new_segment_index()
+        self._file = open(os.path.join(self.log_dir, self._active_name), "ab")
+
+    # ---- Files ----
+
+    def _segment_names(self):
+        if not os.path.isdir(self.log_dir):
+            return []
+        return sorted(name for name in os.listdir(self.log_dir) if SEGMENT_NAME.match(name))
+
+    # Find the segments, fix up anything a crash left behind and open the last segment
+    # (read-only: only build the missing indexes in memory)
+    def _open_segments(self):
+        manifest_path = os.path.join(self.log_dir, MANIFEST_FILE)
+        try:
+            with open(manifest_path, "r") as f:
+                self._manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self._manifest = {}
+        # Indexes of full segments are loaded when a query needs them
+        self._segment_indexes = {}
+
+        names = self._segment_names() or ["audit-000001.log"]
+        changed = False
+        for name in names[:-1]:
+            if name not in self._manifest:
+                index = self._scan_segment(name)
+                if self.read_only:
+                    self._segment_indexes[name] = index
+                else:
+                    self._save_segment_index(name, index)
+                self._manifest[name] = [index["start"], index["end"], index["first_seq"],
+                                        index["last_seq"], index["last_hash"]]
+                changed = True
+        self._manifest = {name: self._manifest[name] for name in names[:-1]}
+        if changed and not self.read_only:
+            self._save_manifest()
+
+        # The last segment is the one we keep writing to (its index stops before a half-written line)
+        self._active_name = names[-1]
+        self._active_index = self._scan_segment(self._active_name, repair=not self.read_only)
+        previous = self._manifest[names[-2]] if len(names) > 1 else [None, 0.0, 0, 0, GENESIS]
+        if self._active_index["last_seq"] is not None:
+            self._seq = self._active_index["last_seq"]
+            self._last_hash = self._active_index["last_hash"]
+            self._last_time = self._active_index["end"]
+        else:
+            self._seq, self._last_hash, self._last_time = previous[3], previous[4], previous[1]
+        if not self.read_only:
+            self._file = open(os.path.join(self.log_dir, self._active_name), "ab")
+
+    # Build a segment's index by reading it (with repair=True a half-written last line is cut off)
+    #
+    # Given an index, only what comes after index["size"] is read and added to it.
+    def _scan_segment(self, name, repair=False, index=None):
+        path = os.path.join(self.log_dir, name)
+        if index is None:
+            index = new_segment_index()
+        good_size = index["size"]
+        if os.path.exists(path):
+            with open(path, "rb") as file:
+                file.seek(good_size)
+                for line in file:
+                    try:
+                        record = json.loads(line) if line.endswith(b"\n") else None
+                    except ValueError:
+                        record = None
+                    if record is None:
+                        break
+                    index_record(index, record, good_size, len(line))
+                    good_size += len(line)
+            if repair and good_size != os.path.getsize(path):
+                with open(path, "r+b") as file:
+                    file.truncate(good_size)
+        return index
+
+    def _load_segment_index(self, name):
+        with open(os.path.join(self.log_dir, name[:-4] + ".idx"), "r") as f:
+            index = json.load(f)
+        with self._lock:
+            self._segment_indexes[name] = index
+        return index
+
+    def _save_segment_index(self, name, index):
+        path = os.path.join(self.log_dir, name[:-4] + ".idx")
+        with open(path + ".tmp", "w") as f:
+            json.dump(index, f)
+        os.replace(path + ".tmp", path)
+
+    def _save_manifest(self):
+        path = os.path.join(self.log_dir, MANIFEST_FILE)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self._manifest, f)
+        os.replace(path + ".tmp", path)
+
+
+# Command line: check the chain, or show a user's records
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check or search the vault audit log")
+    parser.add_argument("--log-dir", default=os.path.join("vault_data", "audit"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("verify", help="Check that no record was changed or removed")
+    query_parser = commands.add_parser("query", help="Show records")
+    query_parser.add_argument("--user")
+    query_parser.add_argument("--since", type=float, help="Unix time")
+    query_parser.add_argument("--until", type=float, help="Unix time")
+    query_parser.add_argument("--limit", type=int)
+    args = parser.parse_args()
+
+    log = AuditLog(args.log_dir, read_only=True)
+    if args.command == "verify":
+        result = log.verify()
+        if result["ok"]:
+            print(f"OK: {result['records']} records, head {result['head']}")
+        else:
+            print(f"BROKEN after {result['records']} good records: {result['error']}")
+    else:
+        for record in log.query(args.user, args.since, args.until, args.limit):
+            print(json.dumps(record, ensure_ascii=False))
+    log.close()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from audit_log import AuditLog
+
+
+# Write one record per event with its own fsync (what logging synchronously would cost)
+def fsync_per_event(path, events):
+    start = time.perf_counter()
+    with open(path, "ab") as f:
+        for i in range(events):
+            f.write((json.dumps({"seq": i, "time": time.time(), "event": "login", "user": "bench"}) + "\n").encode())
+            f.flush()
+            os.fsync(f.fileno())
+    return time.perf_counter() - start
+
+
+# Measure what a request pays to log an event, write throughput, and query time
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vault audit log")
+    parser.add_argument("--events", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4, help="Threads recording at the same time")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    log_dir = os.path.join(tempfile.mkdtemp(), "audit")
+    log = AuditLog(log_dir, max_segment_bytes=4 * 1024 * 1024)
+
+    # Cost of record() inside a request (the writer thread does the rest)
+    per_thread = args.events // args.threads
+    call_times = [[] for _ in range(args.threads)]
+
+    def record_events(number):
+        rng = random.Random(number)
+        times = call_times[number]
+        for i in range(per_thread):
+            user = f"user{rng.randrange(args.users)}"
+            start = time.perf_counter()
+            log.record("decrypt", user, "127.0.0.1", ok=i % 7 != 0, entry_id=i)
+            times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=record_events, args=(number,)) for number in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    log.flush()
+    seconds = time.perf_counter() - start
+    call_times = sorted(t for times in call_times for t in times)
+    print(f"record(): median {statistics.median(call_times) * 1e6:.1f} us, "
+          f"p99 {call_times[int(len(call_times) * 0.99)] * 1e6:.1f} us")
+    print(f"{log.records:,} events written and fsynced in {seconds:.2f} s ({log.records / seconds:,.0f}/s) "
+          f"with {log.batches:,} fsyncs ({log.records / log.batches:.0f} events per batch), "
+          f"{len([n for n in os.listdir(log_dir) if n.endswith('.log')])} segments")
+
+    # The same events with one fsync each (only a sample, it's slow)
+    sample = min(2000, args.events)
+    synced = fsync_per_event(os.path.join(tempfile.mkdtemp(), "sync.log"), sample)
+    print(f"fsync per event: {synced / sample * 1e6:.0f} us per event ({sample / synced:,.0f}/s)")
+
+    # A user's events in a time window
+    records = log.query()
+    first, last = records[0]["time"], records[-1]["time"]
+    rng = random.Random(1)
+    query_times = []
+    found = 0
+    for _ in range(args.queries):
+        window_start = rng.uniform(first, last)
+        start = time.perf_counter()
+        found += len(log.query(f"user{rng.randrange(args.users)}", window_start, window_start + (last - first) / 10))
+        query_times.append(time.perf_counter() - start)
+    print(f"query(user, 10% of the time range): median {statistics.median(query_times) * 1e3:.2f} ms, "
+          f"{found / args.queries:.1f} records on average")
+
+    start = time.perf_counter()
+    result = log.verify()
+    print(f"verify: {result['records']:,} records {'OK' if result['ok'] else 'BROKEN'} "
+          f"in {time.perf_counter() - start:.2f} s")
+    log.close()
@@ -0,0 +1,130 @@
+import argparse
+import glob
+import json
+import os
+import random
+import string
+import tempfile
+import time
+
+from cryptography.fernet import Fernet
+
+from vault_crypto import Keyring, derive_key, seal, unseal, wrap_with_key, zstandard
+from vault_store import VaultStore
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = ("the account password for my bank server login recovery code note meeting address phone "
+         "insurance policy number email backup key wallet seed office wifi router admin user renew "
+         "expires contact support ticket reference invoice payment card pin remember change").split()
+
+
+# ---- Corpora ----
+
+# Notes written in plain words, a few sentences to a few paragraphs
+def notes(count):
+    return [" ".join(random.choices(WORDS, k=random.randint(20, 600))) for _ in range(count)]
+
+
+# Small JSON documents (API credentials, configs)
+def json_records(count):
+    return [json.dumps({
+        "service": random.choice(WORDS),
+        "username": random.choice(WORDS) + str(random.randint(1, 999)),
+        "api_key": "".join(random.choices(string.ascii_letters + string.digits, k=40)),
+        "scopes": random.sample(WORDS, 5),
+        "notes": " ".join(random.choices(WORDS, k=30)),
+    }, indent=2) for _ in range(count)]
+
+
+# Source files and docs from this repository, split into entry-sized pieces
+def repo_text(count):
+    texts = []
+    for path in sorted(glob.glob(os.path.join(REPO_DIR, "**", "*.py"), recursive=True) +
+                       glob.glob(os.path.join(REPO_DIR, "**", "*.md"), recursive=True)):
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+        texts.extend(text[i:i + 4000] for i in range(0, len(text), 4000))
+    return [texts[i % len(texts)] for i in range(count)]
+
+
+# Random passwords and keys, which don't compress at all
+def secrets(count):
+    return ["".join(random.choices(string.ascii_letters + string.digits + string.punctuation, k=32))
+            for _ in range(count)]
+
+
+CORPORA = {"notes": notes, "json": json_records, "repo text": repo_text, "secrets": secrets}
+
+
+# ---- Measuring ----
+
+def disk_size(directory):
+    return sum(os.path.getsize(path) for path in glob.glob(os.path.join(directory, "**", "*"), recursive=True)
+               if os.path.isfile(path))
+
+
+# Store the texts the old way (Fernet token text in the shard JSON) and the new way
+# (compressed, raw bytes in the payload file), return sizes and throughput
+def measure(texts, keyring):
+    salt = os.urandom(16)
+    passkey_key = derive_key("bench passkey", salt, 1000)
+    multi_fernet = keyring.fernet()
+    data_keys = [Fernet.generate_key() for _ in texts]
+    plain_bytes = sum(len(text.encode()) for text in texts)
+    results = {}
+
+    # Old: Fernet token as text
+    start = time.perf_counter()
+    tokens = [Fernet(key).encrypt(text.encode()).decode() for key, text in zip(data_keys, texts)]
+    encrypt_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for key, token in zip(data_keys, tokens):
+        Fernet(key).decrypt(token.encode())
+    decrypt_seconds = time.perf_counter() - start
+
+    data_dir = os.path.join(tempfile.mkdtemp(), "vault_data")
+    vault = VaultStore(data_dir)
+    vault.add_entries("bench", [dict(wrap_with_key(key, passkey_key, salt, 1000, multi_fernet),
+                                     encrypted_text=token, title="Entry")
+                                for key, token in zip(data_keys, tokens)])
+    results["old"] = (disk_size(data_dir), encrypt_seconds, decrypt_seconds)
+
+    # New: compressed, raw bytes
+    start = time.perf_counter()
+    ciphertexts = [seal(text, key) for key, text in zip(data_keys, texts)]
+    encrypt_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for key, ciphertext in zip(data_keys, ciphertexts):
+        unseal(ciphertext, key)
+    decrypt_seconds = time.perf_counter() - start
+
+    data_dir = os.path.join(tempfile.mkdtemp(), "vault_data")
+    vault = VaultStore(data_dir)
+    vault.add_entries("bench", [dict(wrap_with_key(key, passkey_key, salt, 1000, multi_fernet),
+                                     ciphertext=ciphertext, title="Entry")
+                                for key, ciphertext in zip(data_keys, ciphertexts)])
+    results["new"] = (disk_size(data_dir), encrypt_seconds, decrypt_seconds)
+
+    return plain_bytes, results
+
+
+# Compare on-disk size and payload throughput of the old and new entry format
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure vault size and speed with and without compression")
+    parser.add_argument("--entries", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    keyring = Keyring(os.path.join(tempfile.mkdtemp(), "master.key"))
+    print(f"Compressor: {'zstd' if zstandard else 'zlib'}, {args.entries} entries per corpus\n")
+    print(f"{'corpus':<11}{'plain MB':>9}{'old MB':>8}{'new MB':>8}{'saved':>7}"
+          f"{'old enc MB/s':>14}{'new enc MB/s':>14}{'old dec MB/s':>14}{'new dec MB/s':>14}")
+
+    for name, make in CORPORA.items():
+        plain_bytes, results = measure(make(args.entries), keyring)
+        old_size, old_encrypt, old_decrypt = results["old"]
+        new_size, new_encrypt, new_decrypt = results["new"]
+        mb = plain_bytes / 1e6
+        print(f"{name:<11}{mb:>9.1f}{old_size / 1e6:>8.1f}{new_size / 1e6:>8.1f}{1 - new_size / old_size:>7.0%}"
+              f"{mb / old_encrypt:>14.0f}{mb / new_encrypt:>14.0f}{mb / old_decrypt:>14.0f}{mb / new_decrypt:>14.0f}")
@@ -0,0 +1,37 @@
+import argparse
+import time
+
+from passwords import SCRYPT_R, SCRYPT_P, hash_password
+
+
+# Time one hash with scrypt cost n, in milliseconds (best of a few runs)
+def time_hash(n, runs=3):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        hash_password("benchmark password", n=n, r=SCRYPT_R, p=SCRYPT_P)
+        elapsed = (time.perf_counter() - start) * 1000
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# Find the biggest scrypt N whose hash still takes less than the target time
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pick the scrypt cost for a target login latency on this machine")
+    parser.add_argument("--target-ms", type=float, default=100)
+    args = parser.parse_args()
+
+    chosen = None
+    n = 2 ** 10
+    while n <= 2 ** 20:
+        elapsed = time_hash(n)
+        print(f"N=2**{n.bit_length() - 1:<3} {elapsed:8.1f} ms")
+        if elapsed > args.target_ms:
+            break
+        chosen = n
+        n *= 2
+
+    if chosen is None:
+        print(f"Even the smallest cost is slower than {args.target_ms} ms.")
+    else:
+        print(f"\nUse VAULT_SCRYPT_N={chosen} (2**{chosen.bit_length() - 1}) for about {args.target_ms:.0f} ms per login.")
@@ -0,0 +1,51 @@
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet, MultiFernet
+
+from vault_crypto import Keyring
+
+
+# Re-wrap a chunk of wrapped keys (runs in a worker process)
+def rewrap_chunk(keys, wrapped_keys):
+    multi_fernet = MultiFernet([Fernet(key) for key in keys])
+    return [multi_fernet.rotate(wrapped_key) for wrapped_key in wrapped_keys]
+
+
+# Benchmark re-wrapping N data keys after a master key rotation
+#
+# Only the small wrapped data keys are re-encrypted, the payloads are never
+# touched, so the cost doesn't depend on how big the stored data is.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark master key rotation")
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    keyring = Keyring(os.path.join(tempfile.mkdtemp(), "master.key"))
+    old_fernet = keyring.fernet()
+
+    # Wrapped data keys look like the ones stored on entries (a Fernet token around a Fernet key)
+    start = time.perf_counter()
+    inner = Fernet(Fernet.generate_key()).encrypt(Fernet.generate_key())
+    wrapped_keys = [old_fernet.encrypt(inner) for _ in range(args.entries)]
+    print(f"Made {args.entries} wrapped keys in {time.perf_counter() - start:.1f} s")
+
+    keyring.add_key()
+    chunk_size = max(1, args.entries // (args.workers * 4))
+    chunks = [wrapped_keys[i:i + chunk_size] for i in range(0, args.entries, chunk_size)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers) as pool:
+        rewrapped = [key for chunk in pool.map(rewrap_chunk, [keyring.keys] * len(chunks), chunks) for key in chunk]
+    seconds = time.perf_counter() - start
+
+    # Check a few of them open with the new key alone
+    new_fernet = MultiFernet([Fernet(keyring.keys[0])])
+    assert all(new_fernet.decrypt(key) == inner for key in rewrapped[:: max(1, args.entries // 100)])
+
+    print(f"Re-wrapped {args.entries} keys with {args.workers} workers in {seconds:.1f} s "
+          f"({args.entries / seconds:.0f} keys/s)")
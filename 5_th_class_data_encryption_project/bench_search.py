@@ -0,0 +1,51 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from search_index import SearchIndex
+from vault_store import VaultStore
+
+WORDS = ["bank", "email", "server", "wifi", "router", "passport", "insurance", "tax", "github", "backup",
+         "phone", "pin", "recovery", "codes", "work", "home", "office", "laptop", "crypto", "wallet"]
+
+
+# Time title searches for one user while the total number of entries grows
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure search time of the encrypted title index")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"{'entries':>10}{'index s':>10}{'median us':>12}{'p99 us':>10}{'avg matches':>13}")
+    for size in args.sizes:
+        data_dir = os.path.join(tempfile.mkdtemp(), "vault_data")
+        vault = VaultStore(data_dir)
+        index = SearchIndex(data_dir, os.path.join(data_dir, "search.key"), vault.cache, vault.lock)
+
+        # A few common words plus a long tail, like real titles ("bank pin 2", "work laptop recovery")
+        vocabulary = WORDS + ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=7)) for _ in range(5000)]
+        titles = [" ".join([random.choice(WORDS)] + random.sample(vocabulary, 2)) for _ in range(size)]
+        entry_ids = vault.add_entries("bench", [{"title": title} for title in titles])
+
+        start = time.perf_counter()
+        index.add("bench", list(zip(entry_ids, titles)))
+        index_seconds = time.perf_counter() - start
+
+        times = []
+        matches = 0
+        for _ in range(args.queries):
+            # Prefixes of two words from a stored title
+            title_words = random.choice(titles).split()
+            query = " ".join(word[:random.randint(2, len(word))] for word in random.sample(title_words, 2))
+            start = time.perf_counter()
+            page, total = index.search("bench", query)
+            times.append((time.perf_counter() - start) * 1e6)
+            matches += total
+
+        times.sort()
+        print(f"{size:>10}{index_seconds:>10.2f}{statistics.median(times):>12.1f}"
+              f"{times[int(len(times) * 0.99)]:>10.1f}{matches / args.queries:>13.0f}")
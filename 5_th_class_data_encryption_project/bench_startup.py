@@ -0,0 +1,101 @@
+import argparse
+import cProfile
+import os
+import pstats
+import statistics
+import sys
+import tempfile
+import time
+
+import streamlit.runtime.scriptrunner.script_runner as script_runner
+from streamlit.testing.v1 import AppTest
+
+from passwords import hash_password
+from vault_store import VaultStore
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+
+
+# Fill a vault with `entries` fake entries spread over `users` users
+#
+# The entries only need the fields the pages read, so no real encryption is
+# done here (that would take hours at 100k entries with a strong KDF).
+def make_vault(data_dir, entries, users):
+    vault = VaultStore(data_dir)
+    vault.add_user("bench", {"password": hash_password("bench"), "created_at": time.time()})
+    per_user = max(1, entries // users)
+    for user_number in range(users):
+        user = "bench" if user_number == 0 else f"user{user_number}"
+        vault.add_entries(user, [{
+            "scheme": "envelope-v1",
+            "encrypted_text": f"gAAAAA{user_number:08d}{i:08d}" + "x" * 100,
+            "wrapped_key": "y" * 160,
+            "kdf": {"name": "pbkdf2-sha256", "iterations": 480000, "salt": "c2FsdA=="},
+            "title": f"Entry {i}",
+            "created_at": time.time(),
+        } for i in range(per_user)])
+
+
+# Time spent inside the script itself during the last run (AppTest adds its own
+# polling delay around each run, so timing app.run() from outside isn't useful)
+script_times = []
+profiler = None
+run_script = script_runner.exec_func_with_error_handling
+
+
+def timed_run_script(func, ctx):
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        return run_script(func, ctx)
+    finally:
+        if profiler:
+            profiler.disable()
+        script_times.append((time.perf_counter() - start) * 1000)
+
+
+script_runner.exec_func_with_error_handling = timed_run_script
+
+
+# Time one rerun of the app in milliseconds
+def time_run(app):
+    script_times.clear()
+    app.run()
+    if app.exception:
+        sys.exit(f"App failed: {app.exception[0].message}")
+    return sum(script_times)
+
+
+# Measure cold (first run in this process) and warm (rerun) cost of each page
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure cold and warm rerun time of the vault app")
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--reruns", type=int, default=20)
+    parser.add_argument("--profile", action="store_true", help="Show where the time of a warm dashboard rerun goes")
+    args = parser.parse_args()
+
+    os.chdir(tempfile.mkdtemp())
+    start = time.perf_counter()
+    make_vault("vault_data", args.entries, args.users)
+    print(f"Made {args.entries} entries for {args.users} users in {time.perf_counter() - start:.1f} s\n")
+
+    app = AppTest.from_file(APP_FILE, default_timeout=60)
+    print(f"{'page':<15}{'cold ms':>10}{'warm ms (median)':>20}")
+
+    for page in ["welcome", "login", "dashboard", "store_data", "retrieve_data"]:
+        app.session_state.page = page
+        app.session_state.current_user = "bench" if page not in ("welcome", "login") else None
+        cold = time_run(app)
+        warm = statistics.median(time_run(app) for _ in range(args.reruns))
+        print(f"{page:<15}{cold:>10.1f}{warm:>20.1f}")
+
+    if args.profile:
+        app.session_state.page = "dashboard"
+        app.session_state.current_user = "bench"
+        profiler = cProfile.Profile()
+        for _ in range(args.reruns):
+            app.run()
+        print()
+        pstats.Stats(profiler).sort_stats("cumulative").print_stats(15)
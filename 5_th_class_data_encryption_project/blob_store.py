@@ -0,0 +1,158 @@
+import contextlib
+import os
+import secrets
+import struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+# Plaintext bytes per chunk, each chunk is encrypted and authenticated on its own
+CHUNK_SIZE = 1024 * 1024
+
+# Blob file header: magic, chunk size, 7 byte nonce prefix
+MAGIC = b"VBLOB1"
+HEADER = struct.Struct(">6sI7s")
+
+# AES-GCM tag added to every chunk
+TAG_SIZE = 16
+
+
+# Raised when a blob was changed, cut short or opened with the wrong key
+class BlobError(Exception):
+    pass
+
+
+# New random key for one blob
+def new_data_key():
+    return AESGCM.generate_key(bit_length=256)
+
+
+# Nonce for chunk number `index`: prefix + counter + "is this the last chunk" flag
+#
+# This is the STREAM construction: chunks can't be reordered (counter) and the
+# file can't be cut short without noticing (only the real last chunk has flag 1).
+def _nonce(prefix, index, last):
+    return prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+# Encrypt everything from `reader` into `writer`, one chunk at a time
+#
+# Returns (plaintext size, number of chunks). Memory use is about two chunks
+# no matter how big the input is.
+def encrypt_stream(reader, writer, key, chunk_size=CHUNK_SIZE):
+    aead = AESGCM(key)
+    prefix = os.urandom(7)
+    writer.write(HEADER.pack(MAGIC, chunk_size, prefix))
+
+    size = 0
+    index = 0
+    chunk = reader.read(chunk_size)
+    while True:
+        # Read one chunk ahead so we know which chunk is the last one
+        next_chunk = reader.read(chunk_size)
+        last = not next_chunk
+        writer.write(aead.encrypt(_nonce(prefix, index, last), chunk, None))
+        size += len(chunk)
+        index += 1
+        if last:
+            return size, index
+        chunk = next_chunk
+
+
+# Read and check a blob's header, returns (chunk size, nonce prefix)
+def _read_header(reader):
+    header = reader.read(HEADER.size)
+    if len(header) != HEADER.size:
+        raise BlobError("Not a vault blob.")
+    magic, chunk_size, prefix = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise BlobError("Not a vault blob.")
+    return chunk_size, prefix
+
+
+# Decrypt a blob chunk by chunk (a generator of plaintext chunks)
+def decrypt_stream(reader, key):
+    aead = AESGCM(key)
+    chunk_size, prefix = _read_header(reader)
+
+    index = 0
+    chunk = reader.read(chunk_size + TAG_SIZE)
+    while True:
+        next_chunk = reader.read(chunk_size + TAG_SIZE)
+        last = not next_chunk
+        try:
+            yield aead.decrypt(_nonce(prefix, index, last), chunk, None)
+        except InvalidTag:
+            raise BlobError("Blob is damaged, cut short or the key is wrong.")
+        if last:
+            return
+        index += 1
+        chunk = next_chunk
+
+
+# Decrypt only chunk number `index` of a blob with `chunks` chunks
+def decrypt_chunk(reader, key, index, chunks):
+    reader.seek(0)
+    chunk_size, prefix = _read_header(reader)
+    if not 0 <= index < chunks:
+        raise BlobError("Chunk number out of range.")
+
+    reader.seek(HEADER.size + index * (chunk_size + TAG_SIZE))
+    try:
+        return AESGCM(key).decrypt(_nonce(prefix, index, index == chunks - 1),
+                                   reader.read(chunk_size + TAG_SIZE), None)
+    except InvalidTag:
+        raise BlobError("Blob is damaged or the key is wrong.")
+
+
+# Decrypt `length` bytes starting at plaintext byte `start`, touching only the chunks needed
+def decrypt_range(reader, key, start, length, chunks):
+    reader.seek(0)
+    chunk_size, _ = _read_header(reader)
+    data = b""
+    first = start // chunk_size
+    last = min((start + length - 1) // chunk_size, chunks - 1)
+    for index in range(first, last + 1):
+        data += decrypt_chunk(reader, key, index, chunks)
+    offset = start - first * chunk_size
+    return data[offset:offset + length]
+
+
+# Encrypted files on disk, one file per blob (the index only keeps their metadata)
+class BlobStore:
+    def __init__(self, blob_dir):
+        self.blob_dir = blob_dir
+        os.makedirs(blob_dir, exist_ok=True)
+
+    def path(self, blob_id):
+        return os.path.join(self.blob_dir, blob_id + ".bin")
+
+    # Encrypt a file-like object into a new blob, returns (blob id, size, chunks)
+    def put(self, reader, key):
+        blob_id = secrets.token_hex(16)
+        temp_file = self.path(blob_id) + ".tmp"
+        try:
+            with open(temp_file, "wb") as writer:
+                size, chunks = encrypt_stream(reader, writer, key)
+                writer.flush()
+                os.fsync(writer.fileno())
+        except BaseException:
+            # Reading the file failed or was stopped, don't leave half a blob behind
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(temp_file)
+            raise
+        os.replace(temp_file, self.path(blob_id))
+        return blob_id, size, chunks
+
+    # Open a blob for reading (use with decrypt_stream, decrypt_chunk or decrypt_range)
+    def open(self, blob_id):
+        return open(self.path(blob_id), "rb")
+
+    # Decrypt a whole blob into a file, chunk by chunk
+    def decrypt_to(self, blob_id, key, writer):
+        with self.open(blob_id) as reader:
+            for chunk in decrypt_stream(reader, key):
+                writer.write(chunk)
+
+    def delete(self, blob_id):
+        os.remove(self.path(blob_id))
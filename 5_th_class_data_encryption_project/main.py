@@ -1,9 +1,24 @@
 import streamlit as st
-import hashlib
-from cryptography.fernet import Fernet
-import json
 import time
 import os
+import io
+import sys
+import uuid
+from vault_store import VaultStore
+from vault_crypto import (SCHEME, Keyring, LegacyKeyMissing, decrypt_entry, decrypt_legacy, encrypt_entry, token_text,
+                          unwrap_data_key, wrap_data_key)
+from blob_store import BlobError, BlobStore, new_data_key
+from rate_limit import RateLimiter
+from passwords import HashingBusy, hash_password_pooled, verify_password_pooled
+from search_index import MIN_PREFIX, PAGE_SIZE, SearchIndex, words
+from audit_log import AuditLog
+
+# Rerun profiler shared by the apps (set APP_PROFILE=1 to turn it on)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+import rerun_profiler
+import job_queue
+
+profile = rerun_profiler.start("Secure Data Encryption System")
 
 # Page configuration
 st.set_page_config(
@@ -13,157 +28,263 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for better UI
-st.markdown("""
-<style>
-    .main-header {
-        font-size: 2.5rem;
-        color: #1E88E5;
-        text-align: center;
-        margin-bottom: 1rem;
-    }
-    .sub-header {
-        font-size: 1.8rem;
-        color: #0D47A1;
-        margin-top: 1rem;
-        margin-bottom: 1rem;
-    }
-    .card {
-        background-color: #f8f9fa;
-        border-radius: 10px;
-        padding: 20px;
-        margin-bottom: 20px;
-        box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
-    }
-    .button-container {
-        display: flex;
-        justify-content: center;
-        gap: 10px;
-        margin-top: 20px;
-    }
-    .stButton button {
-        width: 100%;
-    }
-    .nav-button {
-        background-color: #f0f2f6;
-        border-radius: 5px;
-        padding: 10px;
-        text-align: center;
-        cursor: pointer;
-        margin: 5px;
-    }
-    .nav-button:hover {
-        background-color: #e0e2e6;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Custom CSS for better UI (read from disk once per server process)
+@st.cache_resource
+def load_css():
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css"), "r") as f:
+        return f.read()
+
+st.markdown(load_css(), unsafe_allow_html=True)
 
 # Initialize session state variables
 if 'page' not in st.session_state:
     st.session_state.page = 'welcome'
 
-if 'users' not in st.session_state:
-    st.session_state.users = {}
-
 if 'current_user' not in st.session_state:
     st.session_state.current_user = None
 
-if 'stored_data' not in st.session_state:
-    st.session_state.stored_data = {}
-
-if 'failed_attempts' not in st.session_state:
-    st.session_state.failed_attempts = 0
-
-if 'locked_until' not in st.session_state:
-    st.session_state.locked_until = 0
-
-if 'key' not in st.session_state:
-    st.session_state.key = Fernet.generate_key()
-    st.session_state.cipher = Fernet(st.session_state.key)
+# Keys derived from passkeys in this session, so a passkey is only stretched once
+if 'key_cache' not in st.session_state:
+    st.session_state.key_cache = {}
 
 # File paths
+DATA_DIR = "vault_data"
+MASTER_KEY_FILE = "master.key"
+SEARCH_KEY_FILE = "search.key"
+
+# Old single-file storage, copied into DATA_DIR the first time the app runs
 USERS_FILE = "users.json"
 DATA_FILE = "encrypted_data.json"
 
-# Load users from file
-def load_users():
-    try:
-        if os.path.exists(USERS_FILE):
-            with open(USERS_FILE, "r") as f:
-                st.session_state.users = json.load(f)
-    except Exception as e:
-        st.error(f"Error loading users: {e}")
-
-# Save users to file
-def save_users():
-    try:
-        with open(USERS_FILE, "w") as f:
-            json.dump(st.session_state.users, f)
-    except Exception as e:
-        st.error(f"Error saving users: {e}")
+# Open the vault once per server process and share it between sessions
+@st.cache_resource
+def get_vault():
+    return VaultStore(DATA_DIR, USERS_FILE, DATA_FILE)
 
-# Load encrypted data from file
-def load_data():
-    try:
-        if os.path.exists(DATA_FILE):
-            with open(DATA_FILE, "r") as f:
-                st.session_state.stored_data = json.load(f)
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-
-# Save encrypted data to file
-def save_data():
-    try:
-        with open(DATA_FILE, "w") as f:
-            json.dump(st.session_state.stored_data, f)
-    except Exception as e:
-        st.error(f"Error saving data: {e}")
+# Master key file, also shared between sessions
+@st.cache_resource
+def get_keyring():
+    return Keyring(MASTER_KEY_FILE)
+
+# Encrypted files are kept next to the vault, the vault only keeps their metadata
+@st.cache_resource
+def get_blob_store():
+    return BlobStore(os.path.join(DATA_DIR, "blobs"))
+
+# Failed attempts and lockouts, shared by all sessions so a new tab doesn't reset them
+@st.cache_resource
+def get_limiter():
+    return RateLimiter(max_failures=3, lockout_seconds=30)
+
+# Encrypted index over entry titles, shares the vault's file cache
+@st.cache_resource
+def get_search_index():
+    return SearchIndex(DATA_DIR, SEARCH_KEY_FILE, get_vault().cache, get_vault().lock)
+
+# Logins, stores, decrypt attempts and lockouts (written by a background thread)
+@st.cache_resource
+def get_audit_log():
+    return AuditLog(os.path.join(DATA_DIR, "audit"))
+
+# Encrypting and saving new entries runs here, so the page can show progress meanwhile
+@st.cache_resource
+def get_jobs():
+    return job_queue.JobQueue(os.path.join(DATA_DIR, "jobs.sqlite3"))
+
+with profile.stage("open vault"):
+    vault = get_vault()
+    limiter = get_limiter()
+    audit_log = get_audit_log()
 
-# Load data at startup
-load_users()
-load_data()
+# Reverse proxies allowed to tell us the client's address in X-Forwarded-For,
+# e.g. VAULT_TRUSTED_PROXIES="127.0.0.1,10.0.0.2" (none by default, the header is then ignored)
+TRUSTED_PROXIES = {address.strip() for address in os.environ.get("VAULT_TRUSTED_PROXIES", "").split(",")
+                   if address.strip()}
 
-# Function to hash password
+# Streamlit gives no address for connections from this machine
+LOCAL_ADDRESSES = {"127.0.0.1", "::1", "localhost"}
+if TRUSTED_PROXIES & LOCAL_ADDRESSES:
+    TRUSTED_PROXIES |= LOCAL_ADDRESSES
+
+# Who is making the request, used for rate limits and the audit log
+#
+# The connection's address, or behind a trusted proxy the right-most address
+# in X-Forwarded-For that no trusted proxy added (the ones left of it are
+# whatever the client sent, so they can't be believed). Connections from this
+# machine have no address, each browser session gets its own id then, so they
+# don't all share one limit that a single client could use up.
+def client_id():
+    address = st.context.ip_address or "localhost"
+    if address in TRUSTED_PROXIES:
+        hops = [hop.strip() for hop in st.context.headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+        for hop in reversed(hops):
+            if hop not in TRUSTED_PROXIES:
+                return hop
+    if st.context.ip_address is None:
+        if 'client_key' not in st.session_state:
+            st.session_state.client_key = f"local-{uuid.uuid4().hex[:12]}"
+        return st.session_state.client_key
+    return address
+
+# Add an event to the audit log (only queued here, so it costs a few microseconds)
+def audit(event, user=None, **details):
+    audit_log.record(event, user or st.session_state.current_user, client_id(), **details)
+
+# Count a failed attempt, and log the lockout if this attempt caused one
+def record_failure(key):
+    lockout = limiter.record_failure(key)
+    if lockout:
+        audit("lockout", key[0], scope=key[2], seconds=lockout)
+
+# Key for counting the current user's failed decrypt attempts
+def decrypt_key():
+    return (st.session_state.current_user, client_id(), "decrypt")
+
+# Function to hash password (salted scrypt, runs on a bounded worker pool)
 def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+    with profile.stage("hash password"):
+        return hash_password_pooled(password)
 
-# Function to encrypt data
-def encrypt_data(text, passkey):
-    return st.session_state.cipher.encrypt(text.encode()).decode()
+# Function to check a password, returns (matches, needs_rehash)
+def check_password(password, stored_hash):
+    with profile.stage("check password"):
+        return verify_password_pooled(password, stored_hash)
 
 # Function to decrypt data
 def decrypt_data(encrypted_text, passkey):
-    hashed_passkey = hash_password(passkey)
-    
     # Check if the encrypted_text exists and belongs to the current user
-    if (encrypted_text in st.session_state.stored_data and 
-        st.session_state.stored_data[encrypted_text]["user"] == st.session_state.current_user):
-        # Check if the passkey matches
-        if st.session_state.stored_data[encrypted_text]["passkey"] == hashed_passkey:
-            st.session_state.failed_attempts = 0
+    entry_id = vault.find_by_ciphertext(st.session_state.current_user, encrypted_text)
+    if entry_id is not None:
+        entry = vault.get_entry(st.session_state.current_user, entry_id)
+        
+        if entry.get("scheme") == SCHEME:
+            entry = vault.with_ciphertext(st.session_state.current_user, [entry])[0]
+            # The passkey is checked by unwrapping the entry's data key
+            decrypted_text = decrypt_entry(entry, passkey, get_keyring(), st.session_state.key_cache)
+            if decrypted_text is not None:
+                limiter.record_success(decrypt_key())
+                audit("decrypt", entry_id=entry_id)
+                return decrypted_text
+        elif check_password(passkey, entry["passkey"])[0]:
+            # Entries from older versions: the passkey was right, the text opens if its key is in the key file
+            limiter.record_success(decrypt_key())
             try:
-                return st.session_state.cipher.decrypt(encrypted_text.encode()).decode()
-            except Exception:
-                return None
-    
-    st.session_state.failed_attempts += 1
+                decrypted_text = decrypt_legacy(entry["encrypted_text"], get_keyring())
+            except LegacyKeyMissing:
+                audit("decrypt_failed", entry_id=entry_id, legacy=True, reason="key_missing")
+                raise
+            audit("decrypt", entry_id=entry_id, legacy=True)
+            
+            # Encrypt it again like a new entry, so it has its own data key and no passkey hash
+            new_entry = encrypt_entry(decrypted_text, passkey, get_keyring(), st.session_state.key_cache)
+            vault.replace_entry(st.session_state.current_user, entry_id,
+                                dict(new_entry, title=entry.get("title", "Untitled"),
+                                     created_at=entry.get("created_at", time.time())))
+            return decrypted_text
+    
+    audit("decrypt_failed", entry_id=entry_id)
+    record_failure(decrypt_key())
+    return None
+
+# Job that encrypts and saves a new entry, the text or a file encrypted chunk by chunk
+#
+# It runs in a worker thread, outside the script, so the session's user, client and
+# key cache, and the cached keyring, blob store and search index are passed in.
+# Returns the new entry's id and the fields to show on the page.
+def store_entry(job, user, client, key_cache, keyring, blob_store, search_index, title, passkey,
+                text=None, file=None, file_name=None, size=0):
+    if file is None:
+        job.check()
+        job.progress(0.0, "encrypting")
+        entry = encrypt_entry(text, passkey, keyring, key_cache)
+    else:
+        data_key = new_data_key()
+        blob_id, size, chunks = blob_store.put(job.reader(file, size, "Encrypting"), data_key)
+        entry = wrap_data_key(data_key, passkey, keyring, key_cache)
+        entry.update({
+            "kind": "file",
+            "blob_id": blob_id,
+            "file_name": file_name,
+            "size": size,
+            "chunks": chunks
+        })
+    
+    # Last chance to stop, nothing is saved before this
+    try:
+        job.check()
+    except job_queue.JobCancelled:
+        if file is not None:
+            # The blob isn't in any entry yet
+            blob_store.delete(blob_id)
+        raise
+    job.progress(1.0, "saving")
+    entry_id = vault.add_entry(user, dict(entry, title=title, created_at=time.time()))
+    search_index.add(user, [(entry_id, title)])
+    if file is None:
+        audit_log.record("store", user, client, entry_id=entry_id, kind="text")
+        return {"entry_id": entry_id, "encrypted_text": token_text(entry)}
+    audit_log.record("store", user, client, entry_id=entry_id, kind="file", size=size)
+    return {"entry_id": entry_id, "size": size, "chunks": entry["chunks"]}
+
+# Function to decrypt a stored file into memory, returns a BytesIO (None if the passkey is wrong)
+def decrypt_file(entry_id, passkey):
+    entry = vault.get_entry(st.session_state.current_user, entry_id)
+    if entry is not None:
+        data_key = unwrap_data_key(entry, passkey, get_keyring(), st.session_state.key_cache)
+        if data_key is not None:
+            limiter.record_success(decrypt_key())
+            audit("decrypt", entry_id=entry_id, kind="file")
+            # st.download_button needs the whole file, the plaintext never goes to disk
+            output = io.BytesIO()
+            get_blob_store().decrypt_to(entry["blob_id"], data_key, output)
+            return output
+    
+    audit("decrypt_failed", entry_id=entry_id, kind="file")
+    record_failure(decrypt_key())
     return None
 
+# Function to find the current user's entries by title, returns (page of (id, entry), total)
+def search_entries(query, page):
+    user = st.session_state.current_user
+    
+    # Entries stored before the index existed (or by another tool) are indexed here once
+    search_index = get_search_index()
+    if search_index.count(user) != vault.count_for_user(user):
+        search_index.rebuild(user, [(entry_id, entry.get("title", "Untitled"))
+                                    for entry_id, entry in vault.entries_for_user(user)])
+    
+    if not query.strip():
+        return vault.entries_page(user, page * PAGE_SIZE, PAGE_SIZE), vault.count_for_user(user)
+    
+    entry_ids, total = search_index.search(user, query, page)
+    return [(entry_id, vault.get_entry(user, entry_id)) for entry_id in entry_ids], total
+
+# Function to leave the page once too many failed attempts locked the user out
+def check_failed_attempts():
+    if limiter.locked_for(decrypt_key()) > 0:
+        go_to_page('dashboard')
+
 # Navigation functions
 def go_to_page(page):
     st.session_state.page = page
     st.rerun()
 
 def logout():
+    audit("logout")
     st.session_state.current_user = None
     st.session_state.page = 'welcome'
     st.rerun()
 
 # Check if system is locked
-current_time = time.time()
-if st.session_state.locked_until > current_time:
-    st.error(f"🔒 System locked due to too many failed attempts. Try again in {int(st.session_state.locked_until - current_time)} seconds.")
-    st.stop()
+if st.session_state.current_user:
+    locked_for = limiter.locked_for(decrypt_key())
+    if locked_for > 0:
+        st.error(f"🔒 System locked due to too many failed attempts. Try again in {int(locked_for) + 1} seconds.")
+        st.stop()
+
+# Message from the page we just came from (shown once, no need to wait before switching pages)
+if 'flash' in st.session_state:
+    st.success(st.session_state.pop('flash'))
 
 # Welcome Page
 if st.session_state.page == 'welcome':
@@ -205,20 +326,22 @@ elif st.session_state.page == 'register':
     if st.button("Register"):
         if not username or not password:
             st.error("Username and password are required!")
-        elif username in st.session_state.users:
+        elif vault.get_user(username) is not None:
             st.error("Username already exists! Please choose another one.")
         elif password != confirm_password:
             st.error("Passwords do not match!")
         else:
-            # Register the user
-            st.session_state.users[username] = {
-                "password": hash_password(password),
-                "created_at": time.time()
-            }
-            save_users()
-            st.success("Registration successful! Please login.")
-            time.sleep(1)
-            go_to_page('login')
+            try:
+                password_hash = hash_password(password)
+            except HashingBusy as e:
+                st.error(str(e))
+            else:
+                if not vault.add_user(username, {"password": password_hash, "created_at": time.time()}):
+                    st.error("Username already exists! Please choose another one.")
+                else:
+                    audit("register", username)
+                    st.session_state.flash = "Registration successful! Please login."
+                    go_to_page('login')
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -236,17 +359,45 @@ elif st.session_state.page == 'login':
     password = st.text_input("Password", type="password")
     
     if st.button("Login"):
+        user = vault.get_user(username) if username else None
+        login_key = (username, client_id(), "login")
         if not username or not password:
             st.error("Username and password are required!")
-        elif username not in st.session_state.users:
+        elif limiter.locked_for(login_key) > 0:
+            audit("login_blocked", username, reason="locked")
+            st.error(f"🔒 Too many failed logins. Try again in {int(limiter.locked_for(login_key)) + 1} seconds.")
+        elif not limiter.allow(client_id()):
+            audit("login_blocked", username, reason="rate_limited")
+            st.error("Too many login attempts. Please wait a moment and try again.")
+        elif user is None:
+            audit("login_failed", username, reason="unknown_user")
+            record_failure(login_key)
             st.error("Username not found!")
-        elif st.session_state.users[username]["password"] != hash_password(password):
-            st.error("Incorrect password!")
         else:
-            st.session_state.current_user = username
-            st.success(f"Welcome back, {username}!")
-            time.sleep(1)
-            go_to_page('dashboard')
+            try:
+                password_ok, needs_rehash = check_password(password, user["password"])
+            except HashingBusy as e:
+                password_ok, needs_rehash = None, False
+                st.error(str(e))
+            
+            if password_ok is False:
+                audit("login_failed", username, reason="wrong_password")
+                record_failure(login_key)
+                st.error("Incorrect password!")
+            elif password_ok:
+                limiter.record_success(login_key)
+                audit("login", username)
+                
+                # Upgrade the stored hash if it was made with old settings (or at the next login if we're busy)
+                if needs_rehash:
+                    try:
+                        vault.update_user(username, {"password": hash_password(password)})
+                    except HashingBusy:
+                        pass
+                
+                st.session_state.current_user = username
+                st.session_state.flash = f"Welcome back, {username}!"
+                go_to_page('dashboard')
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -277,8 +428,7 @@ elif st.session_state.page == 'dashboard':
     st.markdown("<h2 class='sub-header'>Your Dashboard</h2>", unsafe_allow_html=True)
     
     # Count user's encrypted data
-    user_data_count = sum(1 for _, data in st.session_state.stored_data.items() 
-                          if data.get("user") == st.session_state.current_user)
+    user_data_count = vault.count_for_user(st.session_state.current_user)
     
     st.write(f"You have {user_data_count} encrypted entries stored.")
     
@@ -291,6 +441,15 @@ elif st.session_state.page == 'dashboard':
     Your data is encrypted using a secure algorithm and can only be accessed with the correct passkey.
     """)
     
+    # Logins, stores and decrypt attempts on this account in the last week
+    with st.expander("Recent activity"):
+        events = audit_log.query(st.session_state.current_user, time.time() - 7 * 24 * 3600)
+        if not events:
+            st.write("No activity recorded yet.")
+        for event in reversed(events[-20:]):
+            st.write(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['time']))} - "
+                     f"{event['event'].replace('_', ' ')} from {event['client']}")
+    
     st.markdown("</div>", unsafe_allow_html=True)
 
 # Store Data Page
@@ -304,37 +463,64 @@ elif st.session_state.page == 'store_data':
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h2 class='sub-header'>Store Data Securely</h2>", unsafe_allow_html=True)
     
+    store_type = st.radio("What do you want to store?", ["Text", "File"], horizontal=True)
+    
     data_title = st.text_input("Data Title (optional)")
-    user_data = st.text_area("Enter Data to Encrypt:", height=150)
+    if store_type == "Text":
+        user_data = st.text_area("Enter Data to Encrypt:", height=150)
+    else:
+        uploaded_file = st.file_uploader("Choose a file to encrypt")
     passkey = st.text_input("Enter Encryption Passkey:", type="password", 
                            help="This is the key you'll need to decrypt your data later")
     confirm_passkey = st.text_input("Confirm Passkey:", type="password")
     
-    if st.button("Encrypt & Save"):
+    # Encrypting runs as a job, what's needed from the upload and the session is collected here
+    def start_store(kind, title, **data):
+        st.session_state.store_job = get_jobs().submit(
+            f"store {kind}", store_entry, st.session_state.current_user, client_id(),
+            st.session_state.key_cache, get_keyring(), get_blob_store(), get_search_index(), title, passkey, **data)
+    
+    if store_type == "File" and st.button("Encrypt & Save File"):
+        if not uploaded_file or not passkey:
+            st.error("File and passkey are required!")
+        elif passkey != confirm_passkey:
+            st.error("Passkeys do not match!")
+        else:
+            start_store("file", data_title if data_title else uploaded_file.name,
+                        file=uploaded_file, file_name=uploaded_file.name,
+                        size=uploaded_file.size)
+    
+    if store_type == "Text" and st.button("Encrypt & Save"):
         if not user_data or not passkey:
             st.error("Data and passkey are required!")
         elif passkey != confirm_passkey:
             st.error("Passkeys do not match!")
         else:
-            hashed_passkey = hash_password(passkey)
-            encrypted_text = encrypt_data(user_data, passkey)
-            
-            # Store with user information
-            st.session_state.stored_data[encrypted_text] = {
-                "encrypted_text": encrypted_text,
-                "passkey": hashed_passkey,
-                "user": st.session_state.current_user,
-                "title": data_title if data_title else "Untitled",
-                "created_at": time.time()
-            }
-            
-            save_data()
-            st.success("✅ Data stored securely!")
-            
-            # Display the encrypted text for the user to copy
-            st.subheader("Your Encrypted Data:")
-            st.code(encrypted_text, language="text")
-            st.info("👆 Copy this encrypted text. You'll need it to retrieve your data later.")
+            start_store("text", data_title if data_title else "Untitled", text=user_data)
+    
+    # Progress while the entry is encrypted, then the result (shown once)
+    if st.session_state.get("store_job"):
+        job = job_queue.show_progress(get_jobs(), st.session_state.store_job, "Encrypting and saving")
+        if job is not None:
+            job_id = st.session_state.pop("store_job")
+            try:
+                result = get_jobs().result(job_id)
+            except job_queue.JobFailed as e:
+                if job["status"] == "cancelled":
+                    st.info("Cancelled, nothing was saved.")
+                else:
+                    st.error(f"Error saving data: {e}")
+            else:
+                if "encrypted_text" not in result:
+                    st.success(f"✅ File stored securely! ({result['size'] / 1024:.1f} KB "
+                               f"in {result['chunks']} encrypted chunks)")
+                else:
+                    st.success("✅ Data stored securely!")
+                    
+                    # Display the encrypted text for the user to copy
+                    st.subheader("Your Encrypted Data:")
+                    st.code(result["encrypted_text"], language="text")
+                    st.info("👆 Copy this encrypted text. You'll need it to retrieve your data later.")
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -356,26 +542,97 @@ elif st.session_state.page == 'retrieve_data':
     st.markdown(f"<p style='text-align: center;'>Logged in as: <b>{st.session_state.current_user}</b></p>", unsafe_allow_html=True)
     
     # Display attempts remaining
-    attempts_remaining = 3 - st.session_state.failed_attempts
+    attempts_remaining = limiter.remaining(decrypt_key())
     st.info(f"Attempts remaining: {attempts_remaining}")
     
     st.markdown("<div class='card'>", unsafe_allow_html=True)
     st.markdown("<h2 class='sub-header'>Retrieve Your Data</h2>", unsafe_allow_html=True)
     
-    # Show user's stored data titles if available
-    user_data = {k: v for k, v in st.session_state.stored_data.items() 
-                if v.get("user") == st.session_state.current_user}
-    
-    if user_data:
+    # Find stored data by title, one page at a time
+    if vault.count_for_user(st.session_state.current_user):
         st.subheader("Your Stored Data:")
-        for encrypted_text, data in user_data.items():
-            st.write(f"- {data.get('title', 'Untitled')}")
-            if st.button(f"Use this entry: {data.get('title', 'Untitled')}", key=encrypted_text):
-                st.session_state.selected_encrypted_text = encrypted_text
+        query = st.text_input("Search titles", placeholder="Type the start of any word in a title")
+        
+        # Go back to the first page when the search changes
+        if st.session_state.get('search_query') != query:
+            st.session_state.search_query = query
+            st.session_state.search_page = 0
+        page = st.session_state.get('search_page', 0)
+        
+        # Only prefixes of MIN_PREFIX letters and up are indexed, so shorter words can't be searched
+        short_words = [word for word in words(query) if len(word) < MIN_PREFIX]
+        if short_words:
+            st.info(f"Type at least {MIN_PREFIX} letters of each word to search.")
+            results, total = [], 0
+        else:
+            with profile.stage("search"):
+                results, total = search_entries(query, page)
+        pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+        
+        if not results and not short_words:
+            st.write("No entries match your search.")
+        for entry_id, data in results:
+            if data.get("kind") == "file":
+                st.write(f"- 📄 {data.get('title', 'Untitled')} ({data['size'] / 1024:.1f} KB)")
+                if st.button(f"Use this file: {data.get('title', 'Untitled')}", key=entry_id):
+                    st.session_state.selected_file_id = entry_id
+                    st.session_state.pop('selected_encrypted_text', None)
+                    st.rerun()
+            else:
+                st.write(f"- {data.get('title', 'Untitled')}")
+                if st.button(f"Use this entry: {data.get('title', 'Untitled')}", key=entry_id):
+                    st.session_state.selected_encrypted_text = token_text(
+                        vault.with_ciphertext(st.session_state.current_user, [data])[0])
+                    st.session_state.pop('selected_file_id', None)
+                    st.rerun()
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("Previous", key="previous_page", disabled=page == 0):
+                st.session_state.search_page = page - 1
+                st.rerun()
+        with col2:
+            st.write(f"Page {page + 1} of {pages} ({total} entries)")
+        with col3:
+            if st.button("Next", key="next_page", disabled=page + 1 >= pages):
+                st.session_state.search_page = page + 1
                 st.rerun()
     else:
         st.warning("You don't have any stored data yet. Go to Store Data to encrypt some information.")
     
+    # A selected file is decrypted chunk by chunk into a download
+    selected_file = vault.get_entry(st.session_state.current_user, st.session_state.get('selected_file_id'))
+    if selected_file:
+        st.subheader("Selected File:")
+        st.write(f"{selected_file['file_name']} ({selected_file['size'] / 1024:.1f} KB)")
+        file_passkey = st.text_input("Enter Passkey:", type="password", key="file_passkey")
+        
+        if st.button("Decrypt File"):
+            if not limiter.allow(client_id()):
+                audit("decrypt_blocked", entry_id=selected_file["id"], reason="rate_limited")
+                st.error("Too many attempts. Please wait a moment and try again.")
+            else:
+                try:
+                    with profile.stage("decrypt file"):
+                        decrypted_file = decrypt_file(selected_file["id"], file_passkey)
+                except BlobError as e:
+                    decrypted_file = None
+                    st.error(f"❌ {e}")
+                
+                if decrypted_file:
+                    st.success("✅ Decryption successful!")
+                    try:
+                        st.download_button("Download decrypted file", data=decrypted_file,
+                                           file_name=selected_file["file_name"])
+                    finally:
+                        # Streamlit keeps its own copy for the download
+                        decrypted_file.close()
+                else:
+                    st.error(f"❌ Incorrect passkey! Attempts remaining: {limiter.remaining(decrypt_key())}")
+                    check_failed_attempts()
+        
+        st.markdown("---")
+    
     # If user selected an entry or wants to enter manually
     if 'selected_encrypted_text' in st.session_state:
         st.subheader("Selected Entry:")
@@ -391,27 +648,30 @@ elif st.session_state.page == 'retrieve_data':
     if st.button("Decrypt"):
         if not encrypted_text or not passkey:
             st.error("Encrypted data and passkey are required!")
+        elif not limiter.allow(client_id()):
+            audit("decrypt_blocked", reason="rate_limited")
+            st.error("Too many attempts. Please wait a moment and try again.")
         else:
-            decrypted_text = decrypt_data(encrypted_text, passkey)
-            
-            if decrypted_text:
-                st.success("✅ Decryption successful!")
-                st.subheader("Decrypted Data:")
-                st.code(decrypted_text, language="text")
-                
-                # Reset selected entry
-                if 'selected_encrypted_text' in st.session_state:
-                    del st.session_state.selected_encrypted_text
+            try:
+                with profile.stage("decrypt"):
+                    decrypted_text = decrypt_data(encrypted_text, passkey)
+            except HashingBusy as e:
+                # Old entries check the passkey with a password hash, this isn't a failed attempt
+                st.error(str(e))
+            except LegacyKeyMissing as e:
+                st.error(f"❌ {e}")
             else:
-                st.error(f"❌ Incorrect passkey or data! Attempts remaining: {3 - st.session_state.failed_attempts}")
-                
-                if st.session_state.failed_attempts >= 3:
-                    # Lock the system for 30 seconds
-                    st.session_state.locked_until = time.time() + 30
-                    st.warning("🔒 Too many failed attempts! System locked for 30 seconds.")
-                    st.session_state.failed_attempts = 0
-                    time.sleep(1)
-                    go_to_page('dashboard')
+                if decrypted_text:
+                    st.success("✅ Decryption successful!")
+                    st.subheader("Decrypted Data:")
+                    st.code(decrypted_text, language="text")
+                    
+                    # Reset selected entry
+                    if 'selected_encrypted_text' in st.session_state:
+                        del st.session_state.selected_encrypted_text
+                else:
+                    st.error(f"❌ Incorrect passkey or data! Attempts remaining: {limiter.remaining(decrypt_key())}")
+                    check_failed_attempts()
     
     st.markdown("</div>", unsafe_allow_html=True)
     
@@ -419,8 +679,11 @@ elif st.session_state.page == 'retrieve_data':
     if st.button("Back to Dashboard", key="back_to_dashboard"):
         if 'selected_encrypted_text' in st.session_state:
             del st.session_state.selected_encrypted_text
+        st.session_state.pop('selected_file_id', None)
         go_to_page('dashboard')
 
 # Footer
 st.markdown("---")
-st.markdown("<p style='text-align: center;'>🔒 Secure Data Encryption System v2.0 | GIAIC Python Assignment</p>", unsafe_allow_html=True)
\ No newline at end of file
+st.markdown("<p style='text-align: center;'>🔒 Secure Data Encryption System v2.0 | GIAIC Python Assignment</p>", unsafe_allow_html=True)
+
+profile.panel()
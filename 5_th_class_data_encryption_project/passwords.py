@@ -0,0 +1,84 @@
+import base64
+import hashlib
+import hmac
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# scrypt cost for new hashes (N must be a power of two, see bench_password_cost.py)
+SCRYPT_N = int(os.environ.get("VAULT_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.environ.get("VAULT_SCRYPT_R", "8"))
+SCRYPT_P = int(os.environ.get("VAULT_SCRYPT_P", "1"))
+
+# Hashes running at the same time, and how many more may wait for a worker
+HASH_WORKERS = int(os.environ.get("VAULT_HASH_WORKERS", str(os.cpu_count() or 2)))
+HASH_QUEUE = HASH_WORKERS * 4
+
+# hashlib.scrypt releases the GIL, so threads really run in parallel
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(HASH_WORKERS + HASH_QUEUE)
+
+
+# Raised when too many hashes are already waiting
+class HashingBusy(Exception):
+    pass
+
+
+# Run scrypt with enough memory allowed for the chosen cost
+def _scrypt(password, salt, n, r, p):
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024, dklen=32)
+
+
+# Hash a password with a new random salt, the parameters are stored in the result
+#
+# Format: scrypt$N$r$p$<salt base64>$<hash base64>
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, n, r, p)
+    return "$".join(["scrypt", str(n), str(r), str(p),
+                     base64.b64encode(salt).decode(), base64.b64encode(digest).decode()])
+
+
+# Check a password against a stored hash
+#
+# Returns (matches, needs_rehash). needs_rehash is True when the hash was made
+# with other parameters than the current ones (or is an old unsalted sha256).
+# A damaged stored hash matches nothing.
+def verify_password(password, stored_hash):
+    # Old unsalted sha256 hex digest
+    if "$" not in stored_hash:
+        matches = hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored_hash)
+        return matches, matches
+
+    try:
+        _, n, r, p, salt, digest = stored_hash.split("$")
+        n, r, p = int(n), int(r), int(p)
+        matches = hmac.compare_digest(_scrypt(password, base64.b64decode(salt), n, r, p), base64.b64decode(digest))
+    except ValueError:
+        # Wrong number of fields, parameters that aren't numbers (or that scrypt refuses), bad base64
+        return False, False
+    return matches, matches and (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+
+
+# Run a hashing function on the worker pool and wait for its result
+#
+# Raises HashingBusy if no worker is free in time or the hash takes too long.
+def _run_in_pool(function, *args, timeout=30):
+    if not _slots.acquire(timeout=timeout):
+        raise HashingBusy("Too many logins at once, please try again.")
+    future = _pool.submit(function, *args)
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        raise HashingBusy("The server is busy, please try again.")
+
+
+# hash_password on the worker pool
+def hash_password_pooled(password):
+    return _run_in_pool(hash_password, password)
+
+
+# verify_password on the worker pool
+def verify_password_pooled(password, stored_hash):
+    return _run_in_pool(verify_password, password, stored_hash)
@@ -0,0 +1,134 @@
+import threading
+import time
+
+# Number of lock stripes, keys are spread over them so checks rarely wait on each other
+STRIPES = 64
+
+# A stripe's tables are swept for expired keys when they grow past this size
+SWEEP_SIZE = 10000
+
+
+# Failed-attempt lockout and attempt rate limiting shared by all sessions
+#
+# Failures are counted per key (e.g. (user, client, "login")) in a sliding
+# window. After max_failures in the window the key is locked for
+# lockout_seconds. Separately, each client gets a token bucket so it can't
+# hammer the login form with many usernames. Every check is O(1) and nothing
+# ever sleeps: excess attempts are simply rejected.
+class RateLimiter:
+    def __init__(self, max_failures=3, window_seconds=300, lockout_seconds=30,
+                 bucket_size=10, refill_per_second=10 / 60):
+        self.max_failures = max_failures
+        self.window_seconds = window_seconds
+        self.lockout_seconds = lockout_seconds
+        self.bucket_size = bucket_size
+        self.refill_per_second = refill_per_second
+
+        self._locks = [threading.Lock() for _ in range(STRIPES)]
+
+        # key -> [window start, failures this window, failures last window, locked until]
+        self._failures = [{} for _ in range(STRIPES)]
+
+        # client -> [tokens, last refill time]
+        self._buckets = [{} for _ in range(STRIPES)]
+
+    # ---- Failed attempts and lockout ----
+
+    # Seconds the key is still locked for (0 if it isn't locked)
+    def locked_for(self, key, now=None):
+        now = time.time() if now is None else now
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            state = self._failures[stripe].get(key)
+            if state is None:
+                return 0
+            return max(0, state[3] - now)
+
+    # Failures left before the key gets locked
+    def remaining(self, key, now=None):
+        now = time.time() if now is None else now
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            state = self._failures[stripe].get(key)
+            if state is None:
+                return self.max_failures
+            return max(0, self.max_failures - int(self._count(state, now)))
+
+    # Count a failed attempt, returns the lockout in seconds (0 if not locked)
+    def record_failure(self, key, now=None):
+        now = time.time() if now is None else now
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            table = self._failures[stripe]
+            if len(table) > SWEEP_SIZE:
+                self._sweep_failures(table, now)
+
+            state = table.setdefault(key, [now, 0, 0, 0])
+            self._roll(state, now)
+            state[1] += 1
+
+            if self._count(state, now) >= self.max_failures:
+                # Lock and start counting from zero again after the lockout
+                state[3] = now + self.lockout_seconds
+                state[0], state[1], state[2] = now, 0, 0
+                return self.lockout_seconds
+            return 0
+
+    # Forget a key's failures after a successful attempt
+    def record_success(self, key):
+        stripe = self._stripe(key)
+        with self._locks[stripe]:
+            state = self._failures[stripe].get(key)
+            # A success doesn't end a lockout that's still running
+            if state is not None and state[3] <= time.time():
+                del self._failures[stripe][key]
+
+    # ---- Attempt rate per client ----
+
+    # Take a token from the client's bucket, False if it's empty
+    def allow(self, client, now=None):
+        now = time.time() if now is None else now
+        stripe = self._stripe(client)
+        with self._locks[stripe]:
+            table = self._buckets[stripe]
+            if len(table) > SWEEP_SIZE:
+                self._sweep_buckets(table, now)
+
+            bucket = table.setdefault(client, [self.bucket_size, now])
+            bucket[0] = min(self.bucket_size, bucket[0] + (now - bucket[1]) * self.refill_per_second)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    # ---- Helpers ----
+
+    def _stripe(self, key):
+        return hash(key) % STRIPES
+
+    # Move the window forward if it has ended
+    def _roll(self, state, now):
+        elapsed = now - state[0]
+        if elapsed >= 2 * self.window_seconds:
+            state[0], state[1], state[2] = now, 0, 0
+        elif elapsed >= self.window_seconds:
+            state[0], state[1], state[2] = state[0] + self.window_seconds, 0, state[1]
+
+    # Sliding window estimate: this window + the part of the last window still inside it
+    def _count(self, state, now):
+        self._roll(state, now)
+        overlap = 1 - (now - state[0]) / self.window_seconds
+        return state[1] + state[2] * overlap
+
+    # Drop keys that aren't locked and have no failures left in the window
+    def _sweep_failures(self, table, now):
+        for key in [key for key, state in table.items()
+                    if state[3] <= now and now - state[0] >= 2 * self.window_seconds]:
+            del table[key]
+
+    # Drop buckets that have refilled completely (same as a new bucket)
+    def _sweep_buckets(self, table, now):
+        full_after = self.bucket_size / self.refill_per_second
+        for client in [client for client, bucket in table.items() if now - bucket[1] >= full_after]:
+            del table[client]
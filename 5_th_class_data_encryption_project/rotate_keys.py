@@ -0,0 +1,85 @@
+import argparse
+import time
+
+from cryptography.fernet import Fernet, InvalidToken
+
+from vault_crypto import SCHEME, Keyring, rewrap_entry
+from vault_store import VaultStore
+
+# Same paths the app uses
+DATA_DIR = "vault_data"
+MASTER_KEY_FILE = "master.key"
+
+# Seconds between adding the new key and dropping the old ones. A running app
+# picks the new key up on its next wrap, this covers an entry it wrapped with
+# the old key just before and hasn't saved yet.
+GRACE_SECONDS = 60
+
+
+# Make a new master key and re-wrap every entry's data key with it
+#
+# 1. the new key is added in front of the old ones (old entries still open)
+# 2. every wrapped data key is re-encrypted with the new key, shard by shard
+# 3. after the grace period, drop_old_keys checks every entry again and drops the old keys
+#
+# Shards are changed under the vault lock, so entries the app adds meanwhile
+# aren't lost. If the job stops half way, just run it again: nothing is lost until step 3.
+def rotate(store, keyring, keep_old_keys=False, grace_seconds=GRACE_SECONDS):
+    multi_fernet = keyring.add_key()
+    added = time.monotonic()
+    count = store.map_entries(lambda entry: rewrap_entry(entry, multi_fernet))
+    if not keep_old_keys:
+        time.sleep(max(0.0, grace_seconds - (time.monotonic() - added)))
+        drop_old_keys(store, keyring)
+    return count
+
+
+# Drop every key but the newest, once no entry needs them any more
+#
+# Holds the vault lock so nothing is saved meanwhile, and re-wraps entries
+# whose data key only opens with an old key (saved by the app with a key it
+# loaded before the rotation). Returns how many of those there were.
+def drop_old_keys(store, keyring):
+    with store.lock:
+        multi_fernet = keyring.fernet()
+        newest = Fernet(keyring.keys[0])
+        stragglers = 0
+
+        def check(entry):
+            nonlocal stragglers
+            if entry.get("scheme") != SCHEME:
+                return entry
+            try:
+                newest.decrypt(entry["wrapped_key"].encode())
+                return entry
+            except InvalidToken:
+                stragglers += 1
+                return rewrap_entry(entry, multi_fernet)
+
+        store.map_entries(check)
+        keyring.drop_old_keys()
+    return stragglers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rotate the vault master key")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--key-file", default=MASTER_KEY_FILE)
+    parser.add_argument("--keep-old-keys", action="store_true",
+                        help="Keep the old keys in the key file (drop them later with --drop-old-keys)")
+    parser.add_argument("--drop-old-keys", action="store_true",
+                        help="Only check every entry and drop the old keys of an earlier rotation")
+    parser.add_argument("--grace-seconds", type=float, default=GRACE_SECONDS,
+                        help="Wait this long after adding the new key before dropping the old ones")
+    args = parser.parse_args()
+
+    store, keyring = VaultStore(args.data_dir), Keyring(args.key_file)
+    start = time.perf_counter()
+    if args.drop_old_keys:
+        stragglers = drop_old_keys(store, keyring)
+        print(f"Dropped the old keys ({stragglers} entries still used them and were re-wrapped)")
+    else:
+        count = rotate(store, keyring, args.keep_old_keys, args.grace_seconds)
+        seconds = time.perf_counter() - start
+        print(f"Re-wrapped {count} entries in {seconds:.1f} s"
+              f"{'' if args.keep_old_keys else f' (with {args.grace_seconds:.0f} s before the old keys were dropped)'}")
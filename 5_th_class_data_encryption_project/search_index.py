@@ -0,0 +1,130 @@
+import hashlib
+import hmac
+import os
+import re
+import threading
+
+from vault_store import shard_name
+
+# Shortest and longest word prefix that goes into the index
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+
+# Results per page on the Retrieve page
+PAGE_SIZE = 10
+
+# Users whose posting-list sets are kept in memory for searching
+SET_CACHE_SIZE = 64
+
+
+# Split a title or query into lowercase words
+def words(text):
+    return [word for word in re.split(r"[^\w]+", text.lower()) if word]
+
+
+# Search index over entry titles that never stores the words themselves
+#
+# Every prefix of every title word (e.g. "ba", "ban", "bank") is turned into a
+# token with keyed BLAKE2b under a per-user key (HMAC of the username with the
+# index secret), and the index maps tokens to entry ids. Without the key file
+# the index shows which entries share words, but not what the words are.
+#
+# vault_data/search/<shard>.json -> {"count": entries indexed, "tokens": {token: [entry ids]}}
+class SearchIndex:
+    def __init__(self, data_dir, key_file, cache, lock=None):
+        self.search_dir = os.path.join(data_dir, "search")
+        os.makedirs(self.search_dir, exist_ok=True)
+        self.cache = cache
+
+        # Sets of the long posting lists used in searches, per index they were built from
+        # path -> (tokens dict, {id(posting list): set of entry ids})
+        self.sets = {}
+
+        # Updates are read-modify-write on a user's index file, so only one at a time
+        # (pass the vault's lock to also keep other processes out)
+        self.lock = lock or threading.Lock()
+
+        # Random secret for the index, made the first time
+        if not os.path.exists(key_file):
+            fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, "wb") as f:
+                f.write(os.urandom(32))
+        with open(key_file, "rb") as f:
+            self.secret = f.read()
+
+    # HMAC tokens for the words of a text (every prefix of each word, or just the whole words)
+    def tokens(self, user, text, all_prefixes=True):
+        user_key = hmac.new(self.secret, user.encode(), hashlib.sha256).digest()
+        tokens = []
+        for word in words(text):
+            word = word[:MAX_PREFIX].encode()
+            lengths = range(min(MIN_PREFIX, len(word)), len(word) + 1) if all_prefixes else [len(word)]
+            for length in lengths:
+                # Keyed BLAKE2b is a MAC in one call, much cheaper than HMAC for short prefixes
+                tokens.append(hashlib.blake2b(word[:length], key=user_key, digest_size=16).hexdigest())
+        return tokens
+
+    # Add entries to a user's index, entries is a list of (entry id, title)
+    def add(self, user, entries):
+        with self.lock:
+            self._add(user, entries, self.cache.get(self._path(user), {"count": 0, "tokens": {}}, fresh=True))
+
+    # Number of entries in a user's index
+    def count(self, user):
+        return self.cache.get(self._path(user), {"count": 0})["count"]
+
+    # Build a user's index from scratch (for entries stored before the index existed)
+    def rebuild(self, user, entries):
+        with self.lock:
+            self._add(user, entries, {"count": 0, "tokens": {}})
+
+    # Find entries whose title has a word starting with each word of the query
+    #
+    # Returns (entry ids for this page, total number of matches).
+    def search(self, user, query, page=0, page_size=PAGE_SIZE):
+        path = self._path(user)
+        index = self.cache.get(path, {"count": 0, "tokens": {}})["tokens"]
+
+        postings = [index.get(token, []) for token in self.tokens(user, query, all_prefixes=False)]
+        if not postings or not all(postings):
+            return [], 0
+
+        # Walk the shortest list and look the ids up in the others
+        postings.sort(key=len)
+        others = [self._posting_set(path, index, posting) for posting in postings[1:]]
+        matches = [entry_id for entry_id in postings[0] if all(entry_id in found for found in others)]
+
+        start = page * page_size
+        return matches[start:start + page_size], len(matches)
+
+    # ---- Helpers ----
+
+    def _add(self, user, entries, index):
+        # Copy the posting lists we change, other sessions may be reading the old ones
+        tokens = dict(index["tokens"])
+        changed = set()
+        for entry_id, title in entries:
+            for token in set(self.tokens(user, title)):
+                if token not in changed:
+                    tokens[token] = list(tokens.get(token, []))
+                    changed.add(token)
+                tokens[token].append(entry_id)
+
+        self.cache.put(self._path(user), {"count": index["count"] + len(entries), "tokens": tokens})
+
+    # Set of a posting list's entry ids, kept until the index changes
+    def _posting_set(self, path, index, posting):
+        cached = self.sets.get(path)
+        if cached is None or cached[0] is not index:
+            # A changed index is a new dict, so its sets are built again
+            if path not in self.sets and len(self.sets) >= SET_CACHE_SIZE:
+                self.sets.pop(next(iter(self.sets)))
+            cached = (index, {})
+            self.sets[path] = cached
+        found = cached[1].get(id(posting))
+        if found is None:
+            found = cached[1][id(posting)] = set(posting)
+        return found
+
+    def _path(self, user):
+        return os.path.join(self.search_dir, shard_name(user))
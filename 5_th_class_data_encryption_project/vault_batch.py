@@ -0,0 +1,205 @@
+import argparse
+import getpass
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet
+
+from passwords import verify_password
+from search_index import SearchIndex
+from vault_crypto import KDF_ITERATIONS, SCHEME, Keyring, decrypt_entry, derive_key, seal, wrap_with_key
+from vault_store import VaultStore
+
+# Same paths the app uses
+DATA_DIR = "vault_data"
+MASTER_KEY_FILE = "master.key"
+SEARCH_KEY_FILE = "search.key"
+
+# Records encrypted per shard write, and per job sent to a worker
+BATCH_SIZE = 50000
+CHUNK_SIZE = 1000
+
+# Set in each worker process by _init_worker
+_worker = {}
+
+
+# Raised when the user's login fails
+class NotAuthorized(Exception):
+    pass
+
+
+# Check the account password before any batch work (same check as the login page)
+def authorize(vault, user, password):
+    record = vault.get_user(user)
+    if record is None or not verify_password(password, record["password"])[0]:
+        raise NotAuthorized("Wrong username or password.")
+
+
+# ---- Worker side ----
+
+def _init_worker(key_file, passkey_key, salt, iterations, passkey):
+    _worker["keyring"] = Keyring(key_file)
+    _worker["passkey_key"] = passkey_key
+    _worker["salt"] = salt
+    _worker["iterations"] = iterations
+    _worker["passkey"] = passkey
+    _worker["key_cache"] = {}
+
+
+# Encrypt a chunk of records with one new data key each
+def _encrypt_chunk(records):
+    multi_fernet = _worker["keyring"].fernet()
+    entries = []
+    for record in records:
+        data_key = Fernet.generate_key()
+        entry = wrap_with_key(data_key, _worker["passkey_key"], _worker["salt"], _worker["iterations"], multi_fernet)
+        entry["ciphertext"] = seal(record["text"], data_key)
+        entry["title"] = record.get("title") or "Untitled"
+        entry["created_at"] = time.time()
+        entries.append(entry)
+    return entries
+
+
+# Decrypt a chunk of entries, the passkey is checked for every single entry
+def _decrypt_chunk(entries):
+    results = []
+    for entry in entries:
+        text = None
+        if entry.get("scheme") == SCHEME and ("encrypted_text" in entry or "ciphertext" in entry):
+            text = decrypt_entry(entry, _worker["passkey"], _worker["keyring"], _worker["key_cache"])
+        results.append((entry["id"], entry.get("title", "Untitled"), text))
+    return results
+
+
+# ---- Batch API ----
+
+# Split an iterable into lists of `size` items
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Encrypt many records for a user and store them
+#
+# records is an iterable of {"title": ..., "text": ...}. The passkey is
+# stretched once for the whole batch (all entries share one KDF salt), each
+# record still gets its own random data key. Records are encrypted across
+# `workers` processes and written with one shard write per `batch_size` records.
+#
+# Titles are added to search_index (if given) as each batch is stored.
+#
+# Returns stats: {"records": ..., "seconds": ..., "records_per_second": ...}
+def encrypt_records(vault, key_file, user, records, passkey, workers=None, batch_size=BATCH_SIZE, on_progress=None,
+                    search_index=None):
+    salt = os.urandom(16)
+    passkey_key = derive_key(passkey, salt, KDF_ITERATIONS)
+
+    stats = {"records": 0, "seconds": 0.0, "records_per_second": 0.0}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(key_file, passkey_key, salt, KDF_ITERATIONS, None)) as pool:
+        for batch in _chunks(records, batch_size):
+            entries = [entry for chunk in pool.map(_encrypt_chunk, _chunks(batch, CHUNK_SIZE)) for entry in chunk]
+            entry_ids = vault.add_entries(user, entries)
+            if search_index is not None:
+                search_index.add(user, [(entry_id, entry["title"]) for entry_id, entry in zip(entry_ids, entries)])
+
+            stats["records"] += len(entries)
+            stats["seconds"] = time.perf_counter() - start
+            stats["records_per_second"] = stats["records"] / stats["seconds"]
+            if on_progress:
+                on_progress(dict(stats))
+
+    return stats
+
+
+# Decrypt many of a user's entries in parallel
+#
+# Only the user's own entries can be selected, and each entry only opens with
+# its passkey. Yields (entry id, title, text) where text is None if the passkey
+# didn't open that entry.
+def decrypt_records(vault, key_file, user, passkey, entry_ids=None, workers=None):
+    if entry_ids is None:
+        entries = [entry for _, entry in vault.entries_for_user(user)]
+    else:
+        entries = [vault.get_entry(user, entry_id) for entry_id in entry_ids]
+        entries = [entry for entry in entries if entry is not None]
+
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(key_file, None, None, None, passkey)) as pool:
+        chunks = (vault.with_ciphertext(user, chunk) for chunk in _chunks(entries, CHUNK_SIZE))
+        for results in pool.map(_decrypt_chunk, chunks):
+            yield from results
+
+
+# ---- Command line ----
+
+# Read records from a JSON lines file, one {"title": ..., "text": ...} per line
+def read_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def print_progress(stats):
+    print(f"\r{stats['records']} records encrypted ({stats['records_per_second']:.0f} records/s)", end="", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encrypt or decrypt many vault entries at once")
+    parser.add_argument("action", choices=["encrypt", "decrypt"])
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--input", help="encrypt: JSON lines file with title and text on each line")
+    parser.add_argument("--output", help="decrypt: JSON lines file to write (default: print)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--key-file", default=MASTER_KEY_FILE)
+    parser.add_argument("--search-key-file", default=SEARCH_KEY_FILE)
+    args = parser.parse_args()
+
+    vault = VaultStore(args.data_dir)
+
+    # Password and passkey can come from the environment for scripts
+    password = os.environ.get("VAULT_PASSWORD") or getpass.getpass("Account password: ")
+    passkey = os.environ.get("VAULT_PASSKEY") or getpass.getpass("Passkey: ")
+
+    try:
+        authorize(vault, args.user, password)
+    except NotAuthorized as e:
+        sys.exit(str(e))
+
+    if args.action == "encrypt":
+        if not args.input:
+            sys.exit("--input is required for encrypt")
+        search_index = SearchIndex(args.data_dir, args.search_key_file, vault.cache, vault.lock)
+        stats = encrypt_records(vault, args.key_file, args.user, read_records(args.input), passkey,
+                                args.workers, args.batch_size, on_progress=print_progress,
+                                search_index=search_index)
+        print(f"\nStored {stats['records']} entries in {stats['seconds']:.1f} s")
+    else:
+        start = time.perf_counter()
+        opened = failed = 0
+        output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+        for entry_id, title, text in decrypt_records(vault, args.key_file, args.user, passkey, workers=args.workers):
+            if text is None:
+                failed += 1
+                continue
+            opened += 1
+            output.write(json.dumps({"id": entry_id, "title": title, "text": text}) + "\n")
+        if args.output:
+            output.close()
+        seconds = time.perf_counter() - start
+        print(f"Decrypted {opened} entries in {seconds:.1f} s ({opened / seconds:.0f} entries/s), "
+              f"{failed} didn't open with this passkey", file=sys.stderr)
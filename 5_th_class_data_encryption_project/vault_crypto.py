@@ -0,0 +1,241 @@
+import base64
+import hashlib
+import json
+import os
+import zlib
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+
+# zstd is optional, zlib is used when it isn't installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Name stored on entries encrypted with envelope encryption
+SCHEME = "envelope-v1"
+
+# PBKDF2 iterations for new entries (higher = slower to brute force, slower to unlock)
+KDF_ITERATIONS = int(os.environ.get("VAULT_KDF_ITERATIONS", "480000"))
+
+# Most derived keys we keep in one session's cache
+KEY_CACHE_SIZE = 64
+
+# First byte of a compressed payload says how the rest is stored
+RAW, ZLIB, ZSTD = b"\x00", b"\x01", b"\x02"
+
+# Payloads shorter than this are never worth compressing
+MIN_COMPRESS_SIZE = 64
+
+# Larger payloads are only compressed if a sample of them shrinks below this ratio
+SAMPLE_SIZE = 4096
+MAX_RATIO = 0.9
+
+
+# Master keys kept in a local key file, first key is the one used for new entries
+#
+# The file is re-read when it changes on disk, so a running app picks up keys
+# added by the rotation job.
+class Keyring:
+    def __init__(self, path):
+        self.path = path
+        self.mtime = None
+        self.keys = []
+        self.multi_fernet = None
+
+        # Create a key file with one new master key the first time
+        if not os.path.exists(path):
+            self.save([Fernet.generate_key().decode()])
+
+    # MultiFernet that encrypts with the newest key and decrypts with any key
+    def fernet(self):
+        mtime = os.stat(self.path).st_mtime_ns
+        if mtime != self.mtime:
+            with open(self.path, "r") as f:
+                self.keys = json.load(f)["keys"]
+            self.multi_fernet = MultiFernet([Fernet(key) for key in self.keys])
+            self.mtime = mtime
+        return self.multi_fernet
+
+    # Write the key file (readable only by the owner)
+    def save(self, keys):
+        temp_file = self.path + ".tmp"
+        fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"keys": keys}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.path)
+
+    # Put a new master key in front, old keys stay so existing entries still open
+    def add_key(self):
+        self.fernet()
+        self.save([Fernet.generate_key().decode()] + self.keys)
+        return self.fernet()
+
+    # Forget every key except the newest one (only after all entries are re-wrapped)
+    def drop_old_keys(self):
+        self.fernet()
+        self.save(self.keys[:1])
+        return self.fernet()
+
+
+# Derive a passkey's key-encryption key, using the session cache when we can
+def derive_key(passkey, salt, iterations, key_cache=None):
+    # The cache key doesn't keep the passkey itself, only a hash of it
+    cache_key = (hashlib.sha256(passkey.encode()).digest(), salt, iterations)
+    if key_cache is not None and cache_key in key_cache:
+        return key_cache[cache_key]
+
+    key = base64.urlsafe_b64encode(hashlib.pbkdf2_hmac("sha256", passkey.encode(), salt, iterations))
+
+    if key_cache is not None:
+        # Drop the oldest key when the cache is full
+        if len(key_cache) >= KEY_CACHE_SIZE:
+            key_cache.pop(next(iter(key_cache)))
+        key_cache[cache_key] = key
+    return key
+
+
+# Wrap a data key so it can only be opened with the passkey and the master key
+#
+# wrapped_key = master.encrypt(Fernet(passkey key).encrypt(data key))
+#
+# Returns the fields to store next to whatever the data key encrypted.
+def wrap_data_key(data_key, passkey, keyring, key_cache=None, iterations=KDF_ITERATIONS, salt=None):
+    # Batches pass one salt for all their entries, so the passkey is only stretched once
+    if salt is None:
+        salt = os.urandom(16)
+    passkey_key = derive_key(passkey, salt, iterations, key_cache)
+    return wrap_with_key(data_key, passkey_key, salt, iterations, keyring.fernet())
+
+
+# Wrap a data key with an already derived passkey key (used by batch workers)
+def wrap_with_key(data_key, passkey_key, salt, iterations, multi_fernet):
+    wrapped_key = multi_fernet.encrypt(Fernet(passkey_key).encrypt(data_key))
+
+    return {
+        "scheme": SCHEME,
+        "wrapped_key": wrapped_key.decode(),
+        "kdf": {
+            "name": "pbkdf2-sha256",
+            "iterations": iterations,
+            "salt": base64.b64encode(salt).decode(),
+        },
+    }
+
+
+# Compress a payload if it is worth it, the first byte records the choice
+#
+# zstd (or zlib without it) is used for anything bigger than a few bytes.
+# Big payloads are tested on a sample first, so already compressed data
+# (photos of documents, archives) isn't run through the compressor for nothing.
+def compress(data):
+    if len(data) < MIN_COMPRESS_SIZE:
+        return RAW + data
+
+    if zstandard is not None:
+        codec, function = ZSTD, zstandard.ZstdCompressor(level=3).compress
+    else:
+        codec, function = ZLIB, lambda chunk: zlib.compress(chunk, 1)
+
+    if len(data) > 4 * SAMPLE_SIZE and len(function(data[:SAMPLE_SIZE])) > SAMPLE_SIZE * MAX_RATIO:
+        return RAW + data
+
+    compressed = function(data)
+    if len(compressed) > len(data) * MAX_RATIO:
+        return RAW + data
+    return codec + compressed
+
+
+# Undo compress()
+def decompress(data):
+    codec, body = data[:1], data[1:]
+    if codec == ZLIB:
+        return zlib.decompress(body)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise ValueError("This entry was compressed with zstd, install the zstandard package to open it")
+        return zstandard.ZstdDecompressor().decompress(body)
+    return body
+
+
+# Compress and encrypt text with a data key, returns the raw Fernet token bytes
+def seal(text, data_key):
+    return base64.urlsafe_b64decode(Fernet(data_key).encrypt(compress(text.encode())))
+
+
+# Decrypt and decompress what seal() made (raises InvalidToken for a wrong key)
+def unseal(ciphertext, data_key):
+    return decompress(Fernet(data_key).decrypt(base64.urlsafe_b64encode(ciphertext))).decode()
+
+
+# The text a user copies to find an entry again (a Fernet token)
+def token_text(entry):
+    if "encrypted_text" in entry:
+        return entry["encrypted_text"]
+    return base64.urlsafe_b64encode(entry["ciphertext"]).decode()
+
+
+# Encrypt text with a new data key and return the entry fields to store
+#
+# Opening an entry needs both the passkey and the master key file, and
+# rotating the master key only re-wraps wrapped_key, never the payload.
+# The payload is compressed first and kept as raw bytes in "ciphertext",
+# which the store writes to its binary payload file.
+def encrypt_entry(text, passkey, keyring, key_cache=None, iterations=KDF_ITERATIONS):
+    data_key = Fernet.generate_key()
+    entry = wrap_data_key(data_key, passkey, keyring, key_cache, iterations)
+    entry["ciphertext"] = seal(text, data_key)
+    return entry
+
+
+# Unwrap an entry's data key, returns None if the passkey is wrong
+def unwrap_data_key(entry, passkey, keyring, key_cache=None):
+    kdf = entry["kdf"]
+    passkey_key = derive_key(passkey, base64.b64decode(kdf["salt"]), kdf["iterations"], key_cache)
+    try:
+        inner = keyring.fernet().decrypt(entry["wrapped_key"].encode())
+        return Fernet(passkey_key).decrypt(inner)
+    except InvalidToken:
+        return None
+
+
+# Decrypt an entry, returns None if the passkey is wrong
+#
+# Entries from before compression keep their token in "encrypted_text",
+# newer ones need their "ciphertext" loaded from the store first.
+def decrypt_entry(entry, passkey, keyring, key_cache=None):
+    data_key = unwrap_data_key(entry, passkey, keyring, key_cache)
+    if data_key is None:
+        return None
+    try:
+        if "encrypted_text" in entry:
+            return Fernet(data_key).decrypt(entry["encrypted_text"].encode()).decode()
+        return unseal(entry["ciphertext"], data_key)
+    except InvalidToken:
+        return None
+
+
+# Raised when a legacy entry's key isn't in the key file (the passkey itself was right)
+class LegacyKeyMissing(Exception):
+    pass
+
+
+# Decrypt an entry from before envelope encryption, encrypted_text is its Fernet token
+#
+# Those entries used a key that only lived in the browser session. They open
+# if that key was added to the key file, otherwise LegacyKeyMissing is raised.
+def decrypt_legacy(encrypted_text, keyring):
+    try:
+        return keyring.fernet().decrypt(encrypted_text.encode()).decode()
+    except InvalidToken:
+        raise LegacyKeyMissing("This entry was saved by an older version with a key that wasn't kept, "
+                               "so it can't be decrypted.")
+
+
+# Re-wrap one entry's data key with the newest master key (payload is untouched)
+def rewrap_entry(entry, multi_fernet):
+    if entry.get("scheme") != SCHEME:
+        return entry
+    return dict(entry, wrapped_key=multi_fernet.rotate(entry["wrapped_key"].encode()).decode())
@@ -0,0 +1,348 @@
+import base64
+import binascii
+import hashlib
+import itertools
+import json
+import os
+import secrets
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Windows has no flock, there the lock only covers this process
+    fcntl = None
+
+
+# Short fingerprint of a ciphertext, used to find an entry from pasted encrypted text
+def fingerprint(encrypted_text):
+    return hashlib.sha256(encrypted_text.encode()).hexdigest()[:32]
+
+
+# File name for a user's shard (usernames can contain any character, so we hash them)
+def shard_name(username):
+    return hashlib.sha256(username.encode()).hexdigest()[:24] + ".json"
+
+
+# Write JSON to a temp file and swap it in, so a crash never leaves half a file
+def atomic_write_json(path, data):
+    temp_file = path + ".tmp"
+    with open(temp_file, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+# In-process cache of parsed JSON files, checked against the file's mtime and size
+class ShardCache:
+    def __init__(self):
+        # path -> (mtime_ns, size, parsed data)
+        self.files = {}
+        self.reads = 0
+
+    # Get a file's data, reading it only if it changed since we last read it
+    #
+    # fresh=True always reads the file, writers use it while holding the
+    # vault lock so they never change a copy another process already replaced.
+    def get(self, path, default, fresh=False):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.files.pop(path, None)
+            return default
+
+        # Files are swapped in with os.replace, so a new version also has a new inode
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        cached = self.files.get(path)
+        if cached and not fresh and cached[0] == key:
+            return cached[1]
+
+        with open(path, "r") as f:
+            data = json.load(f)
+        self.reads += 1
+        self.files[path] = (key, data)
+        return data
+
+    # Write a file and keep the new data in the cache
+    def put(self, path, data):
+        atomic_write_json(path, data)
+        stat = os.stat(path)
+        self.files[path] = ((stat.st_ino, stat.st_mtime_ns, stat.st_size), data)
+
+
+# Lock held while shards are read, changed and written, and payloads appended
+#
+# A thread lock for this process and an flock on a lock file for the other
+# processes using the vault (a second server, the batch importer, key
+# rotation), so none of them can write over another's changes. Reentrant,
+# so a tool can hold it around several store calls.
+class VaultLock:
+    def __init__(self, path):
+        self.thread_lock = threading.RLock()
+        self.depth = 0
+        self.file = open(path, "a") if fcntl else None
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        if self.depth == 0 and self.file:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.depth -= 1
+        if self.depth == 0 and self.file:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.thread_lock.release()
+
+    # Take the lock only if nobody else holds it, returns whether we got it
+    def try_acquire(self):
+        if not self.thread_lock.acquire(blocking=False):
+            return False
+        if self.depth == 0 and self.file:
+            try:
+                fcntl.flock(self.file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self.thread_lock.release()
+                return False
+        self.depth += 1
+        return True
+
+
+# Storage for users and encrypted entries, one shard file per user
+#
+# vault_data/users/<shard>.json    -> {"username": ..., "password": ..., "created_at": ...}
+# vault_data/entries/<shard>.json  -> {"entries": {entry id: entry}}
+# vault_data/payloads/<shard>.bin  -> ciphertexts as raw bytes, entries keep "payload": [offset, length]
+# vault_data/migrated.json         -> written once the legacy files were copied in
+#
+# Only the shard that changed is written, and shards are only read again
+# when their file changed on disk (e.g. written by another server process).
+class VaultStore:
+    def __init__(self, data_dir, legacy_users_file=None, legacy_data_file=None):
+        self.users_dir = os.path.join(data_dir, "users")
+        self.entries_dir = os.path.join(data_dir, "entries")
+        self.payloads_dir = os.path.join(data_dir, "payloads")
+        self.cache = ShardCache()
+
+        # Fingerprint index per entries shard, rebuilt only when the shard changes
+        # path -> (entries dict it was built from, {fingerprint: entry id})
+        self.fingerprints = {}
+
+        os.makedirs(self.users_dir, exist_ok=True)
+        os.makedirs(self.entries_dir, exist_ok=True)
+        os.makedirs(self.payloads_dir, exist_ok=True)
+
+        # Writes are read-modify-write on a shard, so only one at a time in any process
+        self.lock = VaultLock(os.path.join(data_dir, "vault.lock"))
+
+        # Copy the legacy files in until that has finished once (a crash half way
+        # through just runs it again on the next start)
+        migrated_file = os.path.join(data_dir, "migrated.json")
+        if (legacy_users_file or legacy_data_file) and not os.path.exists(migrated_file):
+            with self.lock:
+                if not os.path.exists(migrated_file):
+                    counts = self._migrate(legacy_users_file, legacy_data_file)
+                    atomic_write_json(migrated_file, counts)
+
+    # ---- Users ----
+
+    # Get a user's record, or None if the user doesn't exist
+    def get_user(self, username, fresh=False):
+        record = self.cache.get(os.path.join(self.users_dir, shard_name(username)), None, fresh)
+        if record is None or record.get("username") != username:
+            return None
+        return record
+
+    # Create a user, returns False if the username is taken
+    def add_user(self, username, record):
+        with self.lock:
+            if self.get_user(username, fresh=True) is not None:
+                return False
+            self.cache.put(os.path.join(self.users_dir, shard_name(username)), dict(record, username=username))
+            return True
+
+    # Change some fields of a user's record
+    def update_user(self, username, changes):
+        with self.lock:
+            record = dict(self.get_user(username, fresh=True), **changes)
+            self.cache.put(os.path.join(self.users_dir, shard_name(username)), record)
+
+    # ---- Entries ----
+
+    # Add a new entry for a user and return its id
+    def add_entry(self, user, entry):
+        return self.add_entries(user, [entry])[0]
+
+    # Add many entries for a user with a single write of their shard
+    #
+    # Raw "ciphertext" bytes on entries are appended to the user's payload
+    # file, which is synced before the shard that points into it is written.
+    def add_entries(self, user, entries):
+        with self.lock:
+            path = self._entries_path(user)
+            shard_entries = dict(self._entries(user, fresh=True))
+            entries = [dict(entry, user=user) for entry in entries]
+
+            ciphertexts = [entry.pop("ciphertext", None) for entry in entries]
+            if any(ciphertexts):
+                offset = self._append_payloads(user, [ciphertext for ciphertext in ciphertexts if ciphertext])
+
+            entry_ids = []
+            for entry, ciphertext in zip(entries, ciphertexts):
+                entry["id"] = self._new_id(shard_entries)
+                if ciphertext:
+                    entry["payload"] = [offset, len(ciphertext)]
+                    entry["fingerprint"] = fingerprint(base64.urlsafe_b64encode(ciphertext).decode())
+                    offset += len(ciphertext)
+                elif "fingerprint" not in entry and "encrypted_text" in entry:
+                    entry["fingerprint"] = fingerprint(entry["encrypted_text"])
+                shard_entries[entry["id"]] = entry
+                entry_ids.append(entry["id"])
+            self.cache.put(path, {"entries": shard_entries})
+            return entry_ids
+
+    # Replace an entry with new fields, keeping its id (raw "ciphertext" is handled like in add_entries)
+    def replace_entry(self, user, entry_id, entry):
+        with self.lock:
+            path = self._entries_path(user)
+            shard_entries = dict(self._entries(user, fresh=True))
+            entry = dict(entry, user=user, id=entry_id)
+            ciphertext = entry.pop("ciphertext", None)
+            if ciphertext:
+                entry["payload"] = [self._append_payloads(user, [ciphertext]), len(ciphertext)]
+                entry["fingerprint"] = fingerprint(base64.urlsafe_b64encode(ciphertext).decode())
+            shard_entries[entry_id] = entry
+            self.cache.put(path, {"entries": shard_entries})
+
+    # Number of entries a user has stored
+    def count_for_user(self, user):
+        return len(self._entries(user))
+
+    # A user's entries as a list of (entry id, entry)
+    def entries_for_user(self, user):
+        return list(self._entries(user).items())
+
+    # One page of a user's entries as a list of (entry id, entry), oldest first
+    def entries_page(self, user, start, count):
+        return list(itertools.islice(self._entries(user).items(), start, start + count))
+
+    # Get an entry only if it belongs to the user
+    def get_entry(self, user, entry_id):
+        return self._entries(user).get(entry_id)
+
+    # Copies of entries with their "ciphertext" read from the payload file
+    # (entries from before the payload file keep "encrypted_text" and are returned as they are)
+    def with_ciphertext(self, user, entries):
+        if not any("payload" in entry for entry in entries):
+            return list(entries)
+        loaded = []
+        with open(self._payloads_path(user), "rb") as payloads:
+            for entry in entries:
+                if "payload" in entry:
+                    offset, length = entry["payload"]
+                    payloads.seek(offset)
+                    entry = dict(entry, ciphertext=payloads.read(length))
+                loaded.append(entry)
+        return loaded
+
+    # Find the id of a user's entry from its encrypted text
+    def find_by_ciphertext(self, user, encrypted_text):
+        path = self._entries_path(user)
+        entries = self._entries(user)
+
+        # Rebuild the fingerprint index only if the shard changed
+        cached = self.fingerprints.get(path)
+        if cached is None or cached[0] is not entries:
+            cached = (entries, {entry.get("fingerprint"): entry_id for entry_id, entry in entries.items()})
+            self.fingerprints[path] = cached
+
+        entry_id = cached[1].get(fingerprint(encrypted_text))
+        entry = entries.get(entry_id)
+        if entry is None:
+            return None
+
+        # The fingerprint only narrows it down, compare the whole ciphertext
+        if "payload" in entry:
+            try:
+                ciphertext = base64.urlsafe_b64decode(encrypted_text)
+            except (binascii.Error, ValueError):
+                return None
+            if self.with_ciphertext(user, [entry])[0]["ciphertext"] != ciphertext:
+                return None
+        elif entry.get("encrypted_text") != encrypted_text:
+            return None
+        return entry_id
+
+    # Replace every entry of every user with function(entry), one shard write per user
+    def map_entries(self, function):
+        count = 0
+        for name in os.listdir(self.entries_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.entries_dir, name)
+            with self.lock:
+                entries = self.cache.get(path, {"entries": {}}, fresh=True)["entries"]
+                new_entries = {entry_id: function(entry) for entry_id, entry in entries.items()}
+                self.cache.put(path, {"entries": new_entries})
+            count += len(new_entries)
+        return count
+
+    # ---- Helpers ----
+
+    def _entries_path(self, user):
+        return os.path.join(self.entries_dir, shard_name(user))
+
+    def _payloads_path(self, user):
+        return os.path.join(self.payloads_dir, shard_name(user)[:-len(".json")] + ".bin")
+
+    # Append ciphertexts to a user's payload file and sync it, returns where the first one starts
+    # (call only while holding the lock, or two writers could get the same offset)
+    def _append_payloads(self, user, ciphertexts):
+        with open(self._payloads_path(user), "ab") as payloads:
+            offset = payloads.tell()
+            payloads.write(b"".join(ciphertexts))
+            payloads.flush()
+            os.fsync(payloads.fileno())
+        return offset
+
+    def _entries(self, user, fresh=False):
+        return self.cache.get(self._entries_path(user), {"entries": {}}, fresh)["entries"]
+
+    # Make a random entry id that isn't used yet
+    def _new_id(self, entries):
+        while True:
+            entry_id = secrets.token_hex(8)
+            if entry_id not in entries:
+                return entry_id
+
+    # Copy users and entries from the old single-file format into shards
+    #
+    # Safe to run again: users that exist are left alone, and so are users that
+    # already have entries (one add_entries call writes all of a user's entries,
+    # so a user's entries are either all copied or not at all). Returns counts.
+    def _migrate(self, legacy_users_file, legacy_data_file):
+        counts = {"users": 0, "entries": 0}
+        if legacy_users_file and os.path.exists(legacy_users_file):
+            with open(legacy_users_file, "r") as f:
+                for username, record in json.load(f).items():
+                    counts["users"] += self.add_user(username, record)
+
+        if legacy_data_file and os.path.exists(legacy_data_file):
+            with open(legacy_data_file, "r") as f:
+                data = json.load(f)
+
+            # Oldest format is {ciphertext: entry}, the next one is {"entries": {id: entry}}
+            if "entries" in data:
+                entries = list(data["entries"].values())
+            else:
+                entries = [dict(entry, encrypted_text=text) for text, entry in data.items()]
+
+            by_user = {}
+            for entry in entries:
+                by_user.setdefault(entry.get("user"), []).append(entry)
+            for user, user_entries in by_user.items():
+                if not self._entries(user, fresh=True):
+                    counts["entries"] += len(self.add_entries(user, user_entries))
+        return counts
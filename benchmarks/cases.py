@@ -0,0 +1,208 @@
+# The benchmark cases, one or more per app
+#
+# A case gets the scale's sizes and a scratch folder, makes its data and
+# returns (run, items): run() is the part that is timed and items is how many
+# things one run handles (passwords, books, rows...). Making the data is
+# never timed.
+
+import contextlib
+import importlib.util
+import io
+import os
+import random
+import sys
+
+import datasets
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Folder of each app, their modules are imported straight from there
+APPS = {
+    "sweeper": "1_first-chapter",
+    "password": "3_3rd-Class",
+    "library": "4_th_class",
+    "vault": "5_th_class_data_encryption_project",
+}
+for folder in APPS.values():
+    sys.path.insert(0, os.path.join(ROOT, folder))
+sys.path.insert(0, os.path.join(ROOT, "shared"))
+
+# name -> (app, setup function), in the order they run
+CASES = {}
+
+
+# Decorator that adds a case
+def case(name):
+    def register(setup):
+        CASES[name] = (name.split(".")[0], setup)
+        return setup
+    return register
+
+
+# A job for calling job functions directly, its progress goes to a table in the scratch folder
+def scratch_job(folder):
+    import job_queue
+    return job_queue.Job(job_queue.JobTable(os.path.join(folder, "jobs.sqlite3")), "benchmark")
+
+
+# Load a module from a file under another name (the library and vault both have a main.py)
+def load_module(name, path):
+    if name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        sys.modules[name] = module
+    return sys.modules[name]
+
+
+# ---- Password Strength Meter ----
+
+@case("password.check_strength")
+def check_strength(size, folder):
+    from password_tools import check_password_strength
+    passwords = datasets.passwords(size["passwords"])
+    return lambda: [check_password_strength(password) for password in passwords], len(passwords)
+
+
+@case("password.generate")
+def generate(size, folder):
+    from password_tools import generate_password
+
+    def run():
+        random.seed(1)
+        return [generate_password(16) for _ in range(size["passwords"])]
+    return run, size["passwords"]
+
+
+# ---- Library Manager (the command line version keeps the library in module globals) ----
+
+# The library module with a made-up library saved in the folder
+def library_with_books(size, folder):
+    library = load_module("library_main", os.path.join(ROOT, APPS["library"], "main.py"))
+    library.file_name = os.path.join(folder, "library.txt")
+    library.books = datasets.books(size["books"])
+    library.books_by_id = {book["id"]: book for book in library.books}
+    library.fuzzy_index = library.FuzzyIndex.from_books(library.books)
+    library.save_library()
+    return library
+
+
+@case("library.save")
+def library_save(size, folder):
+    library = library_with_books(size, folder)
+    return library.save_library, len(library.books)
+
+
+@case("library.load")
+def library_load(size, folder):
+    library = library_with_books(size, folder)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            library.load_library()
+    return run, len(library.books)
+
+
+@case("library.search")
+def library_search(size, folder):
+    library = library_with_books(size, folder)
+    searches = datasets.searches(library.books, size["searches"])
+    return lambda: [library.find_books(field, term) for field, term in searches], len(searches)
+
+
+@case("library.fuzzy_search")
+def library_fuzzy_search(size, folder):
+    library = library_with_books(size, folder)
+    searches = datasets.searches(library.books, size["fuzzy_searches"])
+    return lambda: [library.fuzzy_index.search(field, term) for field, term in searches], len(searches)
+
+
+# ---- Secure Data Encryption System (the functions main.py's store_entry/decrypt_data/hash_password call) ----
+
+@case("vault.hash_password")
+def vault_hash_password(size, folder):
+    from passwords import hash_password
+    passwords = datasets.passwords(size["hashes"])
+    return lambda: [hash_password(password) for password in passwords], len(passwords)
+
+
+@case("vault.encrypt")
+def vault_encrypt(size, folder):
+    from vault_crypto import Keyring, encrypt_entry
+    keyring = Keyring(os.path.join(folder, "secret.key"))
+    texts = datasets.secrets(size["entries"])
+    return lambda: [encrypt_entry(text, "passkey", keyring, {}) for text in texts], len(texts)
+
+
+@case("vault.decrypt")
+def vault_decrypt(size, folder):
+    from vault_crypto import Keyring, decrypt_entry, encrypt_entry
+    keyring = Keyring(os.path.join(folder, "secret.key"))
+    texts = datasets.secrets(size["entries"])
+    entries = [encrypt_entry(text, "passkey", keyring) for text in texts]
+    assert [decrypt_entry(entry, "passkey", keyring) for entry in entries] == texts
+
+    # A new session each time, like a user opening the vault
+    return lambda: [decrypt_entry(entry, "passkey", keyring, {}) for entry in entries], len(entries)
+
+
+@case("vault.seal")
+def vault_seal(size, folder):
+    from cryptography.fernet import Fernet
+    from vault_crypto import seal, unseal
+    data_key = Fernet.generate_key()
+    texts = datasets.secrets(size["payloads"])
+    return lambda: [unseal(seal(text, data_key), data_key) for text in texts], len(texts)
+
+
+# ---- Data Sweeper ----
+
+@case("sweeper.read_csv")
+def sweeper_read_csv(size, folder):
+    from sweeper_jobs import read_csv
+    data = datasets.messy_csv(size["rows"])
+    job = scratch_job(folder)
+    return lambda: read_csv(job, data), size["rows"]
+
+
+@case("sweeper.sample_csv")
+def sweeper_sample_csv(size, folder):
+    import sampler
+    data = datasets.messy_csv(size["rows"])
+    return lambda: sampler.sample_csv(io.BytesIO(data), seed=1), size["rows"]
+
+
+@case("sweeper.optimize")
+def sweeper_optimize(size, folder):
+    import frame_optimizer
+    df = datasets.messy_frame(size["rows"])
+    return lambda: frame_optimizer.optimize_frame(df), len(df)
+
+
+@case("sweeper.clean")
+def sweeper_clean(size, folder):
+    df = datasets.messy_frame(size["rows"])
+    return lambda: df.drop_duplicates().dropna(), len(df)
+
+
+@case("sweeper.near_duplicates")
+def sweeper_near_duplicates(size, folder):
+    import near_duplicates
+    df = datasets.messy_frame(size["rows"])
+    return lambda: near_duplicates.drop_near_duplicates(df, ["name", "email", "city"], 0.8, workers=1), len(df)
+
+
+@case("sweeper.export_csv")
+def sweeper_export_csv(size, folder):
+    from sweeper_jobs import export_csv
+    df = datasets.messy_frame(size["rows"])
+    job = scratch_job(folder)
+    return lambda: export_csv(job, df), len(df)
+
+
+@case("sweeper.export_excel")
+def sweeper_export_excel(size, folder):
+    from sweeper_jobs import export_excel
+    df = datasets.messy_frame(size["excel_rows"])
+    job = scratch_job(folder)
+    return lambda: export_excel(job, df), len(df)
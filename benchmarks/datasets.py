@@ -0,0 +1,126 @@
+# Made-up data for the benchmarks
+# Every generator takes a seed, so the same scale always gives the same data
+
+import io
+import random
+import string
+
+import numpy as np
+import pandas as pd
+
+# How much data each scale uses
+SCALES = {
+    "small": {"passwords": 2000, "books": 2000, "searches": 100, "fuzzy_searches": 500, "hashes": 3,
+              "entries": 3, "payloads": 200, "rows": 5000, "excel_rows": 2000},
+    "medium": {"passwords": 20000, "books": 50000, "searches": 100, "fuzzy_searches": 2000, "hashes": 5,
+               "entries": 5, "payloads": 1000, "rows": 50000, "excel_rows": 20000},
+    "large": {"passwords": 100000, "books": 500000, "searches": 20, "fuzzy_searches": 5000, "hashes": 10,
+              "entries": 10, "payloads": 5000, "rows": 300000, "excel_rows": 50000},
+}
+
+FIRST = ["james", "mary", "john", "patricia", "robert", "jennifer", "michael", "linda", "david", "sarah",
+         "ahmed", "fatima", "hassan", "ayesha", "li", "wei", "maria", "jose", "anna", "olga"]
+LAST = ["smith", "johnson", "williams", "brown", "jones", "garcia", "miller", "davis", "khan", "ali",
+        "wang", "zhang", "silva", "santos", "ivanov", "mueller", "martin", "rossi", "kim", "nguyen"]
+CITIES = ["karachi", "lahore", "new york", "london", "berlin", "toronto", "dubai", "sydney"]
+GENRES = ["Fiction", "Fantasy", "Science", "History", "Biography", "Poetry", "Mystery", "Romance"]
+COMMON = ["password", "123456", "qwerty", "letmein", "monkey", "welcome"]
+
+
+# A word of 3-10 lowercase letters
+def word(rng):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(3, 10)))
+
+
+# Passwords people actually type: common ones, words with digits, keyboard runs and random strings
+def passwords(count, seed=1):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.1:
+            result.append(rng.choice(COMMON))
+        elif kind < 0.5:
+            result.append(word(rng).title() + str(rng.randint(0, 9999)) + rng.choice(["", "!", "@", "#"]))
+        elif kind < 0.6:
+            result.append("abc" + "123" * rng.randint(1, 3))
+        else:
+            characters = string.ascii_letters + string.digits + "!@#$%^&*"
+            result.append("".join(rng.choice(characters) for _ in range(rng.randint(6, 24))))
+    return result
+
+
+# Library books in the format the library file uses
+def books(count, seed=1):
+    rng = random.Random(seed)
+    vocabulary = [word(rng) for _ in range(max(1000, count // 5))]
+    last_names = [word(rng).title() for _ in range(max(1000, count // 20))]
+    return [{
+        "id": book_id,
+        "title": " ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 5))).title(),
+        "author": f"{rng.choice(FIRST).title()} {rng.choice(last_names)}",
+        "year": rng.randint(1800, 2025),
+        "genre": rng.choice(GENRES),
+        "read": rng.random() < 0.5,
+        "version": 1,
+    } for book_id in range(1, count + 1)]
+
+
+# Search terms for a library: pieces of titles and authors that exist, and some that don't
+def searches(library, count, seed=1):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        if rng.random() < 0.2:
+            result.append(("title", word(rng)))
+        else:
+            field = rng.choice(["title", "author"])
+            result.append((field, rng.choice(rng.choice(library)[field].split())))
+    return result
+
+
+# Things people keep in the vault: short notes, card-like numbers and longer repetitive text
+def secrets(count, seed=1):
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.4:
+            result.append(" ".join(word(rng) for _ in range(rng.randint(3, 15))))
+        elif kind < 0.6:
+            result.append(" ".join(str(rng.randint(1000, 9999)) for _ in range(4)))
+        else:
+            line = f"{rng.choice(FIRST)} {rng.choice(LAST)}, {rng.choice(CITIES)}: {word(rng)}\n"
+            result.append(line * rng.randint(10, 200))
+    return result
+
+
+# A messy CSV-like table: repeated categories, missing values, exact and near-duplicate rows
+def messy_frame(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    originals = int(rows * 0.85)
+    first = rng.choice(FIRST, originals)
+    last = rng.choice(LAST, originals)
+    df = pd.DataFrame({
+        "name": np.char.add(np.char.add(first, " "), last),
+        "email": [f"{f}.{l}{i}@example.com" for i, (f, l) in enumerate(zip(first, last))],
+        "city": rng.choice(CITIES, originals),
+        "age": rng.integers(18, 90, originals),
+        "score": rng.normal(50, 15, originals).round(2),
+        "orders": rng.integers(0, 500, originals),
+    })
+    df.loc[rng.random(originals) < 0.05, "score"] = np.nan
+    df.loc[rng.random(originals) < 0.02, "city"] = None
+
+    # Copies of earlier rows, half of them with the name in other case (near-duplicates)
+    copies = df.iloc[rng.integers(0, originals, rows - originals)].copy()
+    upper = rng.random(len(copies)) < 0.5
+    copies.loc[upper, "name"] = copies.loc[upper, "name"].str.upper()
+    return pd.concat([df, copies], ignore_index=True)
+
+
+# The same table as CSV bytes, like an uploaded file
+def messy_csv(rows, seed=1):
+    buffer = io.BytesIO()
+    messy_frame(rows, seed).to_csv(buffer, index=False)
+    return buffer.getvalue()
@@ -0,0 +1,204 @@
+# Benchmarks for all four apps
+#
+#   python benchmarks/run_benchmarks.py --scale small --save-baseline   (once, on this computer)
+#   python benchmarks/run_benchmarks.py --scale small                   (after a change)
+#
+# Every case is timed a few times and run once more under tracemalloc for
+# its peak memory. The fastest time is the one compared, the slower ones
+# mostly measure what else the computer was doing. Results are saved as
+# JSON, and the run fails (exit code 1) when a case got slower or bigger
+# than the saved baseline by more than the threshold. Baselines only make sense on the
+# computer they were made on, so they aren't committed.
+
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from cases import CASES
+from datasets import SCALES
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# Changes smaller than these are noise, however big they are in percent
+MIN_SECONDS_CHANGE = 0.002
+MIN_MEMORY_CHANGE = 256 * 1024
+
+# Quick cases are run several times in a row until one timing takes at least this long
+MIN_SAMPLE_SECONDS = 0.1
+
+
+# Seconds per call of run over `loops` calls, with the garbage collector off like timeit does
+def timed(run, loops=1):
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for _ in range(loops):
+            run()
+        return (time.perf_counter() - start) / loops
+    finally:
+        gc.enable()
+
+
+# Most memory one call of run allocates on top of what was in use before
+def peak_memory(run):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        run()
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+# Run one case, returns its result dict
+def run_case(setup, size, repeats):
+    with tempfile.TemporaryDirectory() as folder:
+        try:
+            run, items = setup(size, folder)
+        except ImportError as e:
+            return {"skipped": str(e)}
+        # The first call warms up imports and caches and tells us how many calls make one timing
+        loops = max(1, math.ceil(MIN_SAMPLE_SECONDS / timed(run)))
+        times = [timed(run, loops) for _ in range(repeats)]
+        return {
+            "items": items,
+            "loops": loops,
+            "min_seconds": min(times),
+            "median_seconds": statistics.median(times),
+            "us_per_item": min(times) / max(items, 1) * 1e6,
+            "peak_memory_bytes": peak_memory(run),
+        }
+
+
+# Run the cases (all, or the ones starting with one of `only`) and return the results
+def run_all(scale, repeats, only=None, on_result=None):
+    results = {
+        "scale": scale,
+        "repeats": repeats,
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        # Settings that change how much work the vault does
+        "environment": {key: value for key, value in os.environ.items() if key.startswith("VAULT_")},
+        "cases": {},
+    }
+    for name, (app, setup) in CASES.items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        result = dict(run_case(setup, SCALES[scale], repeats), app=app)
+        results["cases"][name] = result
+        if on_result:
+            on_result(name, result)
+    return results
+
+
+# Compare results with a baseline, returns [(case, time change, memory change, regressed)]
+#
+# Changes are fractions (0.3 = 30% slower or bigger). Cases that are new,
+# skipped or ran on a different amount of data aren't compared.
+def compare(results, baseline, time_threshold, memory_threshold):
+    rows = []
+    for name, result in results["cases"].items():
+        old = baseline["cases"].get(name)
+        if not old or "skipped" in result or "skipped" in old or old["items"] != result["items"]:
+            continue
+        time_change = result["min_seconds"] / old["min_seconds"] - 1
+        memory_change = result["peak_memory_bytes"] / max(old["peak_memory_bytes"], 1) - 1
+        slower = (time_change > time_threshold
+                  and result["min_seconds"] - old["min_seconds"] > MIN_SECONDS_CHANGE)
+        bigger = (memory_change > memory_threshold
+                  and result["peak_memory_bytes"] - old["peak_memory_bytes"] > MIN_MEMORY_CHANGE)
+        rows.append((name, time_change, memory_change, slower or bigger))
+    return rows
+
+
+# Print one result as it comes in
+def show_result(name, result):
+    if "skipped" in result:
+        print(f"{name:<26} skipped ({result['skipped']})")
+    else:
+        print(f"{name:<26}{result['items']:>9,}{result['min_seconds'] * 1000:>10.1f}"
+              f"{result['median_seconds'] * 1000:>10.1f}"
+              f"{result['us_per_item']:>12.1f}{result['peak_memory_bytes'] / 1024 ** 2:>11.1f}")
+
+
+def save_json(path, data):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the apps and compare with a saved baseline")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--only", nargs="+", metavar="PREFIX",
+                        help="Only run cases starting with these (e.g. vault library.search)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Where to save the results (default: results/latest-SCALE.json)")
+    parser.add_argument("--baseline", help="Baseline to compare with (default: results/baseline-SCALE.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="Save these results as the new baseline")
+    parser.add_argument("--time-threshold", type=float, default=0.25,
+                        help="Fail when a case is this much slower (0.25 = 25%%)")
+    parser.add_argument("--memory-threshold", type=float, default=0.10,
+                        help="Fail when a case's peak memory is this much bigger")
+    parser.add_argument("--list", action="store_true", help="List the cases and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in CASES:
+            print(name)
+        return 0
+
+    output = args.output or os.path.join(RESULTS_DIR, f"latest-{args.scale}.json")
+    baseline_path = args.baseline or os.path.join(RESULTS_DIR, f"baseline-{args.scale}.json")
+
+    print(f"Scale {args.scale}, {args.repeats} runs per case\n")
+    print(f"{'case':<26}{'items':>9}{'best ms':>10}{'median':>10}{'us/item':>12}{'peak MB':>11}")
+    results = run_all(args.scale, args.repeats, args.only, show_result)
+    save_json(output, results)
+    print(f"\nResults saved to {output}")
+
+    if args.save_baseline:
+        save_json(baseline_path, results)
+        print(f"Baseline saved to {baseline_path}")
+        return 0
+
+    if not os.path.exists(baseline_path):
+        print(f"No baseline at {baseline_path} yet, run again with --save-baseline to make one.")
+        return 0
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    if baseline["scale"] != args.scale:
+        print(f"The baseline is for the {baseline['scale']} scale, not {args.scale}.")
+        return 2
+    if baseline.get("environment") != results["environment"]:
+        print(f"Warning: the baseline was made with other settings ({baseline.get('environment')})")
+
+    rows = compare(results, baseline, args.time_threshold, args.memory_threshold)
+    print(f"\nCompared with {baseline_path} ({baseline['created']}):\n")
+    print(f"{'case':<26}{'time':>9}{'memory':>9}")
+    for name, time_change, memory_change, regressed in rows:
+        print(f"{name:<26}{time_change:>+9.0%}{memory_change:>+9.0%}{'  REGRESSED' if regressed else ''}")
+
+    regressed = [name for name, _, _, regressed in rows if regressed]
+    if regressed:
+        print(f"\n{len(regressed)} case(s) regressed past the threshold: {', '.join(regressed)}")
+        return 1
+    print("\nNo regressions.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
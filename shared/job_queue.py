@@ -0,0 +1,348 @@
+# Background jobs for the Streamlit apps
+#
+# Slow work (reading a big upload, writing an export, saving the library,
+# encrypting a file) is handed to a worker so the script thread can keep
+# drawing the page:
+#
+#   jobs = JobQueue("jobs.sqlite3")                          (once per process, st.cache_resource)
+#   job_id = jobs.submit("read file", read_csv, data, cache_key=file_id)
+#   job = show_progress(jobs, job_id, "Reading the file")   (None while it runs)
+#   df = jobs.result(job_id)
+#
+# A job function gets a Job as its first argument. It reports progress with
+# job.progress() and stops when job.check() sees a cancel request. Every job
+# is a row in a SQLite table, so progress and cancel requests also reach
+# jobs running in other processes, and the page can see jobs a restart
+# interrupted. Results stay in memory and jobs submitted again with the
+# same cache_key reuse them.
+
+import itertools
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+
+# Statuses a job ends in
+FINISHED = ("done", "failed", "cancelled", "interrupted")
+
+# Results kept in memory (they can be whole DataFrames)
+MAX_RESULTS = 16
+
+# Finished jobs kept in the table
+MAX_JOBS = 1000
+
+# Seconds between progress writes and cancel checks through the table
+UPDATE_INTERVAL = 0.2
+
+# Seconds between progress updates on the page
+POLL_SECONDS = 0.5
+
+
+# Raised inside a job when it was cancelled
+class JobCancelled(Exception):
+    pass
+
+
+# Raised by JobQueue.result() when the job didn't finish with a result
+class JobFailed(Exception):
+    pass
+
+
+# ---- The job table ----
+
+class JobTable:
+    """One SQLite connection to the job table, safe to share between threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # WAL lets the page read progress while a worker process writes it
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY, kind TEXT, cache_key TEXT, status TEXT, progress REAL, message TEXT,
+            error TEXT, cancel_requested INTEGER DEFAULT 0, created REAL, started REAL, finished REAL)""")
+
+    def insert(self, job_id, kind, cache_key):
+        with self.lock:
+            self.db.execute("INSERT INTO jobs (id, kind, cache_key, status, progress, message, created) "
+                            "VALUES (?, ?, ?, 'queued', 0, '', ?)", (job_id, kind, cache_key, time.time()))
+
+    def update(self, job_id, **fields):
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                            (*fields.values(), job_id))
+
+    def get(self, job_id):
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def recent(self, limit):
+        with self.lock:
+            cursor = self.db.execute("SELECT * FROM jobs ORDER BY created DESC LIMIT ?", (limit,))
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def cancel_requested(self, job_id):
+        with self.lock:
+            row = self.db.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    # Mark jobs a previous run of the app left unfinished, and forget old ones
+    def clean_up(self):
+        with self.lock:
+            self.db.execute("UPDATE jobs SET status = 'interrupted', finished = ? "
+                            "WHERE status IN ('queued', 'running')", (time.time(),))
+            self.db.execute("DELETE FROM jobs WHERE id NOT IN "
+                            "(SELECT id FROM jobs ORDER BY created DESC LIMIT ?)", (MAX_JOBS,))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+
+# ---- What a job function sees ----
+
+class Job:
+    def __init__(self, table, job_id, cancel_event=None):
+        self.table = table
+        self.id = job_id
+        # Jobs in threads get an Event, jobs in other processes ask the table
+        self.cancel_event = cancel_event
+        self._last_update = 0.0
+        self._last_check = 0.0
+        self._cancelled = False
+
+    # Report progress (0 to 1) and what's happening, written at most every UPDATE_INTERVAL
+    def progress(self, fraction, message=None):
+        now = time.monotonic()
+        if now - self._last_update < UPDATE_INTERVAL and fraction < 1:
+            return
+        self._last_update = now
+        fields = {"progress": max(0.0, min(1.0, fraction))}
+        if message is not None:
+            fields["message"] = message
+        self.table.update(self.id, **fields)
+
+    def cancelled(self):
+        if self.cancel_event is not None:
+            return self.cancel_event.is_set()
+        now = time.monotonic()
+        if not self._cancelled and now - self._last_check >= UPDATE_INTERVAL:
+            self._last_check = now
+            self._cancelled = self.table.cancel_requested(self.id)
+        return self._cancelled
+
+    # Stop here if the job was cancelled
+    def check(self):
+        if self.cancelled():
+            raise JobCancelled()
+
+    # File wrapper that reports how much of `total` bytes was read and stops reads after a cancel
+    def reader(self, file, total, message="Reading"):
+        return ProgressReader(self, file, total, message)
+
+
+class ProgressReader:
+    def __init__(self, job, file, total, message):
+        self.job = job
+        self.file = file
+        self.total = max(total, 1)
+        self.message = message
+        self.position = 0
+
+    def read(self, size=-1):
+        self.job.check()
+        data = self.file.read(size)
+        self.position += len(data)
+        self.job.progress(self.position / self.total,
+                          f"{self.message} ({self.position / 1024 ** 2:.1f} of {self.total / 1024 ** 2:.1f} MB)")
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def readable(self):
+        return True
+
+    # Anything else (name, seek, tell...) goes to the wrapped file
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __iter__(self):
+        return iter(self.readline, b"")
+
+
+# Runs in the worker thread or process: mark the job running, then call the function
+def _run(table, job_id, function, args, kwargs, cancel_event=None):
+    # Process workers open their own connection from the path
+    if isinstance(table, str):
+        table = JobTable(table)
+    job = Job(table, job_id, cancel_event)
+    job.check()
+    table.update(job_id, status="running", started=time.time())
+    return function(job, *args, **kwargs)
+
+
+# ---- The queue ----
+
+class JobQueue:
+    """
+    Runs jobs on a thread pool, or on a process pool for CPU-heavy work in pure
+    Python (submit with process=True; the function and arguments must be
+    picklable). Processes are started the first time one is needed.
+    """
+
+    def __init__(self, path, threads=4, processes=1):
+        self.path = path
+        self.table = JobTable(path)
+        self.table.clean_up()
+        self.threads = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="job")
+        self.process_count = processes
+        self.processes = None
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.cancel_events = {}
+        # job id -> result, newest last
+        self.results = OrderedDict()
+        # cache key -> job id of the last job submitted with it
+        self.by_key = {}
+        self._ids = itertools.count()
+
+    # Start a job, returns its id (or the id of a job with the same cache_key that is still usable)
+    def submit(self, kind, function, *args, cache_key=None, process=False, **kwargs):
+        with self.lock:
+            if cache_key is not None and cache_key in self.by_key:
+                job_id = self.by_key[cache_key]
+                if job_id in self.futures or job_id in self.results:
+                    if job_id in self.results:
+                        self.results.move_to_end(job_id)
+                    return job_id
+
+            job_id = f"{uuid.uuid4().hex[:12]}-{next(self._ids)}"
+            self.table.insert(job_id, kind, None if cache_key is None else str(cache_key))
+            if process:
+                if self.processes is None:
+                    # spawn, because forking a server with running threads isn't safe
+                    self.processes = ProcessPoolExecutor(max_workers=self.process_count,
+                                                         mp_context=get_context("spawn"))
+                future = self.processes.submit(_run, self.path, job_id, function, args, kwargs)
+            else:
+                event = self.cancel_events[job_id] = threading.Event()
+                future = self.threads.submit(_run, self.table, job_id, function, args, kwargs, event)
+            self.futures[job_id] = future
+            if cache_key is not None:
+                self.by_key[cache_key] = job_id
+        future.add_done_callback(lambda future: self._finished(job_id, future))
+        return job_id
+
+    # The job's row as a dict (status, progress, message, error, times), None if unknown
+    def status(self, job_id):
+        return self.table.get(job_id)
+
+    # Recent jobs, newest first
+    def recent(self, limit=20):
+        return self.table.recent(limit)
+
+    # Ask a job to stop (a queued job never starts, a running one stops at its next check)
+    def cancel(self, job_id):
+        self.table.update(job_id, cancel_requested=1)
+        with self.lock:
+            event = self.cancel_events.get(job_id)
+            future = self.futures.get(job_id)
+        if event is not None:
+            event.set()
+        if future is not None:
+            future.cancel()
+
+    # Wait for a job to finish, returns its status
+    def wait(self, job_id, timeout=None):
+        with self.lock:
+            future = self.futures.get(job_id)
+        if future is not None:
+            try:
+                future.exception(timeout)
+            except Exception:
+                pass
+            # The callback that records the result runs right after the future is done
+            deadline = time.monotonic() + 1
+            while job_id in self.futures and time.monotonic() < deadline:
+                time.sleep(0.001)
+        return self.status(job_id)
+
+    # The job's result, raises JobFailed if it failed, was cancelled or its result was dropped
+    def result(self, job_id):
+        with self.lock:
+            if job_id in self.results:
+                self.results.move_to_end(job_id)
+                return self.results[job_id]
+        job = self.status(job_id)
+        if job is None:
+            raise JobFailed("Unknown job.")
+        if job["status"] == "failed":
+            raise JobFailed(job["error"])
+        if job["status"] in ("cancelled", "interrupted"):
+            raise JobFailed(f"The job was {job['status']}.")
+        raise JobFailed("The result is no longer available.")
+
+    def close(self):
+        self.threads.shutdown(wait=False, cancel_futures=True)
+        if self.processes is not None:
+            self.processes.shutdown(wait=False, cancel_futures=True)
+
+    # Record how a job ended (runs in the worker thread, or a pool thread for processes)
+    def _finished(self, job_id, future):
+        fields = {"finished": time.time()}
+        if future.cancelled():
+            fields["status"] = "cancelled"
+        elif isinstance(future.exception(), JobCancelled):
+            fields["status"] = "cancelled"
+        elif future.exception() is not None:
+            error = future.exception()
+            fields.update(status="failed", error=str(error) or type(error).__name__)
+        else:
+            fields.update(status="done", progress=1.0)
+            with self.lock:
+                self.results[job_id] = future.result()
+                while len(self.results) > MAX_RESULTS:
+                    self.results.popitem(last=False)
+        self.table.update(job_id, **fields)
+        with self.lock:
+            self.futures.pop(job_id, None)
+            self.cancel_events.pop(job_id, None)
+
+
+# ---- Streamlit ----
+
+# Show a job's progress until it finishes, with a cancel button
+#
+# Returns the job's status once it finished. While it runs this returns
+# None and the progress bar updates itself every POLL_SECONDS (only that
+# part of the page reruns); the whole page reruns when the job is done.
+def show_progress(jobs, job_id, label):
+    import streamlit as st
+
+    job = jobs.status(job_id)
+    if job is None or job["status"] in FINISHED:
+        return job
+
+    @st.fragment(run_every=POLL_SECONDS)
+    def progress():
+        job = jobs.status(job_id)
+        if job["status"] in FINISHED:
+            st.rerun()
+        text = f"{label}: {job['message']}" if job["message"] else f"{label}..."
+        st.progress(job["progress"], text=text if job["status"] == "running" else f"{label}: waiting to start")
+        if st.button("Cancel", key=f"cancel_{job_id}"):
+            jobs.cancel(job_id)
+
+    progress()
+    return None
@@ -0,0 +1,346 @@
+# Rerun profiler for the Streamlit apps
+#
+# Streamlit runs the whole script again on every click, so the question is
+# which part of a rerun takes the time. Apps mark their slow parts:
+#
+#   profile = rerun_profiler.start("Library Manager")    (first thing in the script)
+#   with profile.stage("load library"):
+#       ...
+#   profile.count("books shown", len(books))
+#   profile.panel()                                      (last thing in the script)
+#
+# Functions deeper down can get the same object with rerun_profiler.current().
+#
+# Nothing is measured unless APP_PROFILE=1 is set: start() then returns OFF,
+# whose methods do nothing. With it set, the sidebar shows the stages,
+# counters and memory changes of this session's last reruns, and
+# APP_PROFILE_PORT=<port> serves totals for every session in the Prometheus
+# text format at http://<host>:<port>/metrics.
+
+import contextlib
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# psutil is optional, it's only needed for memory numbers where /proc doesn't exist
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+ENABLED = os.environ.get("APP_PROFILE", "").lower() not in ("", "0", "false", "no")
+
+# Reruns kept per session for the panel
+RERUNS_KEPT = int(os.environ.get("APP_PROFILE_RERUNS", "20"))
+
+# Port of the /metrics page (off when not set)
+METRICS_PORT = os.environ.get("APP_PROFILE_PORT")
+
+# Histogram buckets in seconds for the exported timings
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+# Name the time outside of any stage is shown under (mostly building widgets)
+UNSTAGED = "(rest of the script)"
+
+
+# Resident memory of this process in bytes, None if we can't tell
+def rss():
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        return None
+
+
+# Difference of two memory readings (None if either is missing)
+def memory_delta(before, after):
+    if before is None or after is None:
+        return None
+    return after - before
+
+
+# ---- Off ----
+
+# What start() returns when profiling is off: every method does nothing
+class _Off:
+    _no_stage = contextlib.nullcontext()
+
+    def stage(self, name):
+        return self._no_stage
+
+    def count(self, name, amount=1):
+        pass
+
+    def panel(self):
+        pass
+
+
+OFF = _Off()
+
+
+# ---- Totals for every session (what /metrics serves) ----
+
+# Counts, sums and buckets of one histogram
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reruns = {}          # app -> Histogram
+        self.stopped_early = {}   # app -> reruns that ended with st.stop() or st.rerun()
+        self.stages = {}          # (app, stage) -> Histogram
+        self.counters = {}        # (app, name) -> total
+
+    # Add a finished rerun
+    def add(self, rerun):
+        with self.lock:
+            self.reruns.setdefault(rerun.app, Histogram()).observe(rerun.seconds)
+            if rerun.stopped_early:
+                self.stopped_early[rerun.app] = self.stopped_early.get(rerun.app, 0) + 1
+            for name, (seconds, _, _) in rerun.stages.items():
+                self.stages.setdefault((rerun.app, name), Histogram()).observe(seconds)
+            for name, amount in rerun.counters.items():
+                self.counters[(rerun.app, name)] = self.counters.get((rerun.app, name), 0) + amount
+
+    # Everything in the Prometheus text format
+    def prometheus_text(self):
+        lines = []
+        with self.lock:
+            lines += histogram_lines("streamlit_rerun_seconds", "Time of a whole script rerun",
+                                     {(("app", app),): histogram for app, histogram in self.reruns.items()})
+            lines += ["# HELP streamlit_reruns_stopped_early_total Reruns ended by st.stop() or st.rerun()",
+                      "# TYPE streamlit_reruns_stopped_early_total counter"]
+            lines += [f"streamlit_reruns_stopped_early_total{labels((('app', app),))} {count}"
+                      for app, count in self.stopped_early.items()]
+            lines += histogram_lines("streamlit_stage_seconds", "Time of one stage of a rerun",
+                                     {(("app", app), ("stage", stage)): histogram
+                                      for (app, stage), histogram in self.stages.items()})
+            lines += ["# HELP streamlit_events_total Things the apps counted during reruns",
+                      "# TYPE streamlit_events_total counter"]
+            lines += [f"streamlit_events_total{labels((('app', app), ('name', name)))} {total}"
+                      for (app, name), total in self.counters.items()]
+        memory = rss()
+        if memory is not None:
+            lines += ["# HELP process_resident_memory_bytes Resident memory size in bytes",
+                      "# TYPE process_resident_memory_bytes gauge",
+                      f"process_resident_memory_bytes {memory}"]
+        return "\n".join(lines) + "\n"
+
+
+# Label set in the Prometheus format, with quotes, backslashes and newlines escaped
+def labels(pairs):
+    escaped = (f'{key}="' + str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for key, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+# Lines of one histogram metric, series is {label pairs: Histogram}
+def histogram_lines(name, help_text, series):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for pairs, histogram in series.items():
+        # observe() already counts a value in every bucket it fits in, so these are cumulative
+        for bound, count in zip(BUCKETS, histogram.buckets):
+            lines.append(f"{name}_bucket{labels(pairs + (('le', bound),))} {count}")
+        lines.append(f"{name}_bucket{labels(pairs + (('le', '+Inf'),))} {histogram.count}")
+        lines.append(f"{name}_sum{labels(pairs)} {histogram.total}")
+        lines.append(f"{name}_count{labels(pairs)} {histogram.count}")
+    return lines
+
+
+metrics = Metrics()
+
+
+# ---- /metrics page ----
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Scrapes every few seconds would fill the terminal
+    def log_message(self, format, *args):
+        pass
+
+
+_server_lock = threading.Lock()
+_server = None
+_server_error = None
+
+
+# Start the /metrics server once per process (if a port was given)
+def serve_metrics():
+    global _server, _server_error
+    if not METRICS_PORT or _server is not None or _server_error is not None:
+        return
+    with _server_lock:
+        if _server is not None or _server_error is not None:
+            return
+        try:
+            _server = ThreadingHTTPServer(("", int(METRICS_PORT)), _MetricsHandler)
+        except (OSError, ValueError) as e:
+            _server_error = f"Could not serve metrics on port {METRICS_PORT}: {e}"
+            return
+        threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+
+
+# ---- One rerun ----
+
+class Rerun:
+    def __init__(self, app, number):
+        self.app = app
+        self.number = number
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.start_memory = rss()
+        # stage name -> [seconds, calls, memory delta], nested stages are named "outer / inner"
+        self.stages = {}
+        self.counters = {}
+        self._open = []
+        # When the last stage ended, a rerun cut short by st.stop() is taken to have ended there
+        self.last_activity = self.start
+        self.seconds = None
+        self.memory_delta = None
+        self.stopped_early = False
+
+    # Time a block of the script (can be nested and repeated, repeats add up)
+    @contextlib.contextmanager
+    def stage(self, name):
+        self._open.append(name)
+        key = " / ".join(self._open)
+        memory = rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.last_activity = time.perf_counter()
+            seconds = self.last_activity - start
+            self._open.pop()
+            totals = self.stages.setdefault(key, [0.0, 0, None])
+            totals[0] += seconds
+            totals[1] += 1
+            delta = memory_delta(memory, rss())
+            if delta is not None:
+                totals[2] = (totals[2] or 0) + delta
+
+    # Count something (rows read, books shown, files saved...)
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    # End the rerun and add it to the totals (only the first call counts)
+    def finish(self, stopped_early=False):
+        if self.seconds is not None:
+            return
+        if stopped_early:
+            self.seconds = self.last_activity - self.start
+        else:
+            self.seconds = time.perf_counter() - self.start
+            self.memory_delta = memory_delta(self.start_memory, rss())
+        self.stopped_early = stopped_early
+        metrics.add(self)
+
+    # Time not spent in any top level stage
+    def unstaged_seconds(self):
+        return max(0.0, self.seconds - sum(seconds for name, (seconds, _, _) in self.stages.items()
+                                           if " / " not in name))
+
+    # Finish the rerun and draw the debug panel in the sidebar
+    def panel(self):
+        import streamlit as st
+
+        self.finish()
+        history = [rerun for rerun in st.session_state[_SESSION_KEY] if rerun.seconds is not None]
+
+        with st.sidebar.expander("⏱️ Rerun profile"):
+            if _server_error:
+                st.warning(_server_error)
+            elif _server is not None:
+                st.caption(f"Prometheus metrics on port {METRICS_PORT} at /metrics")
+
+            st.write(f"**This rerun:** {self.seconds * 1000:.1f} ms"
+                     + (f", memory {megabytes(self.memory_delta)}" if self.memory_delta is not None else ""))
+            rows = [{"stage": name, "calls": calls, "ms": round(seconds * 1000, 1),
+                     "share": f"{seconds / max(self.seconds, 1e-9):.0%}", "memory": megabytes(delta)}
+                    for name, (seconds, calls, delta) in self.stages.items()]
+            rows.append({"stage": UNSTAGED, "calls": 1, "ms": round(self.unstaged_seconds() * 1000, 1),
+                         "share": f"{self.unstaged_seconds() / max(self.seconds, 1e-9):.0%}", "memory": ""})
+            st.dataframe(rows, hide_index=True)
+            if self.counters:
+                st.write("**Counters:** " + ", ".join(f"{name} {amount:,}" for name, amount in self.counters.items()))
+
+            st.write(f"**Last {len(history)} reruns**")
+            st.dataframe([{
+                "rerun": rerun.number,
+                "at": time.strftime("%H:%M:%S", time.localtime(rerun.started_at)),
+                "ms": round(rerun.seconds * 1000, 1),
+                "slowest stage": max(rerun.stages, key=lambda name: rerun.stages[name][0], default=""),
+                "memory": megabytes(rerun.memory_delta),
+                "ended early": rerun.stopped_early,
+            } for rerun in reversed(history)], hide_index=True)
+
+            st.download_button("Download metrics (Prometheus text)", metrics.prometheus_text(),
+                               file_name="metrics.txt", mime="text/plain")
+
+
+# Memory change as text ("+1.2 MB")
+def megabytes(delta):
+    if delta is None:
+        return ""
+    return f"{delta / 1024 ** 2:+.1f} MB"
+
+
+_SESSION_KEY = "_rerun_profiler_history"
+
+
+# The Rerun start() returned for this session, for functions that weren't handed it
+def current():
+    if not ENABLED:
+        return OFF
+    import streamlit as st
+
+    history = st.session_state.get(_SESSION_KEY)
+    return history[-1] if history and history[-1].seconds is None else OFF
+
+
+# Start profiling this rerun, returns the Rerun (or OFF when profiling is off)
+def start(app):
+    if not ENABLED:
+        return OFF
+    import streamlit as st
+
+    history = st.session_state.get(_SESSION_KEY)
+    if history is None or history.maxlen != RERUNS_KEPT:
+        history = st.session_state[_SESSION_KEY] = deque(history or (), maxlen=RERUNS_KEPT)
+
+    # A rerun that never reached panel() was ended by st.stop(), st.rerun() or an error
+    if history and history[-1].seconds is None:
+        history[-1].finish(stopped_early=True)
+
+    serve_metrics()
+    rerun = Rerun(app, history[-1].number + 1 if history else 1)
+    history.append(rerun)
+    return rerun